@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under
+## the terms of version 3 of the GNU Lesser General Public License as
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The andbug.cache module keeps class metadata across sessions, so that a warm
+start does not fetch the line and variable tables of every method it
+touches again.
+
+Type and method ids differ from one process to the next, so nothing is
+stored by id: entries are keyed by class signature, and method entries by
+method name and signature, in a shelve file per build fingerprint (the
+device build, the package, and the size and modification time of its
+apks).  A session still lists the methods of a class over the wire, which
+yields the ids to map the entries onto; a digest of that list is kept with
+each class, and a class whose methods no longer match has its entries
+dropped and refetched.
+
+The dbm file behind a shelve may lose writes, or be left corrupt, if it is
+not closed; every cache opened is closed when andbug exits (see close_all),
+and synced after each batch of tables imported.
+'''
+
+import os, os.path, shelve, hashlib, atexit
+from threading import Lock
+
+import andbug.util, andbug.config
+from andbug import log
+
+LINES = 'l'   # (firstLoc, lastLoc, ((loc, line), ...))
+SLOTS = 'v'   # (argCount, ((codeIndex, name, jni, gen, codeLen, index), ...))
+
+def method_key(name, jni):
+    return name + jni
+
+def digest(sigs):
+    'returns the digest of a class given the method keys of its methods'
+    return hashlib.sha1('\n'.join(sorted(sigs))).hexdigest()
+
+def fingerprint(pid, dev=None, salt=''):
+    '''
+    identifies the code a process runs: the build fingerprint of the device,
+    the package name of the process, and the path, size and modification
+    time of each of its apks, so that reinstalling changed code, even under
+    the same version on the same day, opens another cache.  salt adds what
+    is known of the code otherwise, e.g. the signatures of --apk dex files.
+    '''
+    pre = ('-s', dev) if dev else ()
+    def shell(cmd):
+        return andbug.util.adb(*(pre + ('shell', cmd)))
+
+    build, cmdline = (shell(
+        'getprop ro.build.fingerprint; cat /proc/%s/cmdline' % pid
+    ) + '\n').split('\n', 1)
+    name = cmdline.split('\0')[0].split(':')[0].strip()
+    apks = shell(
+        'for p in $(pm path %s); do stat -c "%%n %%s %%Y" ${p#package:}; done' % name
+    )
+    apks = ';'.join(line.strip() for line in apks.splitlines() if line.strip())
+    return '%s|%s|%s|%s' % (build.strip(), name, apks, salt)
+
+class MetaCache(object):
+    '''
+    a shelve of class metadata for one build fingerprint; see the module
+    documentation.  classes are verified against the method lists a session
+    loads before any of their entries are used.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.db = shelve.open(path, protocol=2)
+        self.closed = False
+        self.lock = Lock()
+        OPEN.append(self)
+        self.classes = {} # tid -> class signature, for verified classes
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        'closes the shelve; the cache is empty from then on'
+        with self.lock:
+            if not self.closed:
+                self.db.close()
+                self.db = {}
+                self.closed = True
+        if self in OPEN:
+            OPEN.remove(self)
+
+    def sync(self):
+        'writes what the shelve holds in memory out to its file'
+        with self.lock:
+            if not self.closed:
+                self.db.sync()
+
+    def attach(self, refType):
+        '''
+        called once the methods of refType are loaded; drops the entries of
+        the class if its method list changed, then records the new list.
+        '''
+        jni = refType.jni
+        sigs = list(method_key(m.name, m.jni) for m in refType.methodList)
+        key = str(jni)
+        with self.lock:
+            rec = self.db.get(key)
+            if rec is None or rec['digest'] != digest(sigs):
+                if rec is not None:
+                    log.debug("study", "cache: %s changed, dropping it" % jni)
+                    self.drop(key, rec)
+                self.db[key] = {'digest': digest(sigs), 'methods': sigs}
+            self.classes[refType.tid] = key
+
+    def drop(self, key, rec):
+        'removes a class record and its method entries; must hold the lock'
+        for sig in rec['methods']:
+            for kind in (LINES, SLOTS):
+                try:
+                    del self.db[self.entry(key, kind, sig)]
+                except KeyError:
+                    pass
+        del self.db[key]
+
+    def entry(self, key, kind, sig):
+        return '%s\n%s\n%s' % (key, kind, sig)
+
+    def key(self, method):
+        'the entry key prefix for a method, once its class is verified'
+        key = self.classes.get(method.tid)
+        if key is None:
+            method.klass.methodList # loading it attaches the class
+            key = self.classes.get(method.tid)
+        return key
+
+    def get(self, method, kind):
+        'returns the cached table of kind for method, or None'
+        key = self.key(method)
+        if key is None:
+            return None
+        with self.lock:
+            val = self.db.get(self.entry(key, kind, method_key(method.name, method.jni)))
+            if val is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return val
+
+    def put(self, method, kind, val):
+        key = self.key(method)
+        if key is None:
+            return
+        with self.lock:
+            self.db[self.entry(key, kind, method_key(method.name, method.jni))] = val
+
+    def update(self, jni, sigs, tables):
+        '''
+        stores tables, a dict of (kind, method key) -> table, for the class
+        jni whose method keys are sigs, replacing whatever the cache held
+        for it; used to prepopulate the cache without a session.
+        '''
+        key = str(jni)
+        with self.lock:
+            rec = self.db.get(key)
+            if rec is not None:
+                self.drop(key, rec)
+            self.db[key] = {'digest': digest(sigs), 'methods': list(sigs)}
+            for (kind, sig), val in tables.items():
+                self.db[self.entry(key, kind, sig)] = val
+
+    def stamped(self, tag):
+        'true if stamp(tag) was called on this cache before'
+        with self.lock:
+            return ('\0' + tag) in self.db
+
+    def stamp(self, tag):
+        with self.lock:
+            self.db['\0' + tag] = True
+
+# the caches not closed yet; see close_all
+OPEN = []
+
+def close_all():
+    'closes every cache still open; called at exit'
+    for cache in list(OPEN):
+        cache.close()
+
+atexit.register(close_all)
+
+def cache_path(ident):
+    root = os.path.expanduser(andbug.config.g_Cache_Dir)
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    return os.path.join(root, 'meta-' + hashlib.sha1(ident).hexdigest()[:16])
+
+def open_cache(pid, dev=None, salt=''):
+    '''
+    opens the cache for the code run by a process, or returns None if the
+    cache is disabled or the process cannot be fingerprinted.
+    '''
+    if not andbug.config.g_Cache_Enabled:
+        return None
+    try:
+        return MetaCache(cache_path(fingerprint(pid, dev, salt)))
+    except Exception as exc:
+        log.error("study", "cache: not available, %s" % exc)
+        return None
@@ -38,8 +38,7 @@ def report_hit(t):
     t = t[0] #t是一个Thread类型的变量
     with andbug.screed.section("Breakpoint hit in %s, process suspended." % t):
         #t.sess.suspend() #暂停当前线程
-        count = 10 if len(t.frames) > 10 else len(t.frames)
-        for f in t.frames[0: count]:
+        for f in t.frames[0:10]:
             name = str(f.loc)
             if f.native:  #判断堆栈中函数的类型，是否是内部函数。如dalvik.system.NativeStart.main([Ljava/lang/String;)V <native>
                 name += ' <native>'
@@ -17,7 +17,7 @@
 
 'implementation of the "classes" command'
 
-import andbug.command, andbug.screed
+import andbug.command, andbug.screed, andbug.index
 import types
 
 @andbug.command.action('[<partial class name>]')
@@ -25,24 +25,16 @@ def class_detail(ctxt, class_name=None):
     'lists loaded classes. if no partial class name supplied, list all classes.'
     with andbug.screed.section('Loaded Class-detail'):
         
-        #classesInfor = ctxt.sess.classes() 
-        #print type(classesInfor) classesInfor 的类型是<class 'andbug.data.view'>
-        for c in ctxt.sess.classes(): #ctxt.sess.classes()函数来获取类的信息
-            #print type(c) 返回的类型是<class 'andbug.vm.Class'>            
-            n = c.jni  #获取类中的jni成员变量
-            if n.startswith('L') and n.endswith(';'):
-                n = n[1:-1].replace('/', '.')
-            else:
-                continue
+        if class_name is None:
+            return
+        for c in ctxt.sess.classes(andbug.index.name_to_jni(class_name)):
+            andbug.screed.item(str(c))
 
-            if n==class_name:
-                andbug.screed.item(n)                
-                
-                show_method_infor(c)                
-                
-                show_static_infor(c)
-                
-                show_field_infor(c)
+            show_method_infor(c)
+
+            show_static_infor(c)
+
+            show_field_infor(c)
 
 def show_method_infor(class_infor):
     '''
@@ -17,32 +17,62 @@
 
 'implementation of the "class-trace" command'
 
-import andbug.command, andbug.screed, andbug.options
+import andbug.command, andbug.screed, andbug.options, andbug.counting, andbug.vm
 from Queue import Queue
 import re
+from andbug.data import loaded
 
 def report_hit(t):
     t = t[0]
     try:
         with andbug.screed.section("trace %s" % t):
-            for f in t.frames:
+            for f, values in t.snapshot():
                 name = str(f.loc)
                 if f.native:
                     name += ' <native>'
                 with andbug.screed.item(name):
-                    for k, v in f.values.items():
+                    for k, v in values.items():
                         andbug.screed.item( "%s=%s" %(k, v))
     finally:
         t.resume()
 
-@andbug.command.action('<class-path>', aliases=('ct', 'ctrace'))
-def class_trace(ctxt, cpath):
+def count_entries(ctxt, cpath):
+    'counts the entries of each method of the classes, rather than of each class'
+    sess = ctxt.sess
+    counter = andbug.counting.HitCounter()
+    methods = list(
+        m for c in sess.classes(cpath) for m in c.methods()
+        if not m.abstract and not m.native
+    )
+    # the line tables of the methods, in one pipelined batch
+    sess.pipeline((
+        (0x0601, m.methodRequest(), m.unpackLineTable) for m in methods
+        if not loaded(m, 'firstLoc') and not m.loadCachedLines()
+    ), errors=True)
+    requests = list((m.firstLoc, 40) for m in methods if loaded(m, 'firstLoc'))
+    for (l, kind), rid in zip(requests, sess.countMany(requests, counter)):
+        if isinstance(rid, andbug.vm.RequestError):
+            andbug.screed.item('Could not count %s: %s' % (l, rid))
+    andbug.screed.item('Counting %d methods' % len(counter.origins))
+    return counter
+
+@andbug.command.action(
+    '<class-path, glob or /regex/>', aliases=('ct', 'ctrace'),
+    opts=(('count', 'only counts calls per method, thread and minute, reporting every <count> seconds'),)
+)
+def class_trace(ctxt, cpath, count=None):
     'reports calls to dalvik methods associated with a class'
     cpath = andbug.options.parse_cpath(cpath)
 
     with andbug.screed.section('Setting Hooks'):
-        for c in ctxt.sess.classes(cpath):
-            c.hookEntries(func = report_hit)
-            andbug.screed.item('Hooked %s' % c)
+        if count is not None:
+            counter = count_entries(ctxt, cpath)
+            andbug.counting.start(
+                ctxt.sess, counter, andbug.counting.show(ctxt.sess, counter), float(count)
+            )
+        else:
+            for c in ctxt.sess.classes(cpath):
+                c.hookEntries(func = report_hit)
+                andbug.screed.item('Hooked %s' % c)
     
-    ctxt.block_exit()
+    andbug.counting.block_exit(ctxt)
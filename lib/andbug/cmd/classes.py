@@ -20,25 +20,13 @@
 import andbug.command, andbug.screed
 import types
 
-@andbug.command.action('[<partial class name>]')
+@andbug.command.action('[<partial class name, glob or /regex/>]')
 def classes(ctxt, expr=None):
     'lists loaded classes. if no partial class name supplied, list all classes.展示一个类的详情'
     with andbug.screed.section('Loaded Classes'):
-        
-        #classesInfor = ctxt.sess.classes() 
-        #print type(classesInfor) classesInfor 的类型是<class 'andbug.data.view'>
-        for c in ctxt.sess.classes(): #ctxt.sess.classes()函数来获取类的信息
-            #print type(c) 返回的类型是<class 'andbug.vm.Class'>            
-            n = c.jni  #获取类中的jni成员变量
-            if n.startswith('L') and n.endswith(';'):
-                n = n[1:-1].replace('/', '.')
-            else:
+        # names were converted once, when the class index was built
+        jnis = ctxt.sess.classTable.jnis
+        for n, row in ctxt.sess.classIndex.search(expr):
+            if not jnis[row].startswith('L'):
                 continue
-
-            if expr is not None:
-                #通过正则判断要输出的类信息
-                if n.find(expr) >= 0:
-                    andbug.screed.item(n)
-            else:
-                andbug.screed.item(n)
-            
+            andbug.screed.item(n)
@@ -17,10 +17,12 @@
 
 'implementation of the "stop" command'
 
-import andbug.command
+import andbug.command, andbug.cache
 import os
 
 @andbug.command.action('', shell=True)
 def exit(name=None):
     'terminates andbug with prejudice'
+    # os._exit skips the atexit handlers
+    andbug.cache.close_all()
     os._exit(0)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'implementation of the "flow-stats" command'
+
+import andbug.command, andbug.screed
+
+@andbug.command.action('', shell=True)
+def flow_stats(ctxt):
+    'reports the in-flight windows, queueing delay and latency of JDWP requests'
+    stats = ctxt.sess.conn.stats()
+    for name in ('interactive', 'capture', 'prefetch'):
+        flow = stats[name]
+        with andbug.screed.section('%s requests' % name.capitalize()):
+            window = flow['window']
+            andbug.screed.item('window: %s, in flight: %d, waiting: %d' % (
+                'unbounded' if window is None else window, flow['inflight'], flow['waiting']
+            ))
+            andbug.screed.item('sent: %d, answered: %d' % (flow['sent'], flow['answered']))
+            andbug.screed.item('queueing delay: %.1fms average, %.1fms max' % (
+                flow['queued'] * 1000, flow['maxQueued'] * 1000
+            ))
+            andbug.screed.item('latency: %.1fms average, %.1fms max' % (
+                flow['latency'] * 1000, flow['maxLatency'] * 1000
+            ))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'implementation of the "latency" command'
+
+import andbug.command, andbug.screed, andbug.options, andbug.stats, andbug.vm
+
+# the durations timed so far in this session; set by latency
+LATENCY = None
+
+def ms(value):
+    return '%.3f' % (value * 1000)
+
+def watch(sess, cpath, mname, mjni):
+    'sets entry and exit requests on the classes of the methods to time; returns their count'
+    requests = []
+    count = 0
+    for c in sess.classes(cpath):
+        methods = list(m for m in c.methods(mname, mjni) if not m.abstract)
+        if not methods:
+            continue
+        LATENCY.watch(methods)
+        count += len(methods)
+        andbug.screed.item('Timing %d methods of %s' % (len(methods), c))
+        if c.tid not in LATENCY.classes:
+            LATENCY.classes.add(c.tid)
+            requests.extend(((c, 40), (c, 41)))
+    for (c, kind), rid in zip(requests, sess.countMany(requests, LATENCY)):
+        if isinstance(rid, andbug.vm.RequestError):
+            LATENCY.classes.discard(c.tid)
+            andbug.screed.item('Could not hook %s: %s' % (c, rid))
+    return count
+
+@andbug.command.action('[<class-path> [<method>]]', shell=True)
+def latency(ctxt, cpath=None, mspec=None):
+    'times calls to the methods of a class without suspending them, or reports the durations'
+    global LATENCY
+    if LATENCY is None:
+        LATENCY = andbug.stats.Latency()
+
+    if cpath is not None:
+        cpath, mname, mjni = andbug.options.parse_mquery(cpath, mspec)
+        with andbug.screed.section('Setting Hooks'):
+            if not watch(ctxt.sess, cpath, mname, mjni):
+                andbug.screed.item('Could not find %s' % cpath)
+        return
+
+    with andbug.screed.section('Latency (ms): count, p50, p95, p99, max'):
+        for method, count, p50, p95, p99, top in LATENCY.rows():
+            andbug.screed.item('%s: %d, %s, %s, %s, %s' % (
+                method, count, ms(p50), ms(p95), ms(p99), ms(top)
+            ))
+        if LATENCY.unmatched:
+            andbug.screed.item('%d entries or exits could not be paired' % LATENCY.unmatched)
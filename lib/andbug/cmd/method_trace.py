@@ -17,7 +17,7 @@
 
 'implementation of the "mtrace" command'
 
-import andbug.command, andbug.screed, andbug.options
+import andbug.command, andbug.screed, andbug.options, andbug.counting, andbug.vm
 from Queue import Queue
 
 def report_hit(t):
@@ -34,20 +34,31 @@ def report_hit(t):
     finally:
         t.resume()
 
-def cmd_hook_methods(ctxt, cpath, mpath):
+def cmd_hook_methods(ctxt, cpath, mpath, counter=None):
+    requests = []
     for c in ctxt.sess.classes(cpath):
         for m in c.methods(mpath):
             l = m.firstLoc
             if l.native:
                 andbug.screed.item('Could not hook native %s' % l)
                 continue
+            if counter is not None:
+                requests.append((l, 40))
+                continue
             l.hook(func = report_hit)
             andbug.screed.item('Hooked %s' % l)
+    if counter is not None:
+        for (l, kind), rid in zip(requests, ctxt.sess.countMany(requests, counter)):
+            if isinstance(rid, andbug.vm.RequestError):
+                andbug.screed.item('Could not count %s: %s' % (l, rid))
+            else:
+                andbug.screed.item('Counting %s' % l)
 
 @andbug.command.action(
-    '<method>', name='method-trace', aliases=('mt','mtrace'), shell=True
+    '<method>', name='method-trace', aliases=('mt','mtrace'), shell=True,
+    opts=(('count', 'only counts calls per thread and minute, reporting every <count> seconds'),)
 )
-def method_trace(ctxt, mpath):
+def method_trace(ctxt, mpath, count=None):
     'reports calls to specific dalvik method'
 	
     cpath, mname, mjni = andbug.options.parse_mquery(".".join(mpath.split('.')[0:-1]),  mpath.split('.')[-1])
@@ -55,7 +66,16 @@ def method_trace(ctxt, mpath):
     print "mname=" + mname
     print "mjni=" + mjni
 
+    counter = None
+    if count is not None:
+        counter = andbug.counting.HitCounter()
+
     with andbug.screed.section('Setting Hooks'):
-		cmd_hook_methods(ctxt, cpath, mname)
+		cmd_hook_methods(ctxt, cpath, mname, counter)
+
+    if counter is not None:
+        andbug.counting.start(
+            ctxt.sess, counter, andbug.counting.show(ctxt.sess, counter), float(count)
+        )
 
-    ctxt.block_exit()
+    andbug.counting.block_exit(ctxt)
@@ -21,14 +21,16 @@
 文件功能：该模块用于对android应用实现函数粒度的监控功能
 '''
 
-import logging
 import shlex
-import json
+from time import time
+from collections import OrderedDict
 
 
-import andbug.command, andbug.screed, andbug.options, andbug.vm
+import andbug.command, andbug.screed, andbug.options, andbug.vm, andbug.graph
+import andbug.sink, andbug.counting
 import andbug.config
 from andbug import log
+from andbug.data import loaded
 
 
 
@@ -44,104 +46,146 @@ logging.basicConfig(level=logging.DEBUG,
 
 
 
+# where report_hit writes its records; set by monitor
+SINK = None
+
 def report_hit(t):
     t = t[0]
+    # one pipelined capture of the top frame, then one object graph for all
+    # of its arguments, so their fields are fetched in shared batches,
+    # bounded and cycle safe; see andbug.graph.  that, naming the thread,
+    # and formatting the values, which may ask the VM for the contents of
+    # strings and arrays, is all that needs it suspended: the record is
+    # serialized from the graph, and written, by the sink thread.
     try:
-        with andbug.screed.section("trace-monitor %s" % t):
-            #获取函数信息
-            funInfor={}            
-            f = t.frames[0]
-            name = str(f.loc)
-            funInfor["thread"] = str(t)
-            funInfor["name"] = name
-            funInfor["is_native"] = f.native
-            
-            with andbug.screed.item(name):
-                #获取函数的参数信息
-                args={}
-                for k, v in f.values.items():
-                    andbug.screed.item( "%s=%s" %(k, v))
-                    valueType = str(type(v))
-                    index = valueType.find("class")
-                    if index==-1:
-                        #主类型变量，int long等                       
-                        args[k]=v
-                    else:
-                        #对象类型变量
-                        pass              
-                        args[k]=v.genJson()
-                     
-                   
-         
-                    
-            funInfor["args"]= args    
-        
-            monitor_infor = json.dumps(funInfor)    
-            logging.debug(monitor_infor)
-            #log.debug("stdu", monitor_infor)
+        stamp = time()
+        snap = t.snapshot(1)
+        f, values = iter(snap).next()
+        graph = andbug.graph.Graph(t.sess).expand(values.values())
+        name = str(f.loc)
+        native = f.native
+        thread = str(t)
+        shown = list("%s=%s" % (k, v) for k, v in values.items())
     finally:
         t.resume()
 
-#cmd_hook_methods(ctxt, monitorType, cpath, mname)   
-def cmd_hook_methods(ctxt, monitorType, cpath, mpath):
+    with andbug.screed.section("trace-monitor %s" % thread):
+        with andbug.screed.item(name):
+            for line in shown:
+                andbug.screed.item(line)
 
-    classesInfor = ctxt.sess.classes(cpath)
-    if len(classesInfor)==0:
-        return False
-
-    for c in classesInfor:
-        print "classInfor:" + str(c)
-        for m in c.methods(mpath):
-            print "method:" + str(m)
-            
-            loc = m.firstLoc
-            if loc==None:
-                print "firstLoc is None"
-                continue
-            
-            andbug.screed.item('Hooked [%s] %s'%(monitorType, loc))
-            if loc.native:
-                andbug.screed.item('Could not hook native %s' % loc)
-                continue
-            
-            
-            if monitorType=="in":
-                loc.hook(func = report_hit)
-            
-            elif monitorType == "out":
-                print "hook out"
-                loc.hookOut(func = report_hit)
+    #获取函数信息
+    def record():
+        funInfor={}
+        funInfor["time"] = stamp
+        funInfor["thread"] = thread
+        funInfor["name"] = name
+        funInfor["is_native"] = native
+        #获取函数的参数信息
+        args={}
+        for k, v in values.items():
+            if isinstance(v, andbug.vm.Object):
+                #对象类型变量
+                args[k]=graph.write(andbug.graph.TreeWriter(), v).root
             else:
-                loc.hook(func = report_hit)
-                loc.hookOut(func = report_hit)
-            
-    return True
-           
-def HookGoGoGo(ctxt, hookFailedInfor):
+                #主类型变量，int long等
+                args[k]=v
+        funInfor["args"]= args
+        return funInfor
+
+    if SINK is not None:
+        SINK.put(record)
+
+# event kinds hooked for each monitor type; 40 METHOD_ENTRY, 41 METHOD_EXIT
+HOOK_KINDS = {'in': (40,), 'out': (41,), 'inout': (40, 41)}
+HOOK_RETRIES = 5
+
+def compile_plan(lines):
     '''
-    函数：将hook失败的函数继续进行hook
-    参数：hookFailedInfor 记录hook失败的函数列表
-    返回值：
+    函数功能：把监控配置编译成按类分组的安装计划
+    compiles monitor config lines into an installation plan, an ordered dict
+    of class path -> [(monitorType, mname, mjni), ...], so that each class
+    is looked up and loaded once however many lines name it.
     '''
-    if hookFailedInfor==None:
-        return False, None
-    
-    newHookFailedInfor=[]
-    
-    
-    for funInfor in hookFailedInfor:
-        monitorType = funInfor["monitorType"]
-        cpath = funInfor["cpath"]
-        mname = funInfor["mname"]
-        flag=cmd_hook_methods(ctxt, monitorType, cpath, mname)  
-        if flag==False:
-             newHookFailedInfor.append(funInfor)
-        
-    if len(newHookFailedInfor)==0:
-        print "hook all function"
-        return True, None
+    plan = OrderedDict()
+    for line in lines:
+        flag, monitorType, cpath, mname, mjni = ParseMonitorConfItem(line)
+        if flag:
+            plan.setdefault(cpath, []).append((monitorType, mname, mjni))
+    return plan
+
+def install_plan(sess, plan, func, counter=None):
+    '''
+    installs the hooks of a plan with one pipelined batch per step: the
+    method tables of its classes, the line tables of its methods, then
+    every EventRequest.Set; returns the hooks set and the part of the plan
+    whose classes are not loaded yet.  with a counter, the requests only
+    count hits, and their ids are returned instead of hooks.
+    '''
+    missing = OrderedDict()
+    found = []
+    for cpath, items in plan.items():
+        classes = list(sess.classes(cpath))
+        if classes:
+            found.append((classes, items))
+        else:
+            missing[cpath] = items
+
+    sess.pipeline((
+        (0x020F, c.typeRequest(), c.unpackMethods)
+        for c in set(c for classes, items in found for c in classes)
+        if not loaded(c, 'methodList')
+    ), errors=True)
+
+    targets = []
+    for classes, items in found:
+        for c in classes:
+            for monitorType, mname, mjni in items:
+                try:
+                    methods = c.methods(mname)
+                except andbug.vm.RequestError as err:
+                    andbug.screed.item('Could not load the methods of %s: %s' % (c, err))
+                    break
+                for m in methods:
+                    if not m.abstract:
+                        targets.append((monitorType, m))
+
+    sess.pipeline((
+        (0x0601, m.methodRequest(), m.unpackLineTable)
+        for m in set(m for monitorType, m in targets)
+        if not loaded(m, 'firstLoc') and not m.loadCachedLines()
+    ), errors=True)
+
+    requests = []
+    for monitorType, m in targets:
+        if not loaded(m, 'firstLoc'):
+            andbug.screed.item('Could not load the line table of %s' % m)
+            continue
+        if monitorType not in HOOK_KINDS:
+            andbug.screed.item('Unknown monitor type %s for %s' % (monitorType, m))
+            continue
+        loc = m.firstLoc
+        if loc is None:
+            andbug.screed.item('firstLoc of %s is None' % m)
+            continue
+        if loc.native:
+            andbug.screed.item('Could not hook native %s' % loc)
+            continue
+        andbug.screed.item('Hooked [%s] %s' % (monitorType, loc))
+        for kind in HOOK_KINDS[monitorType]:
+            requests.append((loc, kind))
+
+    if counter is not None:
+        results = sess.countMany(requests, counter)
     else:
-        return False, newHookFailedInfor
+        results = sess.hookMany(requests, func)
+    hooks = []
+    for (loc, kind), hook in zip(requests, results):
+        if isinstance(hook, andbug.vm.RequestError):
+            andbug.screed.item('Could not hook %s: %s' % (loc, hook))
+        else:
+            hooks.append(hook)
+    return hooks, missing
 
 def ParseMonitorConfItem(configInforItem):
     '''
@@ -170,66 +214,71 @@ def input():
     '<method>', name='monitor', aliases=('mo'), shell=True
 )
 '''
+def record_counts(sess, counter):
+    'returns an emit for andbug.counting.Reporter that writes counts to SINK'
+    name = andbug.counting.thread_names(sess)
+    def emit(counts):
+        stamp = time()
+        for loc, kind, tid, start, hits in counter.rows(counts):
+            SINK.put({
+                "time": stamp, "name": str(loc),
+                "kind": andbug.counting.KIND_NAMES.get(kind, kind),
+                "thread": name(tid), "minute": start, "hits": hits
+            })
+    return emit
+
 @andbug.command.action(
-    '<method>', name='monitor', aliases=('mo',)
+    '<method>', name='monitor', aliases=('mo',),
+    opts=(('count', 'only counts calls per thread and minute, writing them every <count> seconds'),)
 )
-def monitor(ctxt, monitor_log_file_path="1111", monitor_file_md5="00000", task_file_path=andbug.config.g_Date_File_Path):
+def monitor(ctxt, monitor_log_file_path="1111", monitor_file_md5="00000", task_file_path=andbug.config.g_Date_File_Path, count=None):
     '''
     函数功能：对指定的函数调用情况进行监控
     参数:    monitor_log_file_path  保存监控内容的文件路径
             monitor_file_md5       被监控apk文件的md5值
             task_file_path         监控规则配置文件
+            count                  只统计调用次数，每count秒写一次
             
     '''
 
-    logFilePath = monitor_log_file_path
-    logging.basicConfig(level=logging.DEBUG,
-                format='%(asctime)s %(filename)s[line:%(lineno)d] %(levelname)s %(message)s',
-                #datefmt='%a, %d %b %Y %H:%M:%S',
-                filename=logFilePath,
-                filemode='w')
+    global SINK
+    # hits are written as NDJSON, gzip compressed if the path ends in .gz;
+    # each monitor writes to the path it is given, closing any sink left
+    # open by an earlier one
+    if SINK is not None:
+        SINK.close()
+    SINK = andbug.sink.Sink(monitor_log_file_path, append=False)
     print "task_file_path:" + task_file_path
-    
 
-    file = open(task_file_path)        # 返回一个文件对象
-    line = file.readline()             # 调用文件的 readline()方法
-    
-    unhookFunList=[]
+    with open(task_file_path) as file:
+        plan = compile_plan(file)
+
+    # in counting mode, hooks suspend nothing, and the sink is only written
+    # the counts of each interval; see andbug.counting
+    counter = reporter = None
+    if count is not None:
+        counter = andbug.counting.HitCounter()
+
+    started = time()
+    hooks = []
     with andbug.screed.section('Setting Hooks'):
-        while line:    
-            
-            flag, monitorType, cpath, mname, mjni = ParseMonitorConfItem(line)
-            print "flag=%s, monitorType=%s, cpath=%s, mname=%s, mjni=%s "%(flag,monitorType, cpath, mname, mjni)
-            print "line=%s"%(line)
-            if flag==False:
-                line = file.readline()
-                continue    
-            try:
-                flag=cmd_hook_methods(ctxt, monitorType, cpath, mname)   
-                if flag==False:
-                    unhookFun = {}
-                    unhookFun["monitorType"]=monitorType
-                    unhookFun["cpath"]=cpath
-                    unhookFun["mname"]=mname
-                    unhookFunList.append(unhookFun)
-                         
-            except Exception:
-                print "RequestError "+ cpath + "-" + mname 
-                
-            line = file.readline()
-
-    file.close()
-    
+        for i in range(0, HOOK_RETRIES + 1):
+            if not plan:
+                break
+            done, plan = install_plan(ctxt.sess, plan, report_hit, counter)
+            hooks.extend(done)
+
+    if counter is not None:
+        reporter = andbug.counting.start(
+            ctxt.sess, counter, record_counts(ctxt.sess, counter), float(count)
+        )
+
     #输出hook失败的函数：
-    for fun in unhookFunList:
-        print "unhookFun: %s/%s "%(fun["cpath"],fun["mname"])
-    
-    for i in range(0,5):
-        flag, newUnhookFunList = HookGoGoGo(ctxt, unhookFunList)
-        #print "i=%d  flag=%s len=%d"%(i, flag, len(newUnhookFunList))
-        unhookFunList = newUnhookFunList
-    
-    andbug.screed.section('Setting Hooks sucessful')
+    for cpath, items in plan.items():
+        for monitorType, mname, mjni in items:
+            print "unhookFun: %s/%s "%(cpath, mname)
+
+    andbug.screed.section('Setting Hooks sucessful: %d hooks in %.2fs' % (len(hooks), time() - started))
     
     if not ctxt.shell:
         try:
@@ -243,6 +292,11 @@ def monitor(ctxt, monitor_log_file_path="1111", monitor_file_md5="00000", task_f
         try:
             cmd = shlex.split(input())
         except EOFError:
+            # the last counts are written before the sink is closed
+            if reporter is not None:
+                andbug.counting.stop(ctxt.sess, counter, reporter)
+            SINK.close()
+            SINK = None
             return
         andbug.screed.pollcap()
         if cmd:
@@ -96,8 +96,11 @@ def info(value):
 
 def sequence_view(value):
     seq = ['seq', value.jni]
-    for val in value:
+    items, more = value.preview()
+    for val in items:
         seq.append(info(val))
+    if more:
+        seq.append('... %s items' % len(value))
     return seq
     #TODO: slots
 
@@ -193,7 +196,7 @@ def get_item(val, key):
 
 def deref_frame(tid, fid):
     threads = get_threads()
-    return tuple(threads[tid].frames)[fid]
+    return threads[tid].frames[fid]
 
 def deref_value(tid, fid, key, path):
     if isinstance(path, basestring):
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'implementation of the "pool-stats" command'
+
+import andbug.command, andbug.screed
+
+@andbug.command.action('', shell=True)
+def pool_stats(ctxt):
+    'reports hit, miss and eviction counters of the session object pool'
+    stats = ctxt.sess.pool.stats()
+    with andbug.screed.section('Session Pool'):
+        for key in ('size', 'pinned', 'hits', 'misses', 'evictions'):
+            andbug.screed.item('%s: %s' % (key, stats[key]))
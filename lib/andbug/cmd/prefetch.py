@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'implementation of the "prefetch" command'
+
+import andbug.command, andbug.screed, andbug.prefetch
+
+@andbug.command.action('[<package prefix>]', shell=True)
+def prefetch(ctxt, prefix=None):
+    'loads the metadata of the classes under a package in the background, or reports progress'
+    sess = ctxt.sess
+    if prefix is not None:
+        andbug.prefetch.start(sess, (prefix,))
+    with andbug.screed.section('Prefetch'):
+        for worker in sess.prefetchers:
+            state = 'done' if worker.done else 'running'
+            andbug.screed.item('%s: %s, %d classes, %d methods, %d requests, %d refused' % (
+                ', '.join(worker.prefixes), state, worker.classes,
+                worker.methods, worker.requests, worker.failures
+            ))
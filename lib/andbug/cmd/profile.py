@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'implementation of the "profile" command'
+
+import andbug.command, andbug.screed, andbug.sampler, andbug.config
+
+# the sampler started by profile start; see andbug.sampler
+SAMPLER = None
+
+@andbug.command.action(
+    '[start [<thread-name>] | stop [<folded-path>]]', shell=True,
+    opts=(('rate', 'samples taken a second'),)
+)
+def profile(ctxt, verb=None, arg=None, rate=None):
+    'samples thread stacks into a folded-stack (flame graph) file'
+    global SAMPLER
+    sess = ctxt.sess
+    if verb == 'start':
+        if SAMPLER is not None:
+            andbug.screed.item('The profiler is already running')
+            return
+        threads = None
+        if arg is not None:
+            threads = list(sess.threads(arg))
+            if not threads:
+                andbug.screed.item('Could not find thread %s' % arg)
+                return
+        SAMPLER = andbug.sampler.Sampler(sess, float(rate) if rate else None, threads)
+        SAMPLER.start()
+        andbug.screed.item('Sampling %s %g times a second' % (
+            arg or 'every thread', SAMPLER.rate
+        ))
+        return
+
+    sampler = SAMPLER
+    if sampler is None:
+        andbug.screed.item('The profiler is not running')
+        return
+    if verb == 'stop':
+        SAMPLER = None
+        sampler.stop()
+        path = arg or andbug.config.g_Profile_Path
+        sampler.write(path)
+        andbug.screed.item('Wrote %d samples to %s' % (sampler.samples, path))
+        return
+
+    pauses = sampler.pauses
+    with andbug.screed.section('Profile'):
+        andbug.screed.item('%d samples, %d stacks, %d failures' % (
+            sampler.samples, len(sampler.folded), sampler.failures
+        ))
+        if pauses.count:
+            andbug.screed.item('pauses (ms): p50 %.1f, p99 %.1f, max %.1f' % (
+                pauses.quantile(0.5) * 1000, pauses.quantile(0.99) * 1000, pauses.max * 1000
+            ))
@@ -18,7 +18,7 @@
 
 from __future__ import print_function
 import shlex
-import andbug.command, andbug.screed
+import andbug.command, andbug.screed, andbug.counting
 
 BANNER = 'AndBug (C) 2011 Scott W. Dunlop <swdunlop@gmail.com>'
 
@@ -51,6 +51,7 @@ def shell(ctxt):
         try:
             cmd = shlex.split(input())
         except EOFError:
+            andbug.counting.stop_all()
             return
         andbug.screed.pollcap()
         if cmd:
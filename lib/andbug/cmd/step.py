@@ -8,9 +8,10 @@ def stepComplete(t):
         showCallStack(t, 1)
         
 def showCallStack(t, count = 0):
-    if count >= len(t.frames) or count <= 0:
-        count = len(t.frames)
-    for f in t.frames[0:count]:
+    frames = t.frames
+    if count > 0:
+        frames = frames[0:count]
+    for f in frames:
         name = str(f.loc)
         f.loc.method.firstLoc
         if f.native:
@@ -21,12 +21,12 @@ def report_hit(t):
     t = t[0]
     try:
         with andbug.screed.section("trace %s" % t):
-            for f in t.frames:
+            for f, values in t.snapshot():
                 name = str(f.loc)
                 if f.native:
                     name += ' <native>'
                 with andbug.screed.item(name):
-                    for k, v in f.values.items():
+                    for k, v in values.items():
                         andbug.screed.item( "%s=%s" %(k, v))
     finally:
         t.resume()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'implementation of the "vmtrace" command'
+
+import andbug.command, andbug.screed, andbug.vmtrace, andbug.config, andbug.vm
+from andbug.data import loaded
+
+def session_names(sess):
+    '''
+    names method ids from the methods the session has already loaded; the
+    pooled methods are indexed once, when the first id is asked for, without
+    touching the classes that were never loaded.
+    '''
+    methods = []
+    def resolve(mid):
+        if not methods:
+            methods.append(dict(
+                (m.mid, m) for m in sess.pool.objects(andbug.vm.Method)
+                if loaded(m, 'name')
+            ))
+        m = methods[0].get(mid)
+        return None if m is None else str(m)
+    return resolve
+
+def ms(value):
+    return '%.3f' % (value / 1000.0)
+
+@andbug.command.action('start [<buffer-size>] | stop [<trace-path>]', shell=True)
+def vmtrace(ctxt, verb, arg=None):
+    "traces every method call with Dalvik's own tracer, then reports the time spent in each"
+    conn = ctxt.sess.conn
+    if verb == 'start':
+        andbug.vmtrace.start(conn, int(arg) if arg else None)
+        andbug.screed.item('Tracing method calls')
+        return
+    if verb != 'stop':
+        andbug.screed.item('Expected start or stop, not %s' % verb)
+        return
+
+    path = arg or andbug.config.g_Vmtrace_Path
+    data = andbug.vmtrace.stop(conn)
+    andbug.vmtrace.save(data, path)
+    del data
+    profile = andbug.vmtrace.Profile()
+    with open(path, 'rb') as f:
+        options, threads, methods = profile.read(f)
+
+    rows = profile.rows(methods, session_names(ctxt.sess))
+    with andbug.screed.section('Wrote %s; methods by exclusive time (ms): calls, inclusive, exclusive' % path):
+        for name, calls, incl, excl in rows[:andbug.config.g_Vmtrace_Top]:
+            andbug.screed.item('%s: %d, %s, %s' % (name, calls, ms(incl), ms(excl)))
@@ -33,7 +33,7 @@ Commands for andbug are typically defined as ::
 '''
 
 import os, os.path, sys, getopt, inspect
-import andbug.vm, andbug.cmd, andbug.source, andbug.util,andbug.screed
+import andbug.vm, andbug.cmd, andbug.source, andbug.dex, andbug.util,andbug.screed
 import traceback
 from time import sleep
 from andbug.errors import *
@@ -43,7 +43,8 @@ from andbug.errors import *
 OPTIONS = (
     ('pid', 'the process to be debugged, by pid or name'),
     ('dev', 'the device or emulator to be debugged (see adb)'),
-    ('src', 'adds a directory where .java or .smali files could be found')
+    ('src', 'adds a directory where .java or .smali files could be found'),
+    ('apk', 'adds an .apk, .dex or apktool directory to read class metadata from')
 )
 
 class Context(object):
@@ -93,6 +94,8 @@ class Context(object):
         for k, v in opts: 
             if k == 'src': #处理src命令，猜测是源代码命令
                 andbug.source.add_srcdir(v)
+            elif k == 'apk':
+                andbug.dex.add_apk(v)
             else:
                 t[k] = v
         
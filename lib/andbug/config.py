@@ -5,3 +5,41 @@
 
 g_Date_File_Path = "/home/anbc/work_folder/andbug_work/andbug/data/monitor_fun.conf"
 
+
+# persistent class metadata cache; see andbug.cache
+g_Cache_Enabled = True
+g_Cache_Dir = "~/.andbug"
+
+# class prefixes (JNI, e.g. "Lcom/example/", or dotted) whose method, line
+# and variable tables are loaded in the background after connecting; see
+# andbug.prefetch
+g_Prefetch_Prefixes = ()
+g_Prefetch_Batch = 32     # requests per pipelined batch
+g_Prefetch_Idle = 0.2     # seconds without interactive requests before a batch
+
+# flow control of pipelined requests, applied to each session; see
+# andbug.proto.Flow
+g_Flow_Target = 0.25      # response latency, in seconds, above which windows halve
+g_Flow_Max_Window = 64    # largest window a bulk priority grows to
+
+# the NDJSON sink monitor writes its hits to; see andbug.sink
+g_Sink_Batch = 256        # records written per batch
+g_Sink_Flush = 0.5        # seconds a partial batch waits for more records
+g_Sink_Queue = 1 << 16    # records queued before new ones are dropped
+g_Sink_Rotate = 0         # bytes written to a file before it is rotated; 0 never
+g_Sink_Keep = 5           # rotated files kept
+
+# the counting mode of mtrace, ct and monitor; see andbug.counting
+g_Count_Period = 60       # seconds of each bucket hits are counted in
+g_Count_Report = 10       # seconds between snapshots of the counts
+
+# the sampling profiler of the profile command; see andbug.sampler
+g_Profile_Rate = 20       # samples a second
+g_Profile_Depth = 64      # innermost frames sampled of each stack
+g_Profile_Path = 'profile.folded' # where profile stop writes the folded stacks
+
+# Dalvik's method tracer, driven over DDM by vmtrace; see andbug.vmtrace
+g_Vmtrace_Buffer = 8 << 20 # bytes of trace the VM buffers before it stops
+g_Vmtrace_Timeout = 30     # seconds to wait for the trace once stopped
+g_Vmtrace_Path = 'vmtrace.trace' # where vmtrace stop writes the trace
+g_Vmtrace_Top = 30         # methods listed by vmtrace stop
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under
+## the terms of version 3 of the GNU Lesser General Public License as
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The andbug.counting module counts how often hooked locations are reached,
+per thread and per period (a minute by default), without suspending the
+threads that reach them.
+
+The event requests of a counter are set with Session.countMany, with a
+suspend policy of NONE; the session event thread decodes their events no
+further than the request, thread, type and method ids, and calls
+HitCounter.hit.  A Reporter takes snapshots of the counts at an interval,
+from a thread of its own.  Counts started with start run until stop, which
+clears their requests, or until the shell exits; outside the shell, until
+the command is interrupted.
+'''
+
+import threading
+from time import time, strftime, localtime
+import andbug.config, andbug.screed, andbug.vm
+
+KIND_NAMES = {1: 'step', 2: 'break', 40: 'entry', 41: 'exit'}
+
+class HitCounter(object):
+    '''
+    hit counts of the requests set by Session.countMany, keyed by request
+    id, thread id and period; hit is called by the session event thread, and
+    snapshot may be called from any other.
+    '''
+
+    def __init__(self, period=None):
+        self.period = period or andbug.config.g_Count_Period
+        self.lock = threading.Lock()
+        self.counts = {}  # (rid, tid, period index) -> hits
+        self.origins = {} # rid -> (location, eventKind)
+        self.total = 0
+
+    def add(self, rid, loc, kind):
+        self.origins[rid] = (loc, kind)
+
+    def hit(self, rid, tid, ctid=None, mid=None):
+        key = (rid, tid, int(time()) // self.period)
+        with self.lock:
+            counts = self.counts
+            counts[key] = counts.get(key, 0) + 1
+            self.total += 1
+
+    def snapshot(self, reset=False):
+        'returns a copy of the counts; with reset, the counts start over'
+        with self.lock:
+            counts = self.counts
+            self.counts = {} if reset else dict(counts)
+        return counts
+
+    def rows(self, counts):
+        '''
+        yields (location, eventKind, tid, period start, hits) for the counts
+        of a snapshot, ordered by location, thread and period.
+        '''
+        rows = []
+        for (rid, tid, idx), hits in counts.items():
+            loc, kind = self.origins.get(rid, (None, None))
+            rows.append((str(loc), kind, tid, idx * self.period, hits, loc))
+        rows.sort()
+        for name, kind, tid, start, hits, loc in rows:
+            yield loc, kind, tid, start, hits
+
+class Reporter(threading.Thread):
+    '''
+    calls emit with the counts of counter, from a snapshot taken every
+    interval seconds, until stopped; the counts are reset with each, so
+    emit only sees the hits since the previous snapshot.
+    '''
+
+    def __init__(self, counter, emit, interval=None):
+        threading.Thread.__init__(self, name='Reporter')
+        self.daemon = True
+        self.counter = counter
+        self.emit = emit
+        self.interval = interval or andbug.config.g_Count_Report
+        self.stopped = threading.Event()
+        self.start()
+
+    def stop(self):
+        'stops the reporter, after a last snapshot'
+        self.stopped.set()
+        self.join()
+
+    def run(self):
+        while True:
+            self.stopped.wait(self.interval)
+            counts = self.counter.snapshot(True)
+            if counts:
+                self.emit(counts)
+            if self.stopped.is_set():
+                return
+
+# the counts still running, as (session, counter, reporter); see start
+RUNNING = []
+
+def start(sess, counter, emit, interval=None):
+    'starts reporting the counts of counter with emit; returns its Reporter'
+    reporter = Reporter(counter, emit, interval)
+    RUNNING.append((sess, counter, reporter))
+    return reporter
+
+def stop(sess, counter, reporter):
+    '''
+    clears the requests of counter, then stops its reporter, so that its
+    last report holds every hit counted.
+    '''
+    if (sess, counter, reporter) in RUNNING:
+        RUNNING.remove((sess, counter, reporter))
+    try:
+        sess.uncount(counter)
+    finally:
+        reporter.stop()
+
+def stop_all():
+    'stops every count still running, latest first'
+    while RUNNING:
+        stop(*RUNNING[-1])
+
+def block_exit(ctxt):
+    '''
+    blocks as ctxt.block_exit does; outside the shell, the counts running
+    are stopped when the command is interrupted.
+    '''
+    if ctxt.shell:
+        return
+    try:
+        ctxt.block_exit()
+    finally:
+        stop_all()
+
+def thread_names(sess):
+    'returns a function naming a thread id, asking the process once per thread'
+    names = {}
+    def name(tid):
+        if tid not in names:
+            try:
+                names[tid] = sess.pool(andbug.vm.Thread, sess, tid).name
+            except andbug.vm.RequestError:
+                names[tid] = None # the thread is gone
+        return names[tid] or hex(tid)
+    return name
+
+def show(sess, counter):
+    'returns an emit for Reporter that lists the counts with andbug.screed'
+    name = thread_names(sess)
+    def emit(counts):
+        with andbug.screed.section('Hits'):
+            for loc, kind, tid, start, hits in counter.rows(counts):
+                andbug.screed.item('%s [%s] %s at %s: %d' % (
+                    loc, KIND_NAMES.get(kind, kind), name(tid),
+                    strftime('%H:%M', localtime(start)), hits
+                ))
+    return emit
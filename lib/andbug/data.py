@@ -21,6 +21,9 @@
 
 
 from threading import Lock
+from collections import OrderedDict
+from bisect import bisect_right
+import weakref
 
 class multidict(dict):
     '''
@@ -43,12 +46,51 @@ class multidict(dict):
     def __getitem__(self, key):
         return self.get(key)
 
+class shard(object):
+    '''
+    one lock-protected partition of a pool; see pool.  entries are kept
+    strongly, or as weak references, according to the policy of their
+    constructor; those of LRU constructors are also held in per-constructor
+    LRU orders.
+    '''
+    def __init__(self):
+        self.lock = Lock()
+        self.items = {}   # ident -> obj, for constructors that are kept
+        self.refs = {}    # ident -> weakref, for weak and LRU constructors
+        self.lru = {}     # ctor -> OrderedDict of ident -> obj, most recent last
+        self.dead = []    # idents whose weakref has expired
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def expire(self, ident):
+        'weakref callback; never takes the lock, purge does the cleanup'
+        self.dead.append(ident)
+
+    def purge(self):
+        'drops expired weak entries; must hold the lock'
+        dead, self.dead = self.dead, []
+        refs = self.refs
+        for ident in dead:
+            ref = refs.get(ident)
+            if ref is not None and ref() is None:
+                del refs[ident]
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self.items) + len(self.refs)
+
 class pool(object):
     '''
     a pool of singleton[单独的] objects such that, for any combination[联合体] of constructor 
     and 1 or more initializers, there may be zero or one objects; attempting
     to reference a nonexisted object causes it to be created.
 
+    the pool is split into shards, each behind its own lock, so concurrent
+    lookups rarely contend.  by default entries live forever; policy() lets
+    transient constructors be held weakly, or also kept strongly while among
+    the most recently used, and pin() keeps individual objects regardless.
+
     example:
         def t(a): return [a,0]
         p = pool()
@@ -57,18 +99,135 @@ class pool(object):
         p(t,1)[1] = -1
         # t1[1] is now -1, not 1
     '''
-    def __init__(self):
-        self.pools = {}
-        self.lock = Lock()
-	
+    def __init__(self, shards=16):
+        self.shards = tuple(shard() for i in range(shards))
+        self.policies = {}  # ctor -> ('weak', None) or ('lru', limit per shard)
+        self.pinned = {}    # id(obj) -> [obj, count]
+        self.pinlock = Lock()
+
+    def policy(self, ctor, kind='keep', limit=None):
+        '''
+        sets how objects made by ctor are retained: 'keep' (forever), 'weak'
+        (while referenced elsewhere) or 'lru' (while referenced elsewhere, or
+        among the limit most recently used).  an object evicted from the LRU
+        order is still found while referenced, so it is never made twice.
+        the policy must be set before the pool makes any objects with ctor.
+        '''
+        if kind == 'keep':
+            self.policies.pop(ctor, None)
+        elif kind == 'weak':
+            self.policies[ctor] = ('weak', None)
+        elif kind == 'lru':
+            per = max(1, int(limit) // len(self.shards))
+            self.policies[ctor] = ('lru', per)
+        else:
+            raise ValueError('unknown pool policy %r' % kind)
+
+    def pin(self, obj):
+        'keeps obj in the pool, regardless of its policy, until unpinned'
+        with self.pinlock:
+            entry = self.pinned.get(id(obj))
+            if entry is None:
+                self.pinned[id(obj)] = [obj, 1]
+            else:
+                entry[1] += 1
+
+    def unpin(self, obj):
+        with self.pinlock:
+            entry = self.pinned.get(id(obj))
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self.pinned[id(obj)]
+
+    def objects(self, ctor):
+        'returns the objects made by ctor that are still in the pool'
+        objs = []
+        for sh in self.shards:
+            with sh.lock:
+                for ident, obj in sh.items.iteritems():
+                    if ident[0] is ctor:
+                        objs.append(obj)
+                for ident, ref in sh.refs.iteritems():
+                    obj = ref() if ident[0] is ctor else None
+                    if obj is not None:
+                        objs.append(obj)
+        return objs
+
+    def stats(self):
+        'returns hit, miss and eviction counters, and the pooled object count'
+        res = dict(hits=0, misses=0, evictions=0, size=0, pinned=0)
+        for sh in self.shards:
+            with sh.lock:
+                sh.purge()
+                res['hits'] += sh.hits
+                res['misses'] += sh.misses
+                res['evictions'] += sh.evictions
+                res['size'] += len(sh)
+        res['pinned'] = len(self.pinned)
+        return res
+
 	#调用方式：return pool(classitem, self.cid)
     def __call__(self, *ident):  #调用方式：m1 = pool(methoditem, 'c1', 'm1')  
-        with self.lock:
-            pool = self.pools.get(ident)
-            if pool is None:
-                pool = ident[0](*ident[1:])  #这里会出现什么样的运算结果还不清楚
-                self.pools[ident] = pool
-            return pool
+        sh = self.shards[hash(ident) % len(self.shards)]
+        policy = self.policies.get(ident[0])
+        with sh.lock:
+            if policy is None:
+                obj = sh.items.get(ident)
+                if obj is None:
+                    obj = ident[0](*ident[1:])  #这里会出现什么样的运算结果还不清楚
+                    sh.items[ident] = obj
+                    sh.misses += 1
+                else:
+                    sh.hits += 1
+                return obj
+
+            kind, limit = policy
+            if kind == 'weak':
+                return self.lookup(sh, ident)
+
+            order = sh.lru.get(ident[0])
+            if order is None:
+                order = sh.lru[ident[0]] = OrderedDict()
+            obj = order.pop(ident, None)
+            if obj is None:
+                obj = self.lookup(sh, ident)
+            else:
+                sh.hits += 1
+            order[ident] = obj
+            if len(order) > limit:
+                self.evict(sh, order, limit)
+            return obj
+
+    def lookup(self, sh, ident):
+        'finds or makes the object of a weakly held ident; holds sh.lock'
+        if sh.dead:
+            sh.purge()
+        ref = sh.refs.get(ident)
+        obj = None if ref is None else ref()
+        if obj is None:
+            obj = ident[0](*ident[1:])
+            sh.refs[ident] = weakref.ref(
+                obj, lambda ref, ident=ident, sh=sh: sh.expire(ident)
+            )
+            sh.misses += 1
+        else:
+            sh.hits += 1
+        return obj
+
+    def evict(self, sh, order, limit):
+        '''
+        trims an LRU order to limit, skipping pinned objects; holds sh.lock.
+        the objects trimmed stay in the pool, weakly, until unreferenced.
+        '''
+        pinned = self.pinned
+        for i in range(len(order)):
+            if len(order) <= limit:
+                break
+            ident, obj = order.popitem(last=False)
+            if id(obj) in pinned:
+                order[ident] = obj
 
 class view(object):
     '''
@@ -117,6 +276,36 @@ def flatten(seq):
         for s in ss:
             yield s
 			
+class intervals(object):
+    '''
+    a static map from points to the items whose closed [lo, hi] ranges cover
+    them.  the ranges are cut into segments at every boundary when the map is
+    built, so a lookup is one bisect returning a shared tuple, ordered as the
+    items were given.
+    '''
+
+    def __init__(self, ranges=()):
+        ranges = list(ranges)
+        bounds = set()
+        for lo, hi, item in ranges:
+            bounds.add(lo)
+            bounds.add(hi + 1)
+        self.bounds = sorted(bounds)
+        self.segments = list(
+            tuple(item for lo, hi, item in ranges if lo <= b <= hi)
+            for b in self.bounds
+        )
+
+    def segment(self, point):
+        'returns the number of the segment covering point, or -1'
+        return bisect_right(self.bounds, point) - 1
+
+    def __getitem__(self, point):
+        i = self.segment(point)
+        if i < 0:
+            return ()
+        return self.segments[i]
+
 #？推迟延期			
 #具体调用方式是：first = defer(load_line_table, 'first')
 def defer(func, name):
@@ -127,29 +316,38 @@ def defer(func, name):
 
     unlike other deferral implementation, this one accepts the reality that the
     product of a single calculation may be multiple properties
+
+    the value is kept in the attribute '_' + name, which classes using
+    __slots__ must declare; see deferred.  an unset slot raises
+    AttributeError, which is what marks the value as not yet loaded.
     '''
+    slot = '_' + name
+
     def fget(obj, type=None):   
         try:
-            return obj.props[name]  #按照指定的要求取元素，一旦获取失败就处罚异常，于是执行下面的func(obj)函数
-        except KeyError:
-            pass
+            return getattr(obj, slot)
         except AttributeError:
-            obj.props = {}
+            pass
 
-        obj.props[name] = None
+        setattr(obj, slot, None)
         func(obj)
-        return obj.props[name]
+        return getattr(obj, slot)
     
     def fset(obj, value):
-        try:
-            obj.props[name] = value
-        except AttributeError:
-            obj.props = {name : value}
+        setattr(obj, slot, value)
 
     fget.func_name = 'get_' + name  #func_name 没能找到相关资料
     fset.func_name = 'set_' + name
     return property(fget, fset)  #设置当获取值时调用fget函数，当设置值是调用fset函数
 
+def deferred(*names):
+    'returns the __slots__ entries backing the deferred properties in names'
+    return tuple('_' + name for name in names)
+
+def loaded(obj, name):
+    'true if the deferred property name of obj has already been resolved'
+    return hasattr(obj, '_' + name)
+
 	
 #下面应该都是用于测试的代码
 if __name__ == '__main__':
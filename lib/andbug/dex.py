@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under
+## the terms of version 3 of the GNU Lesser General Public License as
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The andbug.dex module reads the methods, line tables and local variable
+tables of the classes in a classes.dex, so that the metadata cache of a
+session (see andbug.cache) can be filled before connecting instead of one
+JDWP request per method.
+
+Tables are produced the way the Dalvik debugger reports them: the line
+table of a method spans code units 0 to insns_size - 1, and in the variable
+table "this" is slot 0 and register 0 is slot 1000.  Classes whose methods
+do not match what the VM lists (e.g. Dalvik's miranda methods) are caught
+by the digest check of the cache and fetched over the wire as before.
+'''
+
+import os, os.path, struct, zipfile, hashlib
+import andbug.cache
+from andbug import log
+
+DEXES = [] # paths given with --apk
+
+ACC_STATIC = 0x0008
+SLOT0_SUB = 1000 # Dalvik's kSlot0Sub
+
+def add_apk(path):
+    'adds an .apk, a .dex or a directory holding .dex files to DEXES'
+    path = os.path.abspath(os.path.expanduser(path))
+    if path not in DEXES:
+        DEXES.insert(0, path)
+
+def uleb128(data, off):
+    'returns the unsigned LEB128 at off, and the offset past it'
+    val = 0
+    shift = 0
+    while True:
+        b = ord(data[off])
+        off += 1
+        val |= (b & 0x7F) << shift
+        shift += 7
+        if not b & 0x80:
+            return val, off
+
+def sleb128(data, off):
+    'returns the signed LEB128 at off, and the offset past it'
+    start = off
+    val, off = uleb128(data, off)
+    bits = 7 * (off - start)
+    if val & (1 << (bits - 1)):
+        val -= 1 << bits
+    return val, off
+
+def uleb128p1(data, off):
+    val, off = uleb128(data, off)
+    return val - 1, off
+
+class DexMethod(object):
+    __slots__ = ('klass', 'name', 'params', 'jni', 'flags', 'code')
+
+    def __init__(self, klass, name, params, jni, flags, code):
+        self.klass = klass
+        self.name = name
+        self.params = params
+        self.jni = jni
+        self.flags = flags
+        self.code = code # (registers, ins, insns, debug_off), or None
+
+    def __repr__(self):
+        return '<dex %s.%s%s>' % (self.klass, self.name, self.jni)
+
+class DexFile(object):
+    'the parts of a classes.dex the debugger needs; see classes and debug'
+
+    def __init__(self, data):
+        if data[:4] != 'dex\n':
+            raise ValueError('not a dex file')
+        self.data = data
+        (self.string_ct, self.string_off, self.type_ct, self.type_off,
+         self.proto_ct, self.proto_off, self.field_ct, self.field_off,
+         self.method_ct, self.method_off, self.class_ct, self.class_off
+        ) = struct.unpack_from('<12I', data, 0x38)
+        self.strings = {}
+
+    def u4(self, off):
+        return struct.unpack_from('<I', self.data, off)[0]
+
+    def string(self, idx):
+        s = self.strings.get(idx)
+        if s is None:
+            data = self.data
+            ct, off = uleb128(data, self.u4(self.string_off + 4 * idx))
+            s = data[off:data.index('\0', off)]
+            self.strings[idx] = s
+        return s
+
+    def type(self, idx):
+        return self.string(self.u4(self.type_off + 4 * idx))
+
+    def proto(self, idx):
+        'returns the parameter types and the method signature of a proto'
+        ret, params_off = struct.unpack_from('<2I', self.data, self.proto_off + 12 * idx + 4)
+        params = ()
+        if params_off:
+            ct = self.u4(params_off)
+            params = tuple(
+                self.type(t) for t in struct.unpack_from('<%dH' % ct, self.data, params_off + 4)
+            )
+        return params, '(' + ''.join(params) + ')' + self.type(ret)
+
+    def method(self, idx):
+        'returns the class, name and proto index of a method id'
+        cls, proto, name = struct.unpack_from('<2HI', self.data, self.method_off + 8 * idx)
+        return self.type(cls), self.string(name), proto
+
+    def classes(self):
+        'yields the signature and the methods of each class defined here'
+        data = self.data
+        for i in range(self.class_ct):
+            base = self.class_off + 32 * i
+            cls = self.type(self.u4(base))
+            class_data = self.u4(base + 24)
+            if not class_data:
+                yield cls, []
+                continue
+            sfct, off = uleb128(data, class_data)
+            ifct, off = uleb128(data, off)
+            dmct, off = uleb128(data, off)
+            vmct, off = uleb128(data, off)
+            for j in range(2 * (sfct + ifct)):
+                v, off = uleb128(data, off)
+
+            methods = []
+            for ct in (dmct, vmct):
+                idx = 0
+                for j in range(ct):
+                    diff, off = uleb128(data, off)
+                    flags, off = uleb128(data, off)
+                    code_off, off = uleb128(data, off)
+                    idx += diff
+                    klass, name, proto = self.method(idx)
+                    code = None
+                    if code_off:
+                        regs, ins = struct.unpack_from('<2H', data, code_off)
+                        debug_off, insns = struct.unpack_from('<2I', data, code_off + 8)
+                        code = (regs, ins, insns, debug_off)
+                    params, jni = self.proto(proto)
+                    methods.append(DexMethod(klass, name, params, jni, flags, code))
+            yield cls, methods
+
+    def debug(self, method):
+        '''
+        decodes the debug info of method; returns its line table rows, as
+        (loc, line), and its variable table rows, as (codeIndex, name, jni,
+        gen, codeLen, slot).
+        '''
+        regs, ins, insns, off = method.code
+        data = self.data
+        lines = []
+        slots = []
+        live = {} # reg -> [name, jni, gen, start], for the locals in scope
+        last = {} # reg -> the last local of reg, for RESTART_LOCAL
+
+        def emit(reg, end):
+            name, jni, gen, start = live.pop(reg)
+            if name is None:
+                return
+            slot = reg
+            if name == 'this':
+                slot = 0
+            elif reg == 0:
+                slot = SLOT0_SUB
+            slots.append((start, name, jni, gen, end - start, slot))
+
+        def start(reg, name, jni, gen, addr):
+            if reg in live:
+                emit(reg, addr)
+            live[reg] = [name, jni, gen, addr]
+            last[reg] = live[reg]
+
+        def string(idx):
+            return None if idx < 0 else self.string(idx)
+
+        def type(idx):
+            return None if idx < 0 else self.type(idx)
+
+        line, off = (0, 0) if not off else uleb128(data, off)
+        names = []
+        if off:
+            ct, off = uleb128(data, off)
+            for i in range(ct):
+                idx, off = uleb128p1(data, off)
+                names.append(string(idx))
+
+        reg = regs - ins
+        if not method.flags & ACC_STATIC:
+            start(reg, 'this', method.klass, '', 0)
+            reg += 1
+        for i, jni in enumerate(method.params):
+            if i < len(names):
+                start(reg, names[i], jni, '', 0)
+            reg += 2 if jni in ('J', 'D') else 1
+
+        addr = 0
+        while off:
+            op = ord(data[off])
+            off += 1
+            if op == 0x00:   # DBG_END_SEQUENCE
+                break
+            elif op == 0x01: # DBG_ADVANCE_PC
+                v, off = uleb128(data, off)
+                addr += v
+            elif op == 0x02: # DBG_ADVANCE_LINE
+                v, off = sleb128(data, off)
+                line += v
+            elif op in (0x03, 0x04): # DBG_START_LOCAL(_EXTENDED)
+                r, off = uleb128(data, off)
+                name, off = uleb128p1(data, off)
+                jni, off = uleb128p1(data, off)
+                gen = -1
+                if op == 0x04:
+                    gen, off = uleb128p1(data, off)
+                start(r, string(name), type(jni), string(gen) or '', addr)
+            elif op == 0x05: # DBG_END_LOCAL
+                r, off = uleb128(data, off)
+                if r in live:
+                    emit(r, addr)
+            elif op == 0x06: # DBG_RESTART_LOCAL
+                r, off = uleb128(data, off)
+                if r in last:
+                    name, jni, gen = last[r][:3]
+                    start(r, name, jni, gen, addr)
+            elif op in (0x07, 0x08): # DBG_SET_PROLOGUE_END, DBG_SET_EPILOGUE_BEGIN
+                pass
+            elif op == 0x09: # DBG_SET_FILE
+                v, off = uleb128p1(data, off)
+            else:            # special opcodes emit a position
+                adj = op - 0x0A
+                addr += adj // 15
+                line += -4 + adj % 15
+                lines.append((addr, line))
+
+        for r in sorted(live):
+            emit(r, insns)
+        return tuple(lines), tuple(slots)
+
+    def tables(self):
+        '''
+        yields the class signature, the method keys and the cache tables of
+        each class; see MetaCache.update.
+        '''
+        for cls, methods in self.classes():
+            sigs = []
+            tables = {}
+            for m in methods:
+                key = andbug.cache.method_key(m.name, m.jni)
+                sigs.append(key)
+                if m.code is None:
+                    continue
+                lines, slots = self.debug(m)
+                insns = m.code[2]
+                tables[(andbug.cache.LINES, key)] = (0, insns - 1, lines)
+                tables[(andbug.cache.SLOTS, key)] = (m.code[1], slots)
+            yield cls, sigs, tables
+
+def read_dexes(path):
+    'yields the contents of each dex in an apk, a dex, or an apktool tree'
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.dex'):
+                with open(os.path.join(path, name), 'rb') as f:
+                    yield f.read()
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as z:
+            for name in sorted(z.namelist()):
+                if name.startswith('classes') and name.endswith('.dex'):
+                    yield z.read(name)
+    else:
+        with open(path, 'rb') as f:
+            yield f.read()
+
+def signatures(paths=None):
+    'returns the SHA-1 signatures of every dex found in paths, DEXES by default'
+    sigs = []
+    for path in (DEXES if paths is None else paths):
+        try:
+            for data in read_dexes(path):
+                sigs.append(data[12:32].encode('hex'))
+        except Exception as exc:
+            log.error("study", "dex: could not read %s, %s" % (path, exc))
+    return ','.join(sigs)
+
+def prepopulate(cache, paths=None):
+    '''
+    fills cache with the tables of every dex found in paths, DEXES by default;
+    a dex already imported into the cache is skipped.  returns the number of
+    classes imported.
+    '''
+    if cache is None:
+        return 0
+    count = 0
+    for path in (DEXES if paths is None else paths):
+        try:
+            for data in read_dexes(path):
+                tag = 'dex:' + hashlib.sha1(data).hexdigest()
+                if cache.stamped(tag):
+                    continue
+                for cls, sigs, tables in DexFile(data).tables():
+                    cache.update(cls, sigs, tables)
+                    count += 1
+                cache.stamp(tag)
+                cache.sync()
+        except Exception as exc:
+            log.error("study", "dex: could not read %s, %s" % (path, exc))
+    return count
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under
+## the terms of version 3 of the GNU Lesser General Public License as
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The andbug.graph module serializes the object graph reachable from a value
+as JSON.  The graph is expanded a level at a time: the strings, types,
+fields and array items of every object on one level are fetched with one
+pipelined batch each, objects are expanded once no matter how often they
+are reached, and the walk stops at a depth, a node count and, while
+writing, a size in bytes.
+
+Objects keep the shape Object.genJson always had:
+
+    {"object_id": 1234, "object_type": "Lcom/foo/Bar;",
+     "fields_infor": {"name": "value", ...}}
+
+Arrays are {"array_type": ..., "array_length": ..., "array_data": [...]},
+strings are plain JSON strings.  An object that was not expanded, because
+of a limit, is written without "fields_infor" or "array_data" and with
+"truncated": true; an object already written elsewhere in the output is
+written as {"$ref": oid}, which also breaks cycles.
+'''
+
+import json
+import andbug.vm
+from andbug.data import loaded
+
+DEFAULT_DEPTH = 2        # levels of references followed from the roots
+DEFAULT_NODES = 256      # objects expanded
+DEFAULT_SIZE = 1 << 16   # bytes written before everything left is truncated
+DEFAULT_ITEMS = 64       # array items fetched per array
+
+class JsonWriter(object):
+    '''
+    writes JSON to a file-like object as it is produced, counting the bytes
+    written in size.
+    '''
+
+    def __init__(self, out):
+        self.out = out
+        self.size = 0
+        self.stack = [] # per open container: true until its first member
+
+    def raw(self, text):
+        self.out.write(text)
+        self.size += len(text)
+
+    def sep(self):
+        if self.stack:
+            if self.stack[-1]:
+                self.stack[-1] = False
+            else:
+                self.raw(',')
+
+    def begin_object(self):
+        self.sep()
+        self.raw('{')
+        self.stack.append(True)
+
+    def end_object(self):
+        self.stack.pop()
+        self.raw('}')
+
+    def begin_array(self):
+        self.sep()
+        self.raw('[')
+        self.stack.append(True)
+
+    def end_array(self):
+        self.stack.pop()
+        self.raw(']')
+
+    def key(self, key):
+        self.sep()
+        self.raw(json.dumps(str(key)) + ':')
+        self.stack[-1] = True # the value that follows takes no separator
+
+    def value(self, value):
+        self.sep()
+        self.raw(json.dumps(value, default=str))
+
+class TreeWriter(object):
+    '''
+    takes the same calls as JsonWriter but builds the equivalent dicts and
+    lists, left in root; size estimates the length of the JSON text.
+    '''
+
+    def __init__(self):
+        self.size = 0
+        self.stack = []
+        self.keys = []
+        self.root = None
+
+    def put(self, value):
+        if not self.stack:
+            self.root = value
+        elif isinstance(self.stack[-1], list):
+            self.stack[-1].append(value)
+        else:
+            self.stack[-1][self.keys.pop()] = value
+
+    def begin_object(self):
+        obj = {}
+        self.put(obj)
+        self.stack.append(obj)
+        self.size += 2
+
+    def end_object(self):
+        self.stack.pop()
+
+    def begin_array(self):
+        seq = []
+        self.put(seq)
+        self.stack.append(seq)
+        self.size += 2
+
+    def end_array(self):
+        self.stack.pop()
+
+    def key(self, key):
+        key = str(key)
+        self.keys.append(key)
+        self.size += len(key) + 4
+
+    def value(self, value):
+        self.put(value)
+        self.size += len(json.dumps(value, default=str)) + 1
+
+class Graph(object):
+    '''
+    the part of the object graph of a session reachable from a set of roots,
+    expanded level by level within the given limits; see expand and write.
+    '''
+
+    def __init__(self, sess, depth=DEFAULT_DEPTH, nodes=DEFAULT_NODES,
+                 size=DEFAULT_SIZE, items=DEFAULT_ITEMS):
+        self.sess = sess
+        self.depth = depth
+        self.limit = nodes
+        self.size = size
+        self.items = items
+        self.nodes = {} # oid -> fields dict, (length, items) or string
+
+    def expand(self, roots):
+        'expands the objects among roots and what they reach, a level at a time'
+        frontier = list(roots)
+        for level in range(self.depth + 1):
+            todo = {}
+            for v in frontier:
+                if isinstance(v, andbug.vm.Object) and v.oid not in self.nodes:
+                    todo[v.oid] = v
+            room = self.limit - len(self.nodes)
+            todo = todo.values()[:max(room, 0)]
+            if not todo:
+                break
+            frontier = self.load(todo)
+        return self
+
+    def load(self, objs):
+        '''
+        fetches the content of objs with one pipelined batch per kind of
+        request; returns the values they refer to.
+        '''
+        sess = self.sess
+        nodes = self.nodes
+        strings = list(v for v in objs if isinstance(v, andbug.vm.String))
+        arrays = list(v for v in objs if isinstance(v, andbug.vm.Array))
+        plain = list(v for v in objs if type(v) is andbug.vm.Object)
+
+        sess.resolveStrings(strings)
+        for v in strings:
+            nodes[v.oid] = v.data
+
+        sess.resolveTypes(plain + arrays)
+        found = []
+        todo = []
+        for v in plain:
+            vals = v.cached('fields')
+            if vals is None:
+                todo.append(v)
+            else:
+                nodes[v.oid] = vals
+                found.extend(vals.values())
+        jobs = []
+        for v in todo:
+            fields = v.fieldList
+            jobs.append((0x0902, v.fieldsRequest(fields),
+                         lambda buf, v=v, fields=fields: v.unpackFieldValues(fields, buf)))
+        for v, vals in zip(todo, sess.pipeline(jobs)):
+            v.memo('fields', lambda: vals)
+            nodes[v.oid] = vals
+            found.extend(vals.values())
+
+        sess.pipeline(
+            (0x0D01, v.objectRequest(), v.unpackLength)
+            for v in arrays if not loaded(v, 'length')
+        )
+        lengths = list(v.length for v in arrays)
+        items = sess.pipeline(
+            (0x0D02, v.sliceRequest(0, min(n, self.items)), v.unpackSlice)
+            for v, n in zip(arrays, lengths) if n
+        )
+        items = iter(items)
+        for v, n in zip(arrays, lengths):
+            seq = items.next() if n else []
+            nodes[v.oid] = (n, seq)
+            found.extend(seq)
+        return found
+
+    def write(self, out, value):
+        'writes value to a JsonWriter or TreeWriter'
+        self.emit(out, value, set())
+        return out
+
+    def emit(self, out, v, seen):
+        if not isinstance(v, andbug.vm.Object):
+            out.value(v)
+            return
+        node = self.nodes.get(v.oid)
+        if isinstance(v, andbug.vm.String) and node is not None:
+            out.value(node)
+            return
+        if v.oid in seen:
+            out.begin_object()
+            out.key('$ref')
+            out.value(v.oid)
+            out.end_object()
+            return
+
+        expand = node is not None and out.size < self.size
+        jni = None
+        if loaded(v, 'refType') and loaded(v.refType, 'jni'):
+            jni = v.jni
+        out.begin_object()
+        if isinstance(v, andbug.vm.Array):
+            out.key('array_type')
+            out.value(jni)
+            if expand:
+                seen.add(v.oid)
+                length, items = node
+                out.key('array_length')
+                out.value(length)
+                out.key('array_data')
+                out.begin_array()
+                for item in items:
+                    self.emit(out, item, seen)
+                out.end_array()
+                if jni == '[B':
+                    out.key('array_data_show')
+                    out.value(''.join(
+                        chr(c & 0xFF) if 33 <= (c & 0xFF) <= 126 else '$' for c in items
+                    ))
+        else:
+            out.key('object_id')
+            out.value(v.oid)
+            out.key('object_type')
+            out.value(jni)
+            if expand:
+                seen.add(v.oid)
+                out.key('fields_infor')
+                out.begin_object()
+                for name in sorted(node):
+                    out.key(name)
+                    self.emit(out, node[name], seen)
+                out.end_object()
+        if not expand:
+            out.key('truncated')
+            out.value(True)
+        out.end_object()
+
+def dump(sess, value, out, **limits):
+    '''
+    writes value as JSON to the file-like out, expanding the objects it
+    reaches within limits (depth, nodes, size, items); returns the bytes
+    written.
+    '''
+    graph = Graph(sess, **limits).expand((value,))
+    return graph.write(JsonWriter(out), value).size
+
+def tree(sess, value, **limits):
+    'returns value as the dicts and lists dump would write'
+    graph = Graph(sess, **limits).expand((value,))
+    return graph.write(TreeWriter(), value).root
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under
+## the terms of version 3 of the GNU Lesser General Public License as
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The andbug.index module keeps the loaded class signatures of a process in a
+sorted index, so that exact, prefix, glob and regex class queries do not have
+to rescan the class table or reformat every JNI signature for each lookup.
+
+Queries use the forms produced by andbug.options.parse_cpath:
+
+    Lcom/foo/Bar;       exact JNI signature
+    Lcom/foo/*;         glob over JNI signatures, narrowed by its prefix
+    /Activity$/         regex searched over dotted class names
+'''
+
+import re
+from bisect import bisect_left
+from fnmatch import fnmatchcase
+from andbug.errors import OptionError
+
+GLOB_CHARS = '*?['
+
+def jni_to_name(jni):
+    'converts a JNI class signature to a dotted class name'
+    if jni.startswith('L') and jni.endswith(';'):
+        return jni[1:-1].replace('/', '.')
+    return jni
+
+def name_to_jni(name):
+    'converts a dotted class name to a JNI class signature'
+    return 'L' + name.replace('.', '/') + ';'
+
+def is_regex(query):
+    'true if the query is a /regex/ class query'
+    return len(query) > 1 and query.startswith('/') and query.endswith('/')
+
+def is_glob(query):
+    'true if the query contains glob wildcards'
+    for ch in GLOB_CHARS:
+        if ch in query:
+            return True
+    return False
+
+def glob_prefix(query):
+    'returns the literal lead of a glob, before its first wildcard'
+    for i in range(len(query)):
+        if query[i] in GLOB_CHARS:
+            return query[:i]
+    return query
+
+class ClassIndex(object):
+    '''
+    a sorted index of (jni, item) rows; the dotted name of each row is
+    computed once, when the index is built.  several rows may share a JNI
+    signature when a class has been loaded by more than one class loader.
+    '''
+
+    def __init__(self, rows=()):
+        rows = sorted(rows, key=lambda row: row[0])
+        self.jnis = list(row[0] for row in rows)
+        self.items = list(row[1] for row in rows)
+        self.names = list(jni_to_name(jni) for jni in self.jnis)
+
+    def __len__(self):
+        return len(self.jnis)
+
+    def span(self, prefix):
+        'returns the range of rows whose JNI signature starts with prefix'
+        jnis = self.jnis
+        lo = bisect_left(jnis, prefix)
+        hi = lo
+        lim = len(jnis)
+        while hi < lim and jnis[hi].startswith(prefix):
+            hi += 1
+        return lo, hi
+
+    def positions(self, query):
+        'returns the row numbers matching query, in signature order'
+        if is_regex(query):
+            try:
+                rx = re.compile(query[1:-1])
+            except re.error as exc:
+                raise OptionError('invalid class pattern %s: %s' % (query, exc))
+            names = self.names
+            return list(i for i in range(len(names)) if rx.search(names[i]))
+        if is_glob(query):
+            lo, hi = self.span(glob_prefix(query))
+            jnis = self.jnis
+            return list(i for i in range(lo, hi) if fnmatchcase(jnis[i], query))
+        lo, hi = self.span(query)
+        jnis = self.jnis
+        return list(i for i in range(lo, hi) if jnis[i] == query)
+
+    def find(self, query):
+        'returns the items matching an exact, glob or regex query'
+        items = self.items
+        return list(items[i] for i in self.positions(query))
+
+    def prefix(self, prefix):
+        'returns the items whose JNI signature starts with prefix'
+        lo, hi = self.span(prefix)
+        return self.items[lo:hi]
+
+    def name(self, jni):
+        'returns the dotted name for a JNI signature'
+        lo, hi = self.span(jni)
+        if lo < hi and self.jnis[lo] == jni:
+            return self.names[lo]
+        return jni_to_name(jni)
+
+    def search(self, expr=None):
+        '''
+        yields (name, item) for every class whose dotted name contains expr;
+        glob and /regex/ expressions are passed through to positions.
+        '''
+        names = self.names
+        items = self.items
+        if expr is None:
+            seq = range(len(names))
+        elif is_regex(expr):
+            seq = self.positions(expr)
+        elif is_glob(expr):
+            if not (expr.startswith('L') and expr.endswith(';')):
+                expr = name_to_jni(expr)
+            seq = self.positions(expr)
+        else:
+            seq = (i for i in range(len(names)) if expr in names[i])
+        for i in seq:
+            yield names[i], items[i]
@@ -16,6 +16,7 @@
 ## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
 
 import sys
+import andbug.index
 
 class ParseError(Exception):
     def __init__(self, reason, option):
@@ -29,7 +30,9 @@ def parse_cpath(path):
     '''
     函数功能：对类路径进行解析
     '''
-    if path.startswith('L') and path.endswith(';') and ('.' not in path):
+    if andbug.index.is_regex(path):
+        return path
+    elif path.startswith('L') and path.endswith(';') and ('.' not in path):
 		return path
     elif path.startswith('L') or path.endswith(';') or ('/' in path):
 		raise ParseError('could not determine if path is a JNI or logical class path', path)
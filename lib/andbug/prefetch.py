@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under
+## the terms of version 3 of the GNU Lesser General Public License as
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The andbug.prefetch module loads the method, line and variable tables of
+the classes under a set of package prefixes in the background, so they are
+already there when a command or a breakpoint needs them.
+
+Its requests have the lowest priority on the connection (see
+andbug.proto.Connection.admit), and it only starts a batch once the
+connection has seen no interactive request for g_Prefetch_Idle seconds.
+Tables found in the metadata cache (see andbug.cache) are not requested at
+all.
+'''
+
+import threading
+import andbug.config, andbug.proto, andbug.vm
+from andbug.data import loaded
+from andbug import log
+
+def jni_prefix(prefix):
+    'converts a dotted package prefix to JNI form; JNI prefixes are kept'
+    if '.' in prefix and '/' not in prefix:
+        return 'L' + prefix.replace('.', '/')
+    return prefix
+
+class Prefetcher(threading.Thread):
+    '''
+    a thread loading the metadata of the classes of sess under prefixes; the
+    counters report its progress, see the "prefetch" command.
+    '''
+
+    def __init__(self, sess, prefixes, batch=None, idle=None):
+        threading.Thread.__init__(self, name='Prefetch')
+        self.daemon = True
+        self.sess = sess
+        self.prefixes = list(jni_prefix(p) for p in prefixes)
+        self.batch = batch or andbug.config.g_Prefetch_Batch
+        self.idle = andbug.config.g_Prefetch_Idle if idle is None else idle
+        self.stopped = threading.Event()
+        self.done = False
+        self.classes = 0
+        self.methods = 0
+        self.requests = 0
+        self.failures = 0
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        self.sess.conn.setPriority(andbug.proto.PREFETCH)
+        try:
+            self.prefetch()
+        except Exception as exc:
+            log.error("study", "prefetch: stopped, %s" % exc)
+        self.done = True
+
+    def yieldTo(self):
+        'waits until interactive traffic stops; false once the prefetcher is stopped'
+        conn = self.sess.conn
+        while not conn.quiet(self.idle):
+            if self.stopped.wait(self.idle):
+                return False
+        return not self.stopped.is_set()
+
+    def send(self, jobs):
+        '''
+        sends (code, data, func) jobs in pipelined batches, calling func(buf)
+        for each response; requests the VM refuses, such as the variable
+        table of a native method, are counted and skipped.
+        '''
+        conn = self.sess.conn
+        timeout = andbug.vm.g_jdwp_request_timeout
+        for i in range(0, len(jobs), self.batch):
+            if not self.yieldTo():
+                return False
+            part = jobs[i:i + self.batch]
+            res = conn.requestMany(((code, data) for code, data, func in part), timeout)
+            for job, (code, buf) in zip(part, res):
+                self.requests += 1
+                if code == 0:
+                    job[2](buf)
+                else:
+                    self.failures += 1
+        return True
+
+    def prefetch(self):
+        'loads the method tables, then the line and variable tables'
+        sess = self.sess
+        table = sess.classTable
+        index = sess.classIndex
+        classes = []
+        for prefix in self.prefixes:
+            classes.extend(table[row] for row in index.prefix(prefix))
+        self.classes = len(classes)
+
+        if not self.send(list(
+            (0x020F, c.typeRequest(), c.unpackMethods)
+            for c in classes if not loaded(c, 'methodList')
+        )):
+            return
+
+        jobs = []
+        for c in classes:
+            for m in c.methodList:
+                self.methods += 1
+                if m.abstract:
+                    continue
+                if not loaded(m, 'lineTable') and not m.loadCachedLines():
+                    jobs.append((0x0601, m.methodRequest(), m.unpackLineTable))
+                if not loaded(m, 'slots') and not m.loadCachedSlots():
+                    jobs.append((0x0605, m.methodRequest(), m.unpackSlotTable))
+        self.send(jobs)
+
+def start(sess, prefixes=None):
+    '''
+    starts prefetching the classes under prefixes, g_Prefetch_Prefixes by
+    default; returns the Prefetcher, or None if there is nothing to prefetch.
+    '''
+    if prefixes is None:
+        prefixes = andbug.config.g_Prefetch_Prefixes
+    if not prefixes:
+        return None
+    worker = Prefetcher(sess, prefixes)
+    sess.prefetchers.append(worker)
+    worker.start()
+    return worker
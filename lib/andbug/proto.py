@@ -23,8 +23,9 @@ background and a number of mutexes to control contests for output.
 #将JDWP 抽象成一系列“请求/响应”
 
 
-import socket, tempfile
-from threading import Thread, Lock
+import socket, tempfile, struct
+from threading import Thread, Lock, Condition, local
+from time import time
 from Queue import Queue, Empty as EmptyQueue
 
 
@@ -49,6 +50,88 @@ class HandshakeError(Exception):
 class ProtocolError(Exception):
     pass
 
+class DdmError(Exception):
+    'signals that the VM refused a DDM chunk, or did not answer it'
+    def __init__(self, code, msg=''):
+        Exception.__init__(self, 'DDM error %s %s' % (code, msg))
+        self.code = code
+        self.msg = msg
+
+## DDM, the Dalvik Debug Monitor protocol, is carried over JDWP in packets
+## of the DDM command set (0xC7), each holding chunks of a 4 character type,
+## a big endian length and a payload.  The debugger sends chunks as
+## requests and receives chunks in their replies; the VM also sends chunks
+## of its own, such as thread and heap updates, as requests of the same
+## command, which the debugger does not answer.
+
+DDM_CHUNK = 0xC701 # DDM command set (0xC7), Chunk command (1)
+CHUNK_HEADER = struct.Struct('>4sI')
+
+def pack_chunk(kind, data=''):
+    'packs a DDM chunk of kind, e.g. HELO or MPSS, around data'
+    return CHUNK_HEADER.pack(kind, len(data)) + data
+
+def unpack_chunks(data):
+    'returns the (kind, payload) of each DDM chunk in data, a packet body'
+    chunks = []
+    ofs = 0
+    while ofs + CHUNK_HEADER.size <= len(data):
+        kind, size = CHUNK_HEADER.unpack_from(data, ofs)
+        ofs += CHUNK_HEADER.size
+        if ofs + size > len(data):
+            raise ProtocolError('truncated DDM chunk %s' % kind)
+        chunks.append((kind, data[ofs:ofs + size]))
+        ofs += size
+    return chunks
+
+def unpack_fail(data):
+    'returns the error code and message of the payload of a FAIL chunk'
+    code, ct = struct.unpack_from('>iI', data)
+    msg = data[8:8 + 2 * ct].decode('utf-16-be', 'replace')
+    return code, msg
+
+class ChunkRouter(object):
+    '''
+    puts the payload of each DDM chunk the VM sends into the channels, such
+    as Queues, subscribed to its kind; see Connection.subscribe.  it is run
+    by the i/o thread of the connection, so channels must not block.
+    '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.subscribers = {} # kind -> [chan, ...]
+
+    def subscribe(self, kind, chan):
+        with self.lock:
+            self.subscribers.setdefault(kind, []).append(chan)
+
+    def unsubscribe(self, kind, chan):
+        with self.lock:
+            chans = self.subscribers.get(kind, [])
+            if chan in chans:
+                chans.remove(chan)
+
+    def put(self, item):
+        ident, buf = item
+        for kind, payload in unpack_chunks(buf.data()):
+            with self.lock:
+                chans = list(self.subscribers.get(kind, ()))
+            for chan in chans:
+                chan.put(payload)
+
+# request priorities, highest first; see Connection.setPriority
+INTERACTIVE = 0   # shell commands, navi and anything not marked otherwise
+CAPTURE = 1       # hook callbacks, run by the session event thread
+PREFETCH = 2      # background metadata loading
+PRIORITIES = (INTERACTIVE, CAPTURE, PREFETCH)
+
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', CAPTURE: 'capture', PREFETCH: 'prefetch'}
+
+# initial requests of each priority the VM may have in flight at once; None
+# is unbounded.  the VM answers one command at a time, so a small window for
+# bulk work bounds how long an interactive request queues behind it.
+WINDOWS = {INTERACTIVE: None, CAPTURE: 16, PREFETCH: 4}
+
 HANDSHAKE_MSG = 'JDWP-Handshake'
 HEADER_FORMAT = '4412'
 IDSZ_REQ = (
@@ -113,6 +196,62 @@ def connect(addr, portno = None, trace=False):
     p.start()
     return p
 
+class Flow(object):
+    '''
+    the in-flight window of one request priority and its statistics.  the
+    window grows by one request per window of responses answered within
+    target seconds, and halves, at most once per round trip, when one takes
+    longer; latency beyond target means the requests are queueing in adb or
+    in the VM rather than being served.
+    '''
+
+    def __init__(self, size=None, low=1, high=64, target=0.25):
+        self.size = None if size is None else float(size)
+        self.low = low
+        self.high = high
+        self.target = target
+        self.cut = 0       # when the window last halved
+        self.sent = 0
+        self.answered = 0
+        self.queued = 0.0  # seconds requests waited to be admitted, summed
+        self.maxQueued = 0.0
+        self.latency = 0.0 # seconds from write to response, summed
+        self.maxLatency = 0.0
+
+    def limit(self):
+        'the requests that may be in flight, or None if unbounded'
+        return None if self.size is None else int(self.size)
+
+    def admitted(self, delay):
+        self.sent += 1
+        self.queued += delay
+        self.maxQueued = max(self.maxQueued, delay)
+
+    def respond(self, latency, now):
+        'accounts for a response that took latency seconds, and resizes the window'
+        self.answered += 1
+        self.latency += latency
+        self.maxLatency = max(self.maxLatency, latency)
+        if self.size is None:
+            return
+        if latency > self.target:
+            if now - self.cut >= latency:
+                self.size = max(float(self.low), self.size / 2)
+                self.cut = now
+        else:
+            self.size = min(float(self.high), self.size + 1 / self.size)
+
+    def stats(self):
+        return {
+            'window': self.limit(),
+            'sent': self.sent,
+            'answered': self.answered,
+            'queued': self.queued / self.sent if self.sent else 0.0,
+            'maxQueued': self.maxQueued,
+            'latency': self.latency / self.answered if self.answered else 0.0,
+            'maxLatency': self.maxLatency,
+        }
+
 class Connection(Thread):
     '''
     The JDWP Connection is a thread which abstracts the asynchronous[异步] JDWP protocol
@@ -127,6 +266,9 @@ class Connection(Thread):
     will be dispatched based on whether they are responses to a previous request,
     or events.  Responses to requests will cause the requesting thread to be
     unblocked, thus simulating a synchronous request.
+
+    Each request is admitted before it is written, by the priority of its
+    thread and the in-flight window of that priority; see admit and Flow.
     '''
 
     def __init__(self, read, write):
@@ -141,6 +283,21 @@ class Connection(Thread):
         self.qmap = {}   #初始化一个空的字典
         self.rmap = {}   #初始化一个空的字典
         self.xmitlock = Lock()  #是一个互斥锁
+        # the request scheduler; see admit and release
+        self.local = local()      # per thread: priority
+        self.sched = Condition(Lock())
+        self.flows = dict((p, Flow(WINDOWS[p])) for p in PRIORITIES)
+        self.inflight = dict((p, 0) for p in PRIORITIES)
+        self.waiting = dict((p, 0) for p in PRIORITIES)
+        self.pending = {}         # ident -> (priority, written), for requests in flight
+        self.abandoned = set()    # idents of requests whose wait timed out; see abandon
+        self.peeks = {}           # code -> func; see peek
+        self.peeking = {}         # ident -> func, for the requests in flight that are peeked
+        self.lastInteractive = 0  # when an interactive request was last sent or answered
+        self.closed = False
+        # chunks the VM sends unasked; see subscribe
+        self.chunks = ChunkRouter()
+        self.hook(DDM_CHUNK, self.chunks)
 
     #读数据的函数，sz准备读取数据的长度，
     def read(self, sz):
@@ -246,6 +403,11 @@ class Connection(Thread):
         'internal to the i/o thread w/ recv ctrl; processes incoming response'
         log.debug("study", "In Connection.processResponse ident=" + str(ident) + "\t code=" + str(code) + "\t data=")
         chan = self.qmap.pop(ident, None) #从字典中读取，并删除该数据
+        if not self.release(ident):
+            return # nobody waits for it any more
+        func = self.peeking.pop(ident, None)
+        if func is not None and code == 0:
+            func(data)
         if not chan: return
         buf = JdwpBuffer()
         buf.config(*self.sizes)
@@ -264,6 +426,15 @@ class Connection(Thread):
             self.bindqueue.put(('r', code, chan)) #加入一个先进先出的队列
             log.debug("study", "++ for hook function bindqueue.put  FOR r ++ code=" + str(code))
         
+    def peek(self, code, func):
+        '''
+        calls func, on the i/o thread, with the data of every successful
+        response to a request of code, before the response is delivered and
+        before any packet that follows it is processed.
+        '''
+        with self.xmitlock:
+            self.peeks[code] = func
+
     ####################################################### TRANSMITTING PACKETS
     
 	#申请一个请求id
@@ -288,20 +459,190 @@ class Connection(Thread):
 	#构造请求
     def request(self, code, data='', timeout=None):
         'send a request, then waits for a response; returns response'
-        queue = Queue()
         log.debug("study", "In Connection.request code=" + str(code) + "\t data=" + str(data))
+        queue = self.send(code, data)
+        log.debug("study", "wait_code:" + str(code))
+        return self.wait(queue, timeout)  #向虚拟机发出指令后一直处于等待状态，知道queue队列中出现返回信息，接下来处理
+
+    def setPriority(self, priority):
+        'sets the priority of the requests sent by the calling thread'
+        self.local.priority = priority
+
+    def getPriority(self):
+        return getattr(self.local, 'priority', INTERACTIVE)
+
+    def admissible(self, priority):
+        'must hold sched; true if a request of priority may be written now'
+        if self.closed:
+            return True
+        for p in PRIORITIES[:priority]:
+            if self.waiting[p]:
+                return False
+        window = self.flows[priority].limit()
+        return window is None or self.inflight[priority] < window
+
+    def configure(self, priority=None, **params):
+        '''
+        sets the size, low, high or target of the flow of priority, or of
+        every bounded flow if priority is None; see Flow.
+        '''
+        with self.sched:
+            for p in PRIORITIES if priority is None else (priority,):
+                flow = self.flows[p]
+                for k, v in params.items():
+                    if k == 'size':
+                        v = None if v is None else float(v)
+                    elif flow.size is None and priority is None:
+                        continue
+                    setattr(flow, k, v)
+            self.sched.notify_all()
+
+    def stats(self):
+        'returns the Flow statistics of each priority, by priority name'
+        with self.sched:
+            res = {}
+            for p in PRIORITIES:
+                res[PRIORITY_NAMES[p]] = stats = self.flows[p].stats()
+                stats['inflight'] = self.inflight[p]
+                stats['waiting'] = self.waiting[p]
+            return res
+
+    def admit(self, priority):
+        '''
+        blocks until a request of priority may be written: its window has
+        room and no request of a higher priority is waiting; returns the
+        ident the request is to be written with.
+        '''
+        queued = time()
+        with self.sched:
+            self.waiting[priority] += 1
+            while not self.admissible(priority):
+                self.sched.wait()
+            self.waiting[priority] -= 1
+            self.inflight[priority] += 1
+            with self.xmitlock:
+                ident = self.acquireIdent()
+            now = time()
+            self.flows[priority].admitted(now - queued)
+            self.pending[ident] = (priority, now)
+            if priority == INTERACTIVE:
+                self.lastInteractive = now
+            # lower priorities may have been held back by this one
+            self.sched.notify_all()
+            return ident
+
+    def release(self, ident):
+        '''
+        called by the i/o thread when the response for ident arrives; false
+        if its request was abandoned, and the response is to be dropped.
+        '''
+        with self.sched:
+            if ident in self.abandoned:
+                self.abandoned.discard(ident)
+                return False
+            req = self.pending.pop(ident, None)
+            if req is None:
+                return True
+            priority, written = req
+            now = time()
+            self.inflight[priority] -= 1
+            self.flows[priority].respond(now - written, now)
+            if priority == INTERACTIVE:
+                self.lastInteractive = now
+            self.sched.notify_all()
+            return True
+
+    def abandon(self, ident):
+        '''
+        called when the wait for the response to ident times out: frees its
+        slot in the window, counting the wait as its latency, so a response
+        that never comes does not hold the slot for good.  false if the
+        response was released first, and is on its way.
+        '''
+        with self.sched:
+            req = self.pending.pop(ident, None)
+            if req is None:
+                return False
+            self.abandoned.add(ident)
+            self.peeking.pop(ident, None)
+            priority, written = req
+            now = time()
+            self.inflight[priority] -= 1
+            self.flows[priority].respond(now - written, now)
+            self.sched.notify_all()
+            return True
+
+    def quiet(self, idle):
+        'true if no interactive request is queued, in flight, or was in the last idle seconds'
+        with self.sched:
+            return (not self.waiting[INTERACTIVE] and not self.inflight[INTERACTIVE]
+                    and time() - self.lastInteractive >= idle)
+
+    def write_request(self, code, data, priority):
+        'admits, then writes a request; returns the queue its response is put in'
+        queue = Queue()
+        queue.ident = ident = self.admit(priority)
         with self.xmitlock:
-            ident = self.acquireIdent()
             self.bindqueue.put(('q', ident, queue)) #每发送一个请求向bindqueue中压入一个数据
             log.debug("study", "++bindqueue.put  FOR q ++")
+            func = self.peeks.get(code)
+            if func is not None:
+                self.peeking[ident] = func
             self.writeContent(ident, 0x0, code, data)
-        
+        return queue
+
+    def send(self, code, data=''):
+        'send a request without waiting; returns the queue the response is put in'
+        return self.write_request(code, data, self.getPriority())
+
+    def wait(self, queue, timeout=None):
+        'waits for the response to a sent request; returns (None, None) on timeout'
         try:
-            log.debug("study", "wait_code:" + str(code))
-            return queue.get(1, timeout)  #向虚拟机发出指令后一直处于等待状态，知道queue队列中出现返回信息，接下来处理
+            return queue.get(1, timeout)
         except EmptyQueue:
+            if not self.abandon(queue.ident):
+                # it arrived just as the wait ran out
+                return queue.get()
             return None, None
 
+    def requestMany(self, requests, timeout=None):
+        '''
+        sends each (code, data) request back to back, without waiting on the
+        responses in between, then returns the (code, buf) responses in order.
+        the VM answers them while later ones are still in flight, so a batch
+        costs about one round trip instead of one per request.  a batch
+        larger than the window of its priority is written as the responses
+        to its first requests free the window.
+        '''
+        priority = self.getPriority()
+        queues = list(self.write_request(code, data, priority) for code, data in requests)
+        log.debug("study", "In Connection.requestMany count=" + str(len(queues)))
+        return list(self.wait(queue, timeout) for queue in queues)
+
+    def ddm(self, kind, data='', timeout=None):
+        '''
+        sends a DDM chunk of kind, waits for the reply, and returns the
+        (kind, payload) of the chunks in it; raises DdmError if the VM sent
+        a FAIL chunk, refused the packet, or did not answer in time.
+        '''
+        code, buf = self.request(DDM_CHUNK, pack_chunk(kind, data), timeout)
+        if code is None:
+            raise DdmError(None, 'no reply to %s' % kind)
+        if code != 0:
+            raise DdmError(code)
+        chunks = unpack_chunks(buf.data())
+        for reply, payload in chunks:
+            if reply == 'FAIL':
+                raise DdmError(*unpack_fail(payload))
+        return chunks
+
+    def subscribe(self, kind, chan):
+        'puts the payload of each DDM chunk of kind the VM sends in chan'
+        self.chunks.subscribe(kind, chan)
+
+    def unsubscribe(self, kind, chan):
+        self.chunks.unsubscribe(kind, chan)
+
     def buffer(self):
         'returns a JdwpBuffer configured for this connection'
         buf = JdwpBuffer()
@@ -329,5 +670,9 @@ class Connection(Thread):
             while True:
                 self.process()
         except EOF:
+            # nothing will be answered any more; let blocked senders through
+            with self.sched:
+                self.closed = True
+                self.sched.notify_all()
             return
     
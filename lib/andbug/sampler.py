@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under
+## the terms of version 3 of the GNU Lesser General Public License as
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The andbug.sampler module profiles a process by sampling the stacks of its
+threads at a fixed rate, and folds the samples into the format flame graph
+tools read: one line per distinct stack, its frames from the thread down to
+the innermost method separated by semicolons, then the number of samples.
+
+Each sample suspends the VM, asks for the innermost frames of every sampled
+thread, at most g_Profile_Depth of them, in one pipelined batch, and
+resumes it; everything else, listing the threads and naming the methods, is
+done while the VM runs.  Stacks deeper than that are folded from their
+innermost frames only.
+'''
+
+import threading
+from time import time
+import andbug.config, andbug.proto, andbug.stats, andbug.vm, andbug.counting
+from andbug import log
+
+def frame_name(method):
+    'names a method the way folded stacks do, without semicolons'
+    jni = method.klass.jni
+    if jni.startswith('L') and jni.endswith(';'):
+        jni = jni[1:-1]
+    return jni.replace('/', '.') + '.' + method.name
+
+class Sampler(threading.Thread):
+    '''
+    samples the top depth frames of the threads of sess, or of the threads
+    given, rate times a second from when it is started until stopped; see
+    the module documentation.
+    '''
+
+    def __init__(self, sess, rate=None, threads=None, depth=None):
+        threading.Thread.__init__(self, name='Sampler')
+        self.daemon = True
+        self.sess = sess
+        self.rate = rate or andbug.config.g_Profile_Rate
+        self.depth = depth or andbug.config.g_Profile_Depth
+        self.threads = threads
+        self.folded = {}  # (thread name, frame names, outermost first) -> samples
+        self.names = {}   # (type id, method id) -> frame name
+        self.threadName = andbug.counting.thread_names(sess)
+        self.pauses = andbug.stats.Histogram()
+        self.samples = 0
+        self.failures = 0
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def run(self):
+        # the VM is suspended while a sample is in flight
+        self.sess.conn.setPriority(andbug.proto.CAPTURE)
+        interval = 1.0 / self.rate
+        while not self.stopped.is_set():
+            started = time()
+            try:
+                self.sample()
+            except Exception as exc:
+                self.failures += 1
+                log.error("study", "sampler: could not take a sample, %s" % exc)
+            self.stopped.wait(max(0, interval - (time() - started)))
+
+    def sample(self):
+        sess = self.sess
+        threads = self.threads
+        if threads is None:
+            threads = list(sess.threads())
+
+        paused = time()
+        sess.suspend()
+        try:
+            stacks = sess.pipeline((
+                (0x0B06, t.framesRequest(0, self.depth), t.unpackFrames) for t in threads
+            ), errors=True)
+            # 503 INVALID_INDEX / 504 INVALID_LENGTH: the stack is not that
+            # deep, so it is small enough to fetch whole; see FrameSequence
+            short = list(
+                i for i, frames in enumerate(stacks)
+                if isinstance(frames, andbug.vm.RequestError) and frames.code in (503, 504)
+            )
+            whole = sess.pipeline((
+                (0x0B06, threads[i].framesRequest(), threads[i].unpackFrames) for i in short
+            ), errors=True)
+            for i, frames in zip(short, whole):
+                stacks[i] = frames
+        finally:
+            sess.resume()
+            self.pauses.add(time() - paused)
+
+        for t, frames in zip(threads, stacks):
+            if isinstance(frames, andbug.vm.RequestError):
+                continue # the thread ended since it was listed
+            key = (self.threadName(t.tid), tuple(
+                self.name(f.loc) for f in reversed(frames)
+            ))
+            self.folded[key] = self.folded.get(key, 0) + 1
+        self.samples += 1
+
+    def name(self, loc):
+        key = (loc.tid, loc.mid)
+        name = self.names.get(key)
+        if name is None:
+            try:
+                name = frame_name(loc.method)
+            except andbug.vm.RequestError:
+                name = '<unknown>'
+            self.names[key] = name
+        return name
+
+    def lines(self):
+        'yields the folded stacks sampled so far, one line each'
+        for (thread, frames), count in sorted(self.folded.items()):
+            yield '%s %d\n' % (';'.join((thread.replace(';', ':'),) + frames), count)
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            f.writelines(self.lines())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under
+## the terms of version 3 of the GNU Lesser General Public License as
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The andbug.sink module writes records as NDJSON, one JSON object per line,
+from a thread of its own, so that the thread producing them, typically the
+session event thread handling a hook, only pays for a queue put.
+
+Records are serialized by the sink thread; a record may be a callable that
+returns the dict to write, so building it can be deferred there as well.
+Queued records are written and flushed in batches.  The file may be gzip
+compressed, and rotated once a given number of bytes was written to it.
+'''
+
+import os, os.path, gzip, json, threading
+from Queue import Queue, Empty as EmptyQueue, Full as FullQueue
+import andbug.config
+from andbug import log
+
+CLOSE = object() # queued by close
+
+class Sink(threading.Thread):
+    '''
+    an NDJSON file fed through a queue; see the module documentation.
+    records put while the queue is full are dropped and counted, rather
+    than stalling the producer.
+    '''
+
+    def __init__(self, path, compress=None, rotate=None, keep=None,
+                 batch=None, flush=None, limit=None, append=True):
+        threading.Thread.__init__(self, name='Sink')
+        self.daemon = True
+        cfg = andbug.config
+        self.path = path
+        self.compress = path.endswith('.gz') if compress is None else compress
+        self.rotate = cfg.g_Sink_Rotate if rotate is None else rotate
+        self.keep = cfg.g_Sink_Keep if keep is None else keep
+        self.batch = batch or cfg.g_Sink_Batch
+        self.flush = cfg.g_Sink_Flush if flush is None else flush
+        self.queue = Queue(limit or cfg.g_Sink_Queue)
+        self.append = append
+        self.file = None
+        self.size = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.start()
+
+    def put(self, record):
+        'queues a record, a dict or a callable returning one; never blocks'
+        try:
+            self.queue.put(record, False)
+        except FullQueue:
+            self.dropped += 1
+
+    def close(self):
+        'writes what is queued, then closes the file'
+        self.queue.put(CLOSE)
+        self.join()
+
+    def open(self, mode='ab'):
+        if self.compress:
+            self.file = gzip.open(self.path, mode)
+        else:
+            self.file = open(self.path, mode)
+        self.size = 0
+
+    def roll(self):
+        'rotates path to path.1, path.1 to path.2 and so on, dropping path.<keep>'
+        self.file.close()
+        base, ext = self.path, ''
+        if self.compress and base.endswith('.gz'):
+            base, ext = base[:-3], '.gz'
+        names = [self.path] + list('%s.%d%s' % (base, i, ext) for i in range(1, self.keep + 1))
+        if os.path.exists(names[-1]):
+            os.remove(names[-1])
+        for i in range(len(names) - 2, -1, -1):
+            if os.path.exists(names[i]):
+                os.rename(names[i], names[i + 1])
+        self.open()
+
+    def encode(self, record):
+        if callable(record):
+            record = record()
+        return json.dumps(record, default=str) + '\n'
+
+    def run(self):
+        self.open('ab' if self.append else 'wb')
+        closing = False
+        while not closing:
+            try:
+                records = [self.queue.get(True, self.flush)]
+            except EmptyQueue:
+                continue
+            while len(records) < self.batch:
+                try:
+                    records.append(self.queue.get(False))
+                except EmptyQueue:
+                    break
+            lines = []
+            for record in records:
+                if record is CLOSE:
+                    closing = True
+                    continue
+                try:
+                    lines.append(self.encode(record))
+                except Exception as exc:
+                    self.failed += 1
+                    log.error("study", "sink: could not serialize a record, %s" % exc)
+            if lines:
+                self.write(''.join(lines), len(lines))
+        self.file.close()
+
+    def write(self, data, count):
+        if self.rotate and self.size and self.size + len(data) > self.rotate:
+            self.roll()
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data)
+        self.written += count
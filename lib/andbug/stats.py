@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under
+## the terms of version 3 of the GNU Lesser General Public License as
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The andbug.stats module keeps compact aggregates of method durations.
+
+A Histogram counts values in logarithmic buckets, each 2^(1/8) wider than
+the one before it, so that its size grows with the range of the values
+rather than their number, and its quantiles are within 9% of the truth.
+Latency pairs the METHOD_ENTRY and METHOD_EXIT events of the requests set
+by Session.countMany, by thread, into a Histogram per method.  The requests
+are set on classes, and events of the methods not watched are ignored: a
+METHOD_EXIT happens at the returning instruction, which a LocationOnly
+request on the first location of a method never matches.
+
+Durations are measured when the session event thread handles the events,
+not when the VM posts them, so they include the transport's jitter.
+'''
+
+import threading
+from math import log, floor
+from time import time
+
+GROWTH = 2 ** 0.125 # the ratio of the bounds of a bucket
+LOG_GROWTH = log(GROWTH)
+
+class Histogram(object):
+    'counts values, in seconds, in logarithmic buckets; see the module documentation'
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = {} # bucket index -> values in it; 0 and below in None
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        if value > 0:
+            idx = int(floor(log(value) / LOG_GROWTH))
+        else:
+            idx = None
+        self.buckets[idx] = self.buckets.get(idx, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        'the upper bound of the bucket holding the q quantile, at most max'
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= rank:
+                if idx is None:
+                    return 0.0
+                return min(GROWTH ** (idx + 1), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+class Latency(object):
+    '''
+    the durations of the methods watched, from the entry and exit events of
+    the requests set on their classes by Session.countMany; entries are kept
+    on a stack per thread, and an exit closes the latest entry of its method.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.origins = {}    # rid -> eventKind
+        self.methods = {}    # (type id, method id) -> Method, for those watched
+        self.classes = set() # type ids of the classes with requests set
+        self.stacks = {}     # tid -> [(method, entry time), ...]
+        self.histograms = {} # method -> Histogram
+        self.unmatched = 0   # exits without an entry, or entries never exited
+
+    def watch(self, methods):
+        'times methods, once requests are set on their classes'
+        for m in methods:
+            self.methods[(m.tid, m.mid)] = m
+
+    def add(self, rid, klass, kind):
+        self.origins[rid] = kind
+
+    def hit(self, rid, tid, ctid, mid, now=None):
+        method = self.methods.get((ctid, mid))
+        if method is None:
+            return # another method of a watched class
+        kind = self.origins[rid]
+        if now is None:
+            now = time()
+        with self.lock:
+            stack = self.stacks.setdefault(tid, [])
+            if kind == 40: # METHOD_ENTRY
+                stack.append((method, now))
+                return
+            # METHOD_EXIT: entries above the method's own were left without
+            # an exit, say by an exception, and are dropped
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i][0] == method:
+                    break
+            else:
+                self.unmatched += 1
+                return
+            self.unmatched += len(stack) - 1 - i
+            entered = stack[i][1]
+            del stack[i:]
+            hist = self.histograms.get(method)
+            if hist is None:
+                hist = self.histograms[method] = Histogram()
+            hist.add(now - entered)
+
+    def rows(self):
+        '''
+        returns (method, count, p50, p95, p99, max) for each method timed,
+        slowest p99 first.
+        '''
+        with self.lock:
+            rows = list(
+                (m, h.count, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99), h.max)
+                for m, h in self.histograms.items()
+            )
+        rows.sort(key=lambda row: row[4], reverse=True)
+        return rows
+
+    def reset(self):
+        with self.lock:
+            self.stacks = {}
+            self.histograms = {}
+            self.unmatched = 0
@@ -17,17 +17,30 @@
 
 
 import threading, re
-from andbug.data import defer
+from andbug.data import defer, deferred, loaded
 from threading import Lock
 from Queue import Queue
+from array import array
 import json
 
 
 import andbug #andbug.data, andbug.proto, andbug.screed
+import andbug.index
+import andbug.config
+import andbug.graph
+import andbug.cache
+import andbug.dex
+import andbug.prefetch
 from andbug import log
 import traceback
 
 g_jdwp_request_timeout =5
+g_pool_location_limit = 1 << 16
+g_pool_method_limit = 1 << 15
+g_pool_string_limit = 1 << 14
+g_frame_page = 16
+g_array_window = 512   # items per ArrayReference.GetValues when iterating
+g_array_preview = 64   # items shown by repr, str and navi
 
 ## Implementation Questions:
 ## -- unpackFrom methods are used to unpack references to an element from
@@ -49,7 +62,21 @@ class RequestError(Exception):
         Exception.__init__(self, 'request failed, code %s' % code)
         self.code = code
 
+def index_by_name(seq):
+    'maps the name of each item in seq to (position, item); the first wins'
+    idx = {}
+    for i in range(len(seq)):
+        idx.setdefault(seq[i].name, (i, seq[i]))
+    return idx
+
+## -- Elements declare __slots__; large sessions pool hundreds of thousands of
+##    Locations, Methods and Slots, and a __dict__ per instance dominates
+##    their footprint.  Deferred properties live in the slots named by
+##    andbug.data.deferred.
+
 class Element(object):
+    __slots__ = ()
+
     def __repr__(self):  #以打印方式，输出字符串
         return '<%s>' % self
 
@@ -57,6 +84,8 @@ class Element(object):
         return '%s:%s' % (type(self).__name__, id(self))
 
 class SessionElement(Element):
+    __slots__ = ('sess',)
+
     def __init__(self, sess):
         self.sess = sess
 
@@ -67,6 +96,8 @@ class SessionElement(Element):
     
 #主要是指类的成员变量
 class Field(SessionElement):
+    __slots__ = ('fid', 'name', 'jni', 'gen', 'flags')
+
     def __init__(self, session, fid):
         SessionElement.__init__(self, session)
         self.fid = fid
@@ -143,6 +174,8 @@ class Field(SessionElement):
             
     
 class Value(SessionElement):
+    __slots__ = ()
+
     @property
     def isPrimitive(self):
         return self.TAG in PRIMITIVE_TAGS
@@ -152,6 +185,8 @@ class Value(SessionElement):
         return self.TAG in OBJECT_TAGS
 
 class Frame(SessionElement):
+    __slots__ = ('fid', 'loc', 'tid', '__weakref__')
+
     def __init__(self, sess, fid):
         SessionElement.__init__(self, sess)
         self.fid = fid
@@ -172,22 +207,38 @@ class Frame(SessionElement):
     def native(self):
         return self.loc.native
 
+    @property
+    def thread(self):
+        return self.sess.pool(Thread, self.sess, self.tid)
+
     @property
     def values(self):
+        '''
+        the values of the live slots of this frame, memoized for as long as
+        the owning thread stays suspended; see Thread.memo.
+        '''
+        return self.thread.memo(('values', self.fid), self.load_values)
+
+    def load_values(self):
         '''
         1、命令  0x0a 0x01
         2、注释：堆栈命令集
         3、[StackFrame Command Set (16)][GetValues Command (1)]
         '''
-        vals = {}
-        if self.native: return vals  #如果是系统函数返回空
-        
-        sess = self.sess
-        conn = self.conn
-        buf = conn.buffer()
+        if self.native: return {}  #如果是系统函数返回空
+
+        slots = self.loc.slots
+        log.debug("study", "call jdwp 0x10 01")
+        code, buf = self.conn.request(0x1001, self.valuesRequest(slots), g_jdwp_request_timeout)
+        if code != 0:
+            raise RequestError(code)
+        return self.unpackValues(slots, buf)
+
+    def valuesRequest(self, slots):
+        'packs a StackFrame.GetValues request for slots'
+        buf = self.conn.buffer()
         buf.packObjectId(self.tid)  #thread id
         buf.packFrameId(self.fid) #frame id
-        slots = self.loc.slots  
         log.debug("study", "In frame thread_id=" + str(self.tid))
         log.debug("study", "In frame frame_id=" + str(self.fid))
         log.debug("study", "In frame len(slots)=" + str(len(slots)))
@@ -198,43 +249,43 @@ class Frame(SessionElement):
             buf.packU8(slot.tag) #TODO: GENERICS  #A tag identifying the type of the variable  标志变量类型的标签
             log.debug("study", "In frame slot.index=" + str(slot.index))
             log.debug("study", "In frame slot.tag=" + str(slot.tag))
-            
-        log.debug("study", "call jdwp 0x10 01")
-        code, buf = conn.request(0x1001, buf.data(), g_jdwp_request_timeout)
-        if code != 0:
-            raise RequestError(code)
+        return buf.data()
+
+    def unpackValues(self, slots, buf):
+        'unpacks the response to valuesRequest into a name -> value dict'
+        sess = self.sess
+        vals = {}
         ct = buf.unpackInt()
 
         for x in range(0, ct):
             s = slots[x]
             vals[s.name] = unpack_value(sess, buf) #The number of values retrieved, always equal to slots, the number of values to get. 
 
-            log.debug("study", "In frame vals[%s]= %s"%(s.name, vals[s.name]))
-            log.debug("study", "In frame date for String= %s"%(buf))
+            # never str() a value here: for objects that costs a round trip
+            log.debug("study", "In frame vals[%s]= %s"%(s.name, type(vals[s.name]).__name__))
         return vals
 
     def value(self, name):
         if self.native: return None
 
+        vals = self.thread.cached(('values', self.fid))
+        if vals is not None:
+            return vals.get(name)
+        return self.thread.memo(
+            ('value', self.fid, name), lambda: self.load_value(name)
+        )
+
+    def load_value(self, name):
+        ent = self.loc.slot(name)
+        if ent is None:
+            return None
+        slot = ent[1]
         sess = self.sess
         conn = self.conn
         buf = conn.buffer()
         buf.packObjectId(self.tid)
         buf.packFrameId(self.fid)
-        slots = self.loc.slots
         buf.packInt(1)
-
-        loc = None
-        for i in range(0, len(slots)):
-            if slots[i].name == name:
-                loc = i
-                break
-            else:
-                continue
-
-        if loc is None:
-            return None
-        slot = slots[loc]
         buf.packInt(slot.index)
         buf.packU8(slot.tag) #TODO: GENERICS
 
@@ -249,28 +300,22 @@ class Frame(SessionElement):
     def setValue(self, name, value):
         if self.native: return False
 
+        ent = self.loc.slot(name)
+        if ent is None:
+            return False
+        slot = ent[1]
         sess = self.sess
         conn = self.conn
         buf = conn.buffer()
         buf.packObjectId(self.tid)
         buf.packFrameId(self.fid)
-        slots = self.loc.slots
         buf.packInt(1)
-
-        loc = None
-        for i in range(0, len(slots)):
-            if slots[i].name == name:
-                loc = i
-                break
-            else:
-                continue
-
-        if loc is None:
-            return False
-        slot = slots[loc]
         buf.packInt(slot.index)
         pack_value(sess, buf, value, slot.jni) #TODO: GENERICS
 
+        thread = self.thread
+        thread.forget(('values', self.fid))
+        thread.forget(('value', self.fid, name))
         code, buf = conn.request(0x1002, buf.data())
         if code != 0:
             raise RequestError(code)
@@ -279,9 +324,13 @@ class Frame(SessionElement):
 
 class Thread(SessionElement):
     #TODO: promote to Value
+    __slots__ = ('tid', 'epoch', '_memo')
+
     def __init__(self, sess, tid):
         SessionElement.__init__(self, sess)
         self.tid = tid
+        self.epoch = 0
+        self._memo = None
     
     def __str__(self):
         tStatus, sStatus = self.status
@@ -293,6 +342,7 @@ class Thread(SessionElement):
         2、用于暂停单个线程。
         
         '''
+        self.invalidate()
         conn = self.conn
         buf = conn.buffer()
         buf.packObjectId(self.tid)
@@ -306,6 +356,7 @@ class Thread(SessionElement):
             1、命令是0x0b 0x03 重新启动线程  [ThreadReference Command Set (11)][Resume Command (3)]
             2、启动之前的线程
         '''
+        self.invalidate()
         conn = self.conn
         buf = conn.buffer()
         buf.packObjectId(self.tid)
@@ -315,6 +366,45 @@ class Thread(SessionElement):
             raise RequestError(code)
         #add by sq.luo
         #self.sess.suspendState.resume(self.sess)
+
+    ## Frame ids, frame values and object fields are only valid while a
+    ## thread stays suspended.  Every suspend or resume of the thread, or of
+    ## the whole VM, starts a new suspension; values memoized under an older
+    ## one are never returned.
+
+    @property
+    def suspension(self):
+        'identifies the current suspension of this thread'
+        return self.epoch, self.sess.vmEpoch
+
+    def invalidate(self):
+        'starts a new suspension, dropping everything memoized for this thread'
+        self.epoch += 1
+        self.sess.epoch += 1
+        self._memo = None
+
+    def memo(self, key, func):
+        'returns func(), computed at most once per suspension of this thread'
+        memo = self._memo
+        if memo is None or memo[0] != self.suspension:
+            memo = self._memo = (self.suspension, {})
+        try:
+            return memo[1][key]
+        except KeyError:
+            val = memo[1][key] = func()
+            return val
+
+    def cached(self, key):
+        'returns the value memoized for key in this suspension, or None'
+        memo = self._memo
+        if memo is None or memo[0] != self.suspension:
+            return None
+        return memo[1].get(key)
+
+    def forget(self, key):
+        memo = self._memo
+        if memo is not None:
+            memo[1].pop(key, None)
     #add by sq.luo  
     def singleStep(self, func = None, queue = None, stepdepth = 1):
         suspendState = self.sess.suspendState
@@ -357,17 +447,82 @@ class Thread(SessionElement):
 
     @property
     def frames(self):
-        '''命令 0x0b 0x06 功能返回当前挂起线程的堆栈信息，  [ThreadReference Command Set (11)][Frames Command(6)]
         '''
-        tid = self.tid
+        the frames of this suspended thread, fetched a page at a time as they
+        are indexed or iterated, and at most once per suspension.
+        '''
+        return self.memo('frames', lambda: FrameSequence(self))
+
+    def snapshot(self, depth=None, values=True, fields_depth=0):
+        '''
+        captures the top depth frames of this suspended thread (all of them
+        if depth is None), the values of their live slots, and the fields of
+        the objects they reach, up to fields_depth references away.
+
+        each stage is a single pipelined batch -- variable tables of methods
+        not seen before, the frame values, then per level the types, field
+        lists and field values of new objects -- so a snapshot costs a few
+        round trips however many frames and objects it covers.  the results
+        prime the per-suspension memos, so f.values and obj.fields are free
+        afterwards.
+        '''
         sess = self.sess
+        frames = self.frames
+        frames = list(frames[0:depth] if depth else frames)
+        snap = Snapshot(self, frames)
+        if not values:
+            return snap
+
+        live = list(f for f in frames if not f.native)
+        cold = {}
+        for f in live:
+            method = f.loc.method
+            if not loaded(method, 'slots') and not method.loadCachedSlots():
+                cold[method.mid] = method
+        sess.pipeline(
+            (0x0605, m.methodRequest(), m.unpackSlotTable) for m in cold.values()
+        )
+
+        todo = list(f for f in live if self.cached(('values', f.fid)) is None)
+        jobs = []
+        for f in todo:
+            slots = f.loc.slots
+            jobs.append((0x1001, f.valuesRequest(slots),
+                         lambda buf, f=f, slots=slots: f.unpackValues(slots, buf)))
+        for f, vals in zip(todo, sess.pipeline(jobs)):
+            self.memo(('values', f.fid), lambda: vals)
+        snap.values = list(f.values for f in frames)
+
+        level = list(v for vals in snap.values for v in vals.values())
+        seen = list(level)
+        for i in range(fields_depth):
+            level = snap.expand(level)
+            seen.extend(level)
+            if not level:
+                break
+        sess.resolveStrings(seen)
+        return snap
+
+    def getFrames(self, start=0, length=-1):
+        '''命令 0x0b 0x06 功能返回当前挂起线程的堆栈信息，  [ThreadReference Command Set (11)][Frames Command(6)]
+        returns length frames from start; a length of -1 fetches the rest.
+        '''
         conn = self.conn  #conn是Connection类型的变量
-        buf = conn.buffer()
-        buf.pack('oii', self.tid, 0, -1) #三个参数，tid 线程id；0表示从堆栈最开始位置获取，；-1表示获取所有的堆栈信息
         log.debug("study", "call jdwp 0x0B 06")
-        code, buf = conn.request(0x0B06, buf.data(), g_jdwp_request_timeout)
+        code, buf = conn.request(0x0B06, self.framesRequest(start, length), g_jdwp_request_timeout)
         if code != 0:
             raise RequestError(code)
+        return self.unpackFrames(buf)
+
+    def framesRequest(self, start=0, length=-1):
+        'packs the ThreadReference.Frames request of getFrames'
+        #三个参数，tid 线程id；start表示从堆栈的哪个位置获取，；-1表示获取剩余的堆栈信息
+        return self.conn.buffer().pack('oii', self.tid, start, length)
+
+    def unpackFrames(self, buf):
+        'unpacks a ThreadReference.Frames response into a list of Frames'
+        tid = self.tid
+        sess = self.sess
         ct = buf.unpackInt() #堆栈信息的个数
         #这个jdwp命令返回的数据是：ct：堆栈的个数，frameID：每个堆栈的id；location：位置信息
         
@@ -377,10 +532,13 @@ class Thread(SessionElement):
             f.tid = tid #传递当前线程的id
             return f
 
-        return andbug.data.view(load_frame() for i in range(0,ct))
+        return list(load_frame() for i in range(0,ct))
 
     @property
-    def frameCount(self): 
+    def frameCount(self):
+        return self.memo('frameCount', self.load_frameCount)
+
+    def load_frameCount(self):
         '''命令: 0x0b 0x07
                                  功能 : 获取挂起线程的堆栈帧的个数
             [ThreadReference Command Set (11)][FrameCount Command (7)#]
@@ -439,10 +597,161 @@ class Thread(SessionElement):
             return "UNKNOWN"
         return szSS[sStatus]
 
+class FrameSequence(andbug.data.view):
+    '''
+    a lazy view of the frames of a suspended thread; frames are requested
+    from the VM g_frame_page at a time, only once something indexes or
+    iterates past the pages already fetched.
+    '''
+
+    def __init__(self, thread, page=None):
+        self.thread = thread
+        self.page = page or g_frame_page
+        self.loaded = []
+        self.count = None # stack depth, once known
+
+    def __repr__(self):
+        return '(' + ', '.join(str(item) for item in self.items) + ')'
+
+    def __len__(self):
+        if self.count is None:
+            self.count = self.thread.frameCount
+        return self.count
+
+    @property
+    def items(self):
+        self.fill(None)
+        return self.loaded
+
+    def fill(self, end):
+        '''
+        fetches pages until at least end frames are loaded, or the whole
+        stack when end is None.
+        '''
+        loaded = self.loaded
+        while end is None or len(loaded) < end:
+            if self.count is not None and len(loaded) >= self.count:
+                break
+            start = len(loaded)
+            length = self.page
+            if self.count is not None:
+                length = min(length, self.count - start)
+            try:
+                seq = self.thread.getFrames(start, length)
+            except RequestError, err:
+                # 503 INVALID_INDEX / 504 INVALID_LENGTH: the page runs past
+                # the bottom of the stack, so learn its depth and ask again.
+                if err.code not in (503, 504) or self.count is not None:
+                    raise
+                len(self)
+                continue
+            loaded.extend(seq)
+            if len(seq) < length:
+                self.count = len(loaded)
+                break
+        return loaded
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.start, index.stop, index.step
+            if (start or 0) < 0 or stop is None or stop < 0:
+                return self.items[index]
+            return self.fill(stop)[index]
+        if index < 0:
+            return self.items[index]
+        loaded = self.fill(index + 1)
+        if index >= len(loaded):
+            raise IndexError(index)
+        return loaded[index]
+
+    def __iter__(self):
+        i = 0
+        while True:
+            loaded = self.fill(i + 1)
+            if i >= len(loaded):
+                return
+            yield loaded[i]
+            i += 1
+
+class Snapshot(object):
+    '''
+    the top frames of a suspended thread with the values of their slots, and
+    the fields of the objects reached from them; see Thread.snapshot.
+    '''
+
+    def __init__(self, thread, frames):
+        self.thread = thread
+        self.frames = frames
+        self.values = list({} for f in frames)
+        self.objects = {} # oid -> field values
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        return iter(zip(self.frames, self.values))
+
+    def expand(self, objs):
+        '''
+        fetches the fields of the objects in objs not expanded yet, with one
+        pipelined batch per missing piece of type information; returns the
+        objects referenced by those fields.
+        '''
+        sess = self.thread.sess
+        todo = {}
+        for obj in objs:
+            if type(obj) is Object and obj.oid not in self.objects:
+                todo[obj.oid] = obj
+        todo = todo.values()
+        sess.resolveTypes(todo)
+
+        jobs = []
+        for obj in todo:
+            fields = obj.fieldList
+            jobs.append((0x0902, obj.fieldsRequest(fields),
+                         lambda buf, obj=obj, fields=fields: obj.unpackFieldValues(fields, buf)))
+        found = []
+        for obj, vals in zip(todo, sess.pipeline(jobs)):
+            obj.memo('fields', lambda: vals)
+            self.objects[obj.oid] = vals
+            found.extend(vals.values())
+        return found
+
+    def genJson(self):
+        '''
+        returns the snapshot as a list of frames, each with its location and
+        slot values; objects are shown with the fields captured for them.
+        '''
+        objects = self.objects
+        def show(v, seen):
+            if isinstance(v, Object) and v.oid in objects and v.oid not in seen:
+                seen = seen + (v.oid,)
+                return {
+                    "object_id": v.oid,
+                    "object_type": v.jni,
+                    "fields_infor": dict(
+                        (k, show(x, seen)) for k, x in objects[v.oid].items()
+                    ),
+                }
+            if isinstance(v, (int, long, float, bool)) or v is None:
+                return v
+            return str(v)
+
+        data = []
+        for f, vals in self:
+            data.append({
+                "name": str(f.loc),
+                "is_native": f.native,
+                "args": dict((k, show(v, ())) for k, v in vals.items()),
+            })
+        return data
+
 class Location(SessionElement):
     '''
     类功能：描述代码中的一个位置
     '''
+    __slots__ = ('tid', 'mid', 'loc', 'line', '__weakref__')
+
     def __init__(self, sess, tid, mid, loc):
         SessionElement.__init__(self, sess)
         self.tid = tid  #class type id
@@ -468,18 +777,33 @@ class Location(SessionElement):
         log.debug("study", "In Location.unpackFrom: tag=" + str(tag) + "\t tid=" + str(tid) + "\t mid=" + str(mid) + "\t loc=" + str(loc))
         return sess.pool(impl, sess, tid, mid, loc)  #设置一个Location类型
 
+    def hookRequest(self, eventKind, suspendPolicy=1):
+        'packs the EventRequest.Set of an event of eventKind at this location'
+        buf = self.conn.buffer()
+        # 0: SP_NONE, 1: SP_THREAD
+        # 1 condition of type Location (7) Case LocationOnly - if modKind is 7:
+        buf.pack('11i1', eventKind, suspendPolicy, 1, 7)
+        self.packTo(buf) #在这里将loc传入jdwp的参数，
+        return buf.data()
+
+    def hookKind(self):
+        'the event kind hook() requests: an entry, an exit or a breakpoint'
+        # 2: BREAKPOINT
+        # 40:METHOD_ENTRY
+        # 41:METHOD_EXIT
+        if self == self.method.firstLoc:
+            return 40
+        elif self == self.method.lastLoc:
+            return 41
+        return 2
+
     def hookOut(self, func=None, queue=None):
         '''
         功能：函数调用结束时，将程序hook终端
         '''
         conn = self.conn
-        buf = conn.buffer()
-        # 40:EK_METHOD_ENTRY, 1: EVENT_THREAD, 1 condition of type Location (7) Case LocationOnly - if modKind is 7:
-        buf.pack('11i1', 41, 1, 1, 7)  #只实现了METHOD_ENTRY方法入口事件的处理，其他事件没有处理
-
-        self.packTo(buf) #在这里将loc传入jdwp的参数，
         log.debug("study", "call jdwp 0x0F 01")
-        code, buf = conn.request(0x0F01, buf.data(), g_jdwp_request_timeout)
+        code, buf = conn.request(0x0F01, self.hookRequest(41), g_jdwp_request_timeout)
         if code != 0:
             raise RequestError(code)
         eid = buf.unpackInt() #返回的是一个ID of created request，用来区别与这个断点
@@ -494,23 +818,8 @@ class Location(SessionElement):
             注：所设置的具体事件由 buf.pack('11i1', 40, 1, 1, 7) 确定
         '''
         conn = self.conn
-        buf = conn.buffer()
-        # 40:EK_METHOD_ENTRY, 1: EVENT_THREAD, 1 condition of type Location (7) Case LocationOnly - if modKind is 7:
-        # 2: BREAKPOINT
-        # 40:METHOD_ENTRY
-        # 41:METHOD_EXIT
-        if self == self.method.firstLoc:
-            eventKind = 40
-        elif self == self.method.lastLoc:
-            eventKind = 41
-        else:
-            eventKind = 2
-        # 1: SP_THREAD, 1 condition of type Location (7)
-        buf.pack('11i1', eventKind, 1, 1, 7)  #只实现了METHOD_ENTRY方法入口事件的处理，其他事件没有处理
-
-        self.packTo(buf) #在这里将loc传入jdwp的参数，
         log.debug("study", "call jdwp 0x0F 01")
-        code, buf = conn.request(0x0F01, buf.data(), g_jdwp_request_timeout)
+        code, buf = conn.request(0x0F01, self.hookRequest(self.hookKind()), g_jdwp_request_timeout)
         if code != 0:
             raise RequestError(code)
         eid = buf.unpackInt() #返回的是一个ID of created request，用来区别与这个断点
@@ -531,36 +840,25 @@ class Location(SessionElement):
 
     @property
     def slots(self):
-        log.debug("study", "In Location slots")
-        log.debug("study", "self.native=" + str(self.native))
-        l = self.loc
-        def filter_slots():
-            for slot in self.method.slots:                
-                f = slot.firstLoc
-                log.debug("study", "In Location.slots l=" + str(l) + "\t f=" + str(f))
-                if f > l: continue
-                if l - f > slot.locLength: continue
-                yield slot
-        return tuple() if self.native else tuple(filter_slots())#如果是系统函数，返回没有内容的空元组
-        '''
-            In Location.slots l=9     f=93
-            In Location.slots l=9     f=93
-            In Location.slots l=9     f=93
-            In Location.slots l=9     f=173
-            In Location.slots l=9     f=150
-            In Location.slots l=9     f=156
-            In Location.slots l=9     f=144
-            In Location.slots l=9     f=93
-            In Location.slots l=9     f=2
-            In Location.slots l=9     f=93
-            In Location.slots l=9     f=1
-            In Location.slots l=9     f=93
-            In Location.slots l=9     f=0
-        '''
+        'the slots live at this location, looked up in the method\'s index'
+        return tuple() if self.native else self.method.liveSlots[self.loc]#如果是系统函数，返回没有内容的空元组
+
+    def slot(self, name):
+        'returns (position, slot) for the live slot called name, or None'
+        if self.native: return None
+        method = self.method
+        i = method.liveSlots.segment(self.loc)
+        if i < 0: return None
+        return method.liveByName[i].get(name)
+
 class Slot(SessionElement):
     '''
     类的功能：描述一个变量的信息，主要用来描述成员函数中的成员变量和函数参数
     '''
+    __slots__ = ('tid', 'mid', 'index') + deferred(
+        'firstLoc', 'locLength', 'name', 'jni', 'gen'
+    )
+
     def __init__(self, sess, tid, mid, index):
         SessionElement.__init__(self, sess)
         self.tid = tid
@@ -589,6 +887,11 @@ class Slot(SessionElement):
         return ord(self.jni[0])
 
 class Method(SessionElement):
+    __slots__ = ('tid', 'mid', 'arg_cnt', 'slot_cnt', '__weakref__') + deferred(
+        'firstLoc', 'lastLoc', 'lineTable', 'name', 'jni', 'gen', 'flags',
+        'slots', 'liveSlots', 'liveByName'
+    )
+
     def __init__(self, sess, tid, mid):
         SessionElement.__init__(self, sess)
         self.tid = tid   #refType id 的值
@@ -623,22 +926,45 @@ class Method(SessionElement):
             self.lineTable = None
             return 
         
-        sess = self.sess
-        conn = sess.conn
-        pool = sess.pool
-        tid = self.tid
-        mid = self.mid
-        data = conn.buffer().pack('om', tid, mid) #输入参数是type id和method id
+        if self.loadCachedLines():
+            return
+
+        conn = self.conn
         log.debug("study", "call jdwp 0x06 01")
-        code, buf = conn.request(0x0601, data, g_jdwp_request_timeout)
+        code, buf = conn.request(0x0601, self.methodRequest(), g_jdwp_request_timeout) #输入参数是type id和method id
         log.debug("study", "finish " + str(buf)+ " code:" + str(code))
         if code != 0:  
             raise RequestError(code)
         
-        
-        
+        self.unpackLineTable(buf)
+
+    def unpackLineTable(self, buf):
+        'unpacks a LineTable response into the line table'
         f, l, ct = buf.unpack('88i')
         log.debug("study", "firstLoc=" + str(f) + "\t lastLoc=" + str(l) + "\t lineTable=" + str(ct))
+        rows = tuple(tuple(buf.unpack('8i')) for i in range(0, ct)) #根据获取的函数的代码行数信息，逐行取出代码信息
+        self.setLineTable(f, l, rows)
+        cache = self.sess.cache
+        if cache is not None:
+            cache.put(self, andbug.cache.LINES, (f, l, rows))
+
+    def loadCachedLines(self):
+        'sets the line table from the session cache; false on a miss'
+        cache = self.sess.cache
+        if cache is None:
+            return False
+        table = cache.get(self, andbug.cache.LINES)
+        if table is None:
+            return False
+        self.setLineTable(*table)
+        return True
+
+    def setLineTable(self, f, l, rows):
+        'sets the line table of the method from (loc, line) rows'
+        sess = self.sess
+        pool = sess.pool
+        tid = self.tid
+        mid = self.mid
         if (f == -1) or (l == -1):             
             self.firstLoc = None
             self.lastLoc = None
@@ -647,21 +973,15 @@ class Method(SessionElement):
       
         self.firstLoc = pool(Location, sess, tid, mid, f) #声明一个Locaton类来保存获取的locaiton信息       
         self.lastLoc = pool(Location, sess, tid, mid, l)
-        
 
         ll = {}
         #self.lineLocs = ll    #这个变量是否应该是lineTable，在正常路径中linetable没有赋值
         self.lineTable = ll
-        def line_loc(): #根据获取的函数的代码行数信息，逐行取出代码信息
-            loc, line  = buf.unpack('8i')
+        for loc, line in rows:
             log.debug("study", "loc="+ str(loc) + "\t line=" + str(line))           
             loc = pool(Location, sess, tid, mid, loc)           
             loc.line = line            
             ll[line] = loc
-         
-
-        for i in range(0,ct):            
-            line_loc()
       
     
     firstLoc = defer(load_line_table, 'firstLoc')   #methods类中的变量，所以对于每个方法都会有这些信息
@@ -684,26 +1004,52 @@ class Method(SessionElement):
             2 功能：获取一个方法中的参数和变量的信息
             3 解释： [Method Command Set (6)][VariableTableWithGeneric Command (5)]
         '''
-        sess = self.sess
-        conn = self.conn
-        pool = sess.pool
-        tid = self.tid
-        mid = self.mid
-        data = conn.buffer().pack('om', tid, mid)
-        log.debug("study", "In Method.load_slot_table classTypeId=" + str(tid) + "\t mid=" + str(mid))
+        if self.loadCachedSlots():
+            return
+        log.debug("study", "In Method.load_slot_table classTypeId=" + str(self.tid) + "\t mid=" + str(self.mid))
         log.debug("study", "call jdwp 0x06 05")
-        code, buf = conn.request(0x0605, data, g_jdwp_request_timeout)
+        code, buf = self.conn.request(0x0605, self.methodRequest(), g_jdwp_request_timeout)
         log.debug("study", "code="+ str(code))
         if code != 0: raise RequestError(code)
-    
+        self.unpackSlotTable(buf)
+
+    def methodRequest(self):
+        'packs the (type, method) pair that the Method commands take'
+        return self.conn.buffer().pack('om', self.tid, self.mid)
+
+    def loadCachedSlots(self):
+        'sets the variable table from the session cache; false on a miss'
+        cache = self.sess.cache
+        if cache is None:
+            return False
+        table = cache.get(self, andbug.cache.SLOTS)
+        if table is None:
+            return False
+        self.setSlotTable(*table)
+        return True
+
+    def unpackSlotTable(self, buf):
+        'unpacks a VariableTableWithGeneric response into slots'
         act, sct = buf.unpack('ii')  #获取参数的个数，获取自变量的个数
-        self.arg_cnt = act
-        self.slot_cnt = sct
         log.debug("study", "In Method.load_slot_table argCount=" + str(act) + "\t sct=" + str(sct))
+        rows = tuple(tuple(buf.unpack('l$$$ii')) for i in range(0, sct))
+        self.setSlotTable(act, rows)
+        cache = self.sess.cache
+        if cache is not None:
+            cache.put(self, andbug.cache.SLOTS, (act, rows))
+
+    def setSlotTable(self, act, rows):
+        'sets the variable table from (codeIndex, name, jni, gen, codeLen, index) rows'
+        sess = self.sess
+        pool = sess.pool
+        tid = self.tid
+        mid = self.mid
+        self.arg_cnt = act
+        self.slot_cnt = len(rows)
         #TODO: Do we care about the argCnt ?
          
-        def load_slot():
-            codeIndex, name, jni, gen, codeLen, index  = buf.unpack('l$$$ii')
+        def load_slot(row):
+            codeIndex, name, jni, gen, codeLen, index  = row
             slot = pool(Slot, sess, tid, mid, index)
             slot.firstLoc = codeIndex
             slot.locLength = codeLen
@@ -714,9 +1060,24 @@ class Method(SessionElement):
 
             return slot
 
-        self.slots = andbug.data.view(load_slot() for i in range(0,sct))
+        self.setSlots(andbug.data.view(load_slot(row) for row in rows))
+
+    def setSlots(self, slots):
+        '''
+        sets the variable table of the method, and indexes which slots are
+        live at each code index: a slot is live from firstLoc through
+        firstLoc + locLength.
+        '''
+        self.slots = slots
+        live = andbug.data.intervals(
+            (slot.firstLoc, slot.firstLoc + slot.locLength, slot) for slot in slots
+        )
+        self.liveSlots = live
+        self.liveByName = list(index_by_name(seg) for seg in live.segments)
 
     slots = defer(load_slot_table, 'slots')
+    liveSlots = defer(load_slot_table, 'liveSlots')
+    liveByName = defer(load_slot_table, 'liveByName')
     
     
 
@@ -829,6 +1190,11 @@ class Method(SessionElement):
     
 
 class RefType(SessionElement):
+    __slots__ = ('tag', 'tid', 'flags') + deferred(
+        'gen', 'jni', 'fieldList', 'instanceFields', 'fieldByName',
+        'methodList', 'methodByJni', 'methodByName'
+    )
+
     def __init__(self, sess, tag, tid):
         SessionElement.__init__(self, sess)
         self.tag = tag
@@ -854,13 +1220,13 @@ class RefType(SessionElement):
         2 功能：返回引用类型的JNI signature和generic signature
         3 解释：[ReferenceType Command Set (2)][SignatureWithGeneric Command (13)]
         '''
-        conn = self.conn
-        buf = conn.buffer()
-        self.packTo(buf)
         log.debug("study", "call jdwp 0x02 0d")
-        code, buf = conn.request(0x020d, buf.data(), g_jdwp_request_timeout)
+        code, buf = self.conn.request(0x020d, self.typeRequest(), g_jdwp_request_timeout)
         if code != 0:
             raise RequestError(code)
+        self.unpackSignature(buf)
+
+    def unpackSignature(self, buf):
         self.jni = buf.unpackStr()
         self.gen = buf.unpackStr()
 
@@ -873,16 +1239,26 @@ class RefType(SessionElement):
         2 功能：返回信息，包括 引用类型中每一个字段的通用签名
         3 解释：[ReferenceType Command Set (2)][FieldsWithGeneric Command (14)]
         '''      
-        sess = self.sess
-        conn = self.conn
-        buf = conn.buffer()
-        buf.pack("t", self.tid)
         log.debug("study", "load_fields tid=" + str(self.tid))
         log.debug("study", "call jdwp 0x02 0E")
-        code, buf = conn.request(0x020E, buf.data(), g_jdwp_request_timeout)
+        code, buf = self.conn.request(0x020E, self.typeRequest(), g_jdwp_request_timeout)
         if code != 0:
             raise RequestError(code)
+        self.unpackFields(buf)
+
+    def typeRequest(self):
+        'packs the type id that the ReferenceType commands take'
+        return self.conn.buffer().pack("t", self.tid)
+
+    def hookRequest(self, eventKind, suspendPolicy=1):
+        'packs the EventRequest.Set of an event of eventKind in the methods of this type'
+        # 1 condition of type ClassOnly (4); unlike LocationOnly, it matches
+        # the exits of a method, whose location is the returning instruction
+        return self.conn.buffer().pack('11i1t', eventKind, suspendPolicy, 1, 4, self.tid)
 
+    def unpackFields(self, buf):
+        'unpacks a FieldsWithGeneric response into fieldList'
+        sess = self.sess
         ct = buf.unpackU32()
 
         def load_field():
@@ -897,9 +1273,14 @@ class RefType(SessionElement):
         
         self.fieldList = andbug.data.view(
             load_field() for i in range(ct)
-        )        
+        )
+        # shared by every instance of the type; see Object.field
+        self.instanceFields = tuple(f for f in self.fieldList if not f.static)
+        self.fieldByName = index_by_name(self.instanceFields)
 
     fieldList = defer(load_fields, 'fieldList')
+    instanceFields = defer(load_fields, 'instanceFields')
+    fieldByName = defer(load_fields, 'fieldByName')
 
     @property
     def statics(self):
@@ -945,18 +1326,18 @@ class RefType(SessionElement):
         2 功能：通过一个引用类型返回其包含的方法的通用签名信息
         3 解释：[ReferenceType Command Set (2)][MethodsWithGeneric Command (15)]
         '''
-        tid = self.tid
-        sess = self.sess
-        conn = self.conn
-        pool = sess.pool
-        buf = conn.buffer()
-        buf.pack("t", tid) #传入的值是refType id
-        log.debug("study", "call jdwp 0x02 0F "+ str(tid))
-        code, buf = conn.request(0x020F, buf.data(), g_jdwp_request_timeout)
+        log.debug("study", "call jdwp 0x02 0F "+ str(self.tid))
+        code, buf = self.conn.request(0x020F, self.typeRequest(), g_jdwp_request_timeout) #传入的值是refType id
 
         if code != 0:
             raise RequestError(code)
+        self.unpackMethods(buf)
 
+    def unpackMethods(self, buf):
+        'unpacks a MethodsWithGeneric response into the method tables'
+        tid = self.tid
+        sess = self.sess
+        pool = sess.pool
         ct = buf.unpackU32()
                 
         def load_method():
@@ -984,11 +1365,10 @@ class RefType(SessionElement):
             name = item.name
             self.methodByJni[jni] = item
             self.methodByName[name] = item
-    
-    methodList = defer(load_methods, 'methodList')
-    methodByJni = defer(load_methods, 'methodByJni')
-    methodByName = defer(load_methods, 'methodByName')
 
+        if sess.cache is not None:
+            sess.cache.attach(self)
+    
     methodList = defer(load_methods, 'methodList')
     methodByJni = defer(load_methods, 'methodByJni')
     methodByName = defer(load_methods, 'methodByName')
@@ -998,7 +1378,7 @@ class RefType(SessionElement):
             log.debug("study", name + "\t" + jni)
             seq = self.methodByName[name]
             log.debug("study", "seq=" + str(seq))
-            seq = filter(x in seq, self.methodByJni[jni]) #2.7 版本的python会执行错误
+            seq = list(m for m in seq if m.jni == jni)
         elif name:
             seq = andbug.data.view(self.methodByName[name])
         elif jni:
@@ -1016,6 +1396,8 @@ class RefType(SessionElement):
         return name
 
 class Class(RefType): 
+    __slots__ = ()
+
     #在obj = self.pool(Class, self, tid) 代码处，会初始化大量的Class类的对象
     def __init__(self, sess, tid): #两个参数分别是：Session类行的变量，与具体类所对应的typeid的值
         RefType.__init__(self, sess, 'L', tid)
@@ -1066,10 +1448,17 @@ class Hook(SessionElement):
 
         self.ident = ident
         self.origin = origin
+        pin_origin(sess.pool, origin)
         #TODO: unclean
         with self.sess.ectl:
             self.sess.emap[ident] = self   #ident ID of created request 
             log.debug("study", "in Hook __init__ ident=" + str(ident))
+            self.sess.setting.discard(ident)
+            self.sess.holds.pop(ident, None)
+            early = self.sess.orphans.pop(ident, ())
+        # events that fired before the request was registered; see processEvent
+        for data in early:
+            self.put(data)
 
     def __str__(self):
         return ('<%s> %s %s' %
@@ -1098,6 +1487,20 @@ class Hook(SessionElement):
 
         with self.sess.ectl:
             del self.sess.emap[self.ident]
+            self.sess.orphans.pop(self.ident, None)
+            self.sess.holds.pop(self.ident, None)
+        unpin_origin(self.sess.pool, self.origin)
+
+def pin_origin(pool, origin):
+    'hooked locations and their methods must outlive pool eviction'
+    if isinstance(origin, Location):
+        pool.pin(origin)
+        pool.pin(origin.method)
+
+def unpin_origin(pool, origin):
+    if isinstance(origin, Location):
+        pool.unpin(origin)
+        pool.unpin(origin.method)
             
             
             
@@ -1196,6 +1599,9 @@ register_unpack_impl(40, unpack_event_location)
 # MothodExit
 register_unpack_impl(41, unpack_event_location)
 
+# the event kinds a counting request may be set for; see Session.countMany
+COUNTED_KINDS = frozenset((1, 2, 40, 41))
+
 
 #add by sq.luo  
 class SuspendState(object):
@@ -1229,13 +1635,93 @@ class SuspendState(object):
         self.eid = eid
         self.stepdepth = stepdepth
         
+def id_column():
+    'returns an empty column for 64-bit JDWP ids'
+    col = array('L')
+    return col if col.itemsize >= 8 else []
+
+class ClassTable(object):
+    '''
+    the class enumeration of a session, stored as parallel columns (tag,
+    type id, interned jni, flags) rather than one object per class; a Class
+    is only created, through the session pool, when a row is actually used.
+    '''
+    def __init__(self, sess):
+        self.sess = sess
+        self.tags = array('B')
+        self.tids = id_column()
+        self.jnis = []
+        self.flags = array('i')
+        self.gens = {} # row -> generic signature, for the few that have one
+
+    def __len__(self):
+        return len(self.jnis)
+
+    def __iter__(self):
+        for row in range(len(self.jnis)):
+            yield self.materialize(row)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return list(self.materialize(i) for i in range(*row.indices(len(self))))
+        return self.materialize(row)
+
+    def append(self, tag, tid, jni, gen, flags):
+        row = len(self.jnis)
+        self.tags.append(tag)
+        self.tids.append(tid)
+        self.jnis.append(intern(jni))
+        self.flags.append(flags)
+        if gen:
+            self.gens[row] = gen
+
+    def rows(self):
+        'yields (jni, row) for every class in the table'
+        jnis = self.jnis
+        for row in range(len(jnis)):
+            yield jnis[row], row
+
+    def materialize(self, row):
+        'returns the pooled Class for a row, filled in from the table'
+        sess = self.sess
+        obj = sess.pool(Class, sess, self.tids[row])
+        obj.tag = self.tags[row]
+        obj.jni = self.jnis[row]
+        obj.gen = self.gens.get(row, '')
+        obj.flags = self.flags[row]
+        return obj
+
 class Session(object):
     def __init__(self, conn):
         self.pool = andbug.data.pool()  #在andbug/lib/andbug/data.py文件中定义
+        # frames, objects and strings are only meaningful while something
+        # still refers to them; locations and methods are also kept while
+        # among the most recently used, with hooked ones pinned (see Hook).
+        for kind in (Frame, Object, Array):
+            self.pool.policy(kind, 'weak')
+        self.pool.policy(Location, 'lru', g_pool_location_limit)
+        self.pool.policy(Method, 'lru', g_pool_method_limit)
+        # strings are immutable, and the VM never reuses the id of an object
+        # it has handed us (we never dispose of them), so a bounded pool of
+        # Strings doubles as a cache of their contents; see String.data.
+        self.pool.policy(String, 'lru', g_pool_string_limit)
         self.conn = conn  #conn是Connection(Thread)的一个对象
+        conn.configure(
+            target=andbug.config.g_Flow_Target, high=andbug.config.g_Flow_Max_Window
+        )
+        self.cache = None # class metadata kept across sessions; see andbug.cache
+        self.prefetchers = [] # see andbug.prefetch
+        # bumped on every suspend and resume; see Thread.memo
+        self.epoch = 0
+        self.vmEpoch = 0
         self.emap = {}   #用一个字典来存放hook点的信息，每个元素是一个Hook类型的对象
+        self.orphans = {} # request id -> events that arrived before its Hook
+        self.setting = set() # ids of requests set, not yet taken by a Hook or counter
+        self.holds = {} # request id -> [(suspend policy, thread)], of orphans that suspended
+        self.counters = {} # request id -> HitCounter; see countMany
         self.ectl = Lock()
         self.evtq = Queue()
+        conn.peek(0x0F01, self.expect)
         conn.hook(0x4064, self.evtq)  #加入evtq队列中 16484  这里是加入命令 0x40 64 转换成十进制是64 100 Event Command Set（64）：Composite Command (100)
         self.ethd = threading.Thread(
             name='Session', target=self.run  #线程的名称，线程的执行函数
@@ -1244,14 +1730,52 @@ class Session(object):
         self.ethd.start()
 
     def run(self):
+        # hook callbacks run here; their requests yield to interactive ones
+        self.conn.setPriority(andbug.proto.CAPTURE)
         while True:
             self.processEvent(*self.evtq.get())  #从evtq中取出一个队列，这个的值是在proto.Connection.processRequest函数中被压入队列的
 
     def hook(self, ident, func = None, queue = None, origin = None):
         return Hook(self, ident, func, queue, origin) #返回的是一个Hook类型的对象
 
+    def expect(self, data):
+        '''
+        notes the id of a request set, from its EventRequest.Set response, on
+        the connection thread; its events may be dispatched before whoever set
+        it takes it, and are parked until then.  see dispatch.
+        '''
+        rid = self.requestId(data)
+        with self.ectl:
+            self.setting.add(rid)
+
+    def requestId(self, data):
+        'unpacks the request id of the data of an EventRequest.Set response'
+        buf = self.conn.buffer()
+        buf.prepareUnpack(data)
+        return buf.unpackInt()
+
+    def forget(self, rid):
+        '''
+        called when a request set is not to be taken by anyone, say because
+        its response failed to unpack: its parked events are dropped, and
+        the threads they suspended are resumed.
+        '''
+        with self.ectl:
+            if rid not in self.setting:
+                return
+            self.setting.discard(rid)
+            self.orphans.pop(rid, None)
+            held = self.holds.pop(rid, ())
+        for pol, t in held:
+            if pol == 2:
+                self.resume()
+            else:
+                t.resume()
+
     def processEvent(self, ident, buf):  #关注这里只有两个参数，
         pol, ct = buf.unpack('1i')  #按照格式对数据进行解析， 1表示无符号单字节数值，
+        if pol == 0 and self.counters:
+            return self.countEvents(buf, ct)
         log.debug("study", "in Session.processEvent: ident=" + str(ident) + "\t pol=" + str(pol) + "\t ct=" + str(ct))
         #输出的值为：in Session.processEvent: ident=268435460     pol=1     ct=1
         #其中  pol的值是suspendPolicy，标识暂停的策略，1表示只暂停当前线程， ct表示本次中断所触发的事件数
@@ -1262,10 +1786,61 @@ class Session(object):
             if im is None:
                 raise RequestError(ek)
             evt = im(self, buf) #调用具体的函数 这里im调用的是unpack_method_entry函数返回的是rid, t, loc三个变量。
-            with self.ectl: #请求锁
-                hook = self.emap.get(evt[0])
-            if hook is not None:  #hook变量的类型是Hook
-                hook.put(evt[1:])  #调用Hook类型中的put函数
+            if pol != 0:
+                # the event suspended its thread, or the whole VM
+                if pol == 2:
+                    self.vmEpoch += 1
+                if len(evt) > 1 and isinstance(evt[1], Thread):
+                    evt[1].invalidate()
+                else:
+                    self.epoch += 1
+            self.dispatch(evt, pol)
+
+    def countEvents(self, buf, ct):
+        '''
+        processes a composite event that suspended nothing, while counting
+        requests are set: the events of those are decoded no further than
+        their request and thread ids, and counted without any logging or
+        pooling; any other event is dispatched as usual.
+        '''
+        counters = self.counters
+        for i in range(0, ct):
+            ek = buf.unpackU8()
+            if ek in COUNTED_KINDS:
+                rid, tid, tag, ctid, mid, loc = buf.unpack('io1tm8')
+                counter = counters.get(rid)
+                if counter is not None:
+                    counter.hit(rid, tid, ctid, mid)
+                    continue
+                evt = (rid, self.pool(Thread, self, tid),
+                       self.pool(Location, self, ctid, mid, loc))
+            else:
+                im = unpack_impl[ek]
+                if im is None:
+                    raise RequestError(ek)
+                evt = im(self, buf)
+            self.dispatch(evt)
+
+    def dispatch(self, evt, pol=0):
+        '''
+        passes an event to the Hook of its request; parks it if the request
+        is still being set, and drops it if the request is not known at all.
+        pol is the suspend policy of the event.
+        '''
+        with self.ectl: #请求锁
+            hook = self.emap.get(evt[0])
+            if hook is None and evt[0] in self.setting:
+                # a pipelined EventRequest.Set may fire before its
+                # response is unpacked; the Hook takes these when made
+                self.orphans.setdefault(evt[0], []).append(evt[1:])
+                if pol and len(evt) > 1:
+                    self.holds.setdefault(evt[0], []).append((pol, evt[1]))
+                return
+        if hook is None:
+            # the request was cleared, or never set by this session
+            log.debug("study", "dropped an event of request " + str(evt[0]))
+        else:  #hook变量的类型是Hook
+            hook.put(evt[1:])  #调用Hook类型中的put函数
                           
     def load_classes(self):
         '''
@@ -1279,35 +1854,32 @@ class Session(object):
         if code != 0: #如果code不为0，说明发给vm的请求发生错误。
             raise RequestError(code)
 
-        def load_class():
-            tag, tid, jni, gen, flags = buf.unpack('1t$$i')  #推测t为thead id 为一个DWORD型，$表示字符串，将数据解析出来
-            obj = self.pool(Class, self, tid) #保存相关信息到pool
-            obj.tag = tag
-            obj.tid = tid
-            obj.jni = jni
-            obj.gen = gen
-            obj.flags = flags
-            
-            infor = "tag=" + str(tag) + ";\t tid=" + str(hex(tid)) + ";\t jni=" + jni + ";\t gen=" + str(gen) + ";\t flags=" +str(flags);
-            log.debug("study",infor)
-            
-            return obj 
-                        
         ct = buf.unpackU32()
+        table = ClassTable(self)
+        for i in range(0, ct):
+            table.append(*buf.unpack('1t$$i'))  #tag, type id, jni, gen, flags
+
+        self.classTable = table
+        self.classIndex = andbug.index.ClassIndex(table.rows())
 
-        self.classList = andbug.data.view(load_class() for i in range(0, ct))
-        self.classByJni = andbug.data.multidict()
-        for item in self.classList:
-            self.classByJni[item.jni] = item
+    classTable = defer(load_classes, 'classTable')
+    classIndex = defer(load_classes, 'classIndex')
 
-    classList = defer(load_classes, 'classList')
-    classByJni = defer(load_classes, 'classByJni')
+    @property
+    def classList(self):
+        return self.classTable
 
     def classes(self, jni=None):
+        '''
+        returns the loaded classes matching jni, which may be an exact JNI
+        signature, a JNI glob or a /regex/; see andbug.index.  only the
+        matching rows of the class table are materialized as Class objects.
+        '''
+        table = self.classTable
         if jni:
-            seq = self.classByJni[jni]
+            seq = (table[row] for row in self.classIndex.find(jni))
         else:
-            seq = self.classList
+            seq = table
         return andbug.data.view(seq)
     
     def suspend(self):
@@ -1316,11 +1888,184 @@ class Session(object):
         2、注释：暂停VM
         3、[VirtualMachine Command Set ][Suspend Command (8)]
         '''
+        self.invalidate()
         log.debug("study", "call jdwp 0x01 08")
         code, buf = self.conn.request(0x0108, '', g_jdwp_request_timeout)
         if code != 0:
             raise RequestError(code)
 
+    def pipeline(self, jobs, errors=False):
+        '''
+        sends every (code, data, func) job to the process in one pipelined
+        batch, then returns func(buf) for each response, in order.  a failed
+        request raises RequestError, or with errors, leaves the RequestError
+        in its place in the results.
+        '''
+        jobs = list(jobs)
+        if not jobs:
+            return []
+        res = self.conn.requestMany(
+            ((code, data) for code, data, func in jobs), g_jdwp_request_timeout
+        )
+        # the ids of the requests set, read before any func unpacks them
+        rids = list(
+            self.requestId(buf.data()) for job, (code, buf) in zip(jobs, res)
+            if job[0] == 0x0F01 and code == 0
+        )
+        out = []
+        try:
+            for job, (code, buf) in zip(jobs, res):
+                if code != 0:
+                    if not errors:
+                        raise RequestError(code)
+                    out.append(RequestError(code))
+                    continue
+                out.append(job[2](buf))
+        finally:
+            # those not taken, by an error here or in their func, are dropped
+            for rid in rids:
+                self.forget(rid)
+        return out
+
+    def hookMany(self, requests, func=None, queue=None):
+        '''
+        sets an event request for each (location, eventKind) in one pipelined
+        batch; returns a Hook, or the RequestError, for each.
+        '''
+        requests = list(requests)
+        def unpack(loc):
+            return lambda buf: self.hook(buf.unpackInt(), func, queue, loc)
+        return self.pipeline((
+            (0x0F01, loc.hookRequest(kind), unpack(loc)) for loc, kind in requests
+        ), errors=True)
+
+    def countMany(self, requests, counter):
+        '''
+        sets an event request for each (origin, eventKind) in one pipelined
+        batch, suspending nothing, whose events are only counted by counter;
+        see andbug.counting.  an origin is a Location, or a RefType for the
+        events of all of its methods.  returns the request id, or the
+        RequestError, for each.
+        '''
+        requests = list(requests)
+        def unpack(loc, kind):
+            def register(buf):
+                rid = buf.unpackInt()
+                counter.add(rid, loc, kind)
+                pin_origin(self.pool, loc)
+                with self.ectl:
+                    self.counters[rid] = counter
+                    self.setting.discard(rid)
+                    self.holds.pop(rid, None)
+                    early = self.orphans.pop(rid, ())
+                # events that fired before the request was registered
+                for t, l in early:
+                    counter.hit(rid, t.tid, l.tid, l.mid)
+                return rid
+            return register
+        return self.pipeline((
+            (0x0F01, loc.hookRequest(kind, 0), unpack(loc, kind))
+            for loc, kind in requests
+        ), errors=True)
+
+    def uncount(self, counter):
+        'clears the event requests counted by counter, in one pipelined batch'
+        with self.ectl:
+            rids = list(rid for rid, c in self.counters.items() if c is counter)
+        def request(rid):
+            buf = self.conn.buffer()
+            buf.pack('1i', counter.origins[rid][1], rid)
+            return buf.data()
+        # 0x0f02 = {15, 2} EventRequest.Clear
+        res = self.pipeline((
+            (0x0F02, request(rid), lambda buf: None) for rid in rids
+        ), errors=True)
+        with self.ectl:
+            for rid in rids:
+                self.counters.pop(rid, None)
+        for rid in rids:
+            unpin_origin(self.pool, counter.origins[rid][0])
+        return res
+
+    def getRefType(self, tag, tid):
+        '''
+        returns the pooled type for a type tag and id; classes resolve to the
+        same Class the class table materializes, so their field and method
+        metadata is loaded once, however the class is reached.
+        '''
+        if tag == 1: # TypeTag.CLASS
+            cls = self.pool(Class, self, tid)
+            cls.tag = tag
+            return cls
+        return self.pool(RefType, self, tag, tid)
+
+    def knownType(self, obj):
+        '''
+        returns the type of obj when it follows from its value tag alone, as
+        for strings, and the class table is already loaded; otherwise None.
+        '''
+        jni = KNOWN_TYPES.get(type(obj))
+        if jni is None or not loaded(self, 'classTable'):
+            return None
+        rows = self.classIndex.find(jni)
+        if len(rows) != 1:
+            return None
+        return self.classTable[rows[0]]
+
+    def resolveTypes(self, objects):
+        '''
+        loads the reference type of every Object in objects that lacks one,
+        then the signatures and field lists of the types among them not seen
+        before; each is a single pipelined batch, so objects of a class
+        already seen cost one request each, and new classes two more.
+        '''
+        if isinstance(objects, dict):
+            objects = objects.values()
+        objects = list(obj for obj in objects if isinstance(obj, Object))
+        jobs = []
+        for obj in dict((obj.oid, obj) for obj in objects).values():
+            if loaded(obj, 'refType'):
+                continue
+            known = self.knownType(obj)
+            if known is not None:
+                obj.refType = known
+            else:
+                jobs.append((0x0901, obj.objectRequest(), obj.unpackRefType))
+        self.pipeline(jobs)
+
+        types = dict((id(obj.refType), obj.refType) for obj in objects).values()
+        jobs = list(
+            (0x020D, t.typeRequest(), t.unpackSignature)
+            for t in types if not loaded(t, 'jni')
+        )
+        jobs.extend(
+            (0x020E, t.typeRequest(), t.unpackFields)
+            for t in types if not loaded(t, 'fieldList')
+        )
+        self.pipeline(jobs)
+
+    def resolveStrings(self, values):
+        '''
+        fetches the contents of every String in values whose content is not
+        known yet, in one pipelined batch; values may be any iterable, or a
+        dict whose values are resolved.
+        '''
+        if isinstance(values, dict):
+            values = values.values()
+        todo = {}
+        for v in values:
+            if isinstance(v, String) and not loaded(v, 'data'):
+                todo[v.oid] = v
+        self.pipeline(
+            (0x0A01, v.objectRequest(), v.unpackData) for v in todo.values()
+        )
+        return len(todo)
+
+    def invalidate(self):
+        'starts a new suspension of every thread; see Thread.memo'
+        self.vmEpoch += 1
+        self.epoch += 1
+
     @property
     def count(self):
         ''''
@@ -1339,6 +2084,7 @@ class Session(object):
         2、注释：暂停VM
         3、[VirtualMachine Command Set ][Resume Command (9)]
         '''
+        self.invalidate()
         log.debug("study", "call jdwp 0x01 09")
         code, buf = self.conn.request(0x0109, '', g_jdwp_request_timeout)
         if code != 0:
@@ -1412,10 +2158,13 @@ class Session(object):
 rx_dalvik_tname = re.compile('^<[0-9]+> .*$')
 
 class Object(Value):
+    __slots__ = ('oid', '_memo', '__weakref__') + deferred('refType')
+
     def __init__(self, sess, oid):
         if oid == 0: raise andbug.errors.VoidError()
         SessionElement.__init__(self, sess)
         self.oid = oid
+        self._memo = None
 
     def __repr__(self):
         return '<obj %s #%x>' % (self.jni, self.oid)
@@ -1425,30 +2174,12 @@ class Object(Value):
     def __str__(self):
         return str("%s <%s>" % (str(self.jni), str(self.oid)))
     
-    def genJson(self):
+    def genJson(self, **limits):
         '''
-        函数功能：为将数据以json格式输出做准备
-        参数：无
-        返回值：dict或list
-        author：anbc
+        returns the object graph reachable from this object as dicts and
+        lists, expanded within limits; see andbug.graph.
         '''
-        data = {}
-        data["object_id"] = self.oid
-        data["object_type"] = self.jni  
-        #data["fields_infor"] = self.fields
-        
-     
-        
-          
-        fieldInfor={}
-        fieldsValue = self.fields
-        for k in fieldsValue:
-            print k
-            fieldInfor[k]=str(fieldsValue[k])
-            
-        data["fields_infor"] = fieldInfor
-        
-        return data
+        return andbug.graph.tree(self.sess, self, **limits)
         
     @classmethod
     def unpackFrom(impl, sess, buf):
@@ -1478,73 +2209,107 @@ class Object(Value):
         2、注释：返回一个正在运行的对象的引用类型
         3、[ObjectReference Command Set (9)][ReferenceType Command (1)]
         '''
-        conn = self.sess.conn
-        buf = conn.buffer()
-        self.packTo(buf)
         log.debug("study", "call jdwp 0x09 01")
-        code, buf = conn.request(0x0901, buf.data(), g_jdwp_request_timeout)
+        code, buf = self.conn.request(0x0901, self.objectRequest(), g_jdwp_request_timeout)
         if code != 0:
             raise RequestError(code)
-        self.refType = RefType.unpackFrom(self.sess, buf)
+        self.unpackRefType(buf)
+
+    def unpackRefType(self, buf):
+        tag, tid = buf.unpack('1t')
+        self.refType = self.sess.getRefType(tag, tid)
+
+    def objectRequest(self):
+        'packs the object id that the ObjectReference commands take'
+        buf = self.conn.buffer()
+        self.packTo(buf)
+        return buf.data()
     
     refType = defer(load_refType, 'refType')
 
     @property
     def fieldList(self):
-        r = list(f for f in self.refType.fieldList if not f.static)
-        return r
+        return self.refType.instanceFields
 
     @property
     def typeTag(self):
         return self.refType.tag
 
+    def memo(self, key, func):
+        '''
+        returns func(), computed at most once until some thread is suspended
+        or resumed; field values may change whenever the VM runs.
+        '''
+        memo = self._memo
+        if memo is None or memo[0] != self.sess.epoch:
+            memo = self._memo = (self.sess.epoch, {})
+        try:
+            return memo[1][key]
+        except KeyError:
+            val = memo[1][key] = func()
+            return val
+
+    def cached(self, key):
+        'returns the value memoized for key since the last suspend or resume, or None'
+        memo = self._memo
+        if memo is None or memo[0] != self.sess.epoch:
+            return None
+        return memo[1].get(key)
+
     @property
     def fields(self):
+        return self.memo('fields', self.load_fields)
+
+    def load_fields(self):
         '''
         1、命令  0x09 0x02
         2、注释：获得成员变量的值
         3、[ObjectReference Command Set (9) ][GetValues Command (2)]
         '''
-        sess = self.sess
-        conn = self.conn
-        buf = conn.buffer()
-        buf.packTypeId(self.oid)
         fields = self.fieldList
-        buf.packInt(len(fields))
-        for field in fields:
-            buf.packFieldId(field.fid)
         log.debug("study", "call jdwp 0x09 02")
-        code, buf = conn.request(0x0902, buf.data(), g_jdwp_request_timeout)
+        code, buf = self.conn.request(0x0902, self.fieldsRequest(fields), g_jdwp_request_timeout)
         if code != 0:
             raise RequestError(code)
+        return self.unpackFieldValues(fields, buf)
+
+    def fieldsRequest(self, fields):
+        'packs an ObjectReference.GetValues request for fields'
+        buf = self.conn.buffer()
+        buf.packTypeId(self.oid)
+        buf.packInt(len(fields))
+        for field in fields:
+            buf.packFieldId(field.fid)
+        return buf.data()
+
+    def unpackFieldValues(self, fields, buf):
+        'unpacks the response to fieldsRequest into a name -> value dict'
+        sess = self.sess
         ct = buf.unpackInt()
         vals = {}
         for x in range(ct):
             f = fields[x]
             vals[f.name] = unpack_value(sess, buf)
-            log.info("study", "field: %s = %s"%(f.name, vals[f.name]))
+            log.info("study", "field: %s = %s"%(f.name, type(vals[f.name]).__name__))
 
         return vals
 
     def field(self, name):
+        vals = self.cached('fields')
+        if vals is not None:
+            return vals.get(name)
+        return self.memo(('field', name), lambda: self.load_field(name))
+
+    def load_field(self, name):
+        ent = self.refType.fieldByName.get(name)
+        if ent is None:
+            return None
+        field = ent[1]
         sess = self.sess
         conn = self.conn
         buf = conn.buffer()
         buf.packTypeId(self.oid)
-        fields = self.fieldList
         buf.packInt(1)
-
-        loc = None
-        for i in range(0, len(fields)):
-            if fields[i].name == name:
-                loc = i
-                break
-            else:
-                continue
-
-        if loc is None:
-            return None
-        field = fields[loc]
         buf.packFieldId(field.fid)
         code, buf = conn.request(0x0902, buf.data())
         if code != 0:
@@ -1555,27 +2320,19 @@ class Object(Value):
 
 
     def setField(self, name, value):
+        ent = self.refType.fieldByName.get(name)
+        if ent is None:
+            return None
+        field = ent[1]
         sess = self.sess
         conn = self.conn
         buf = conn.buffer()
         buf.packTypeId(self.oid)
-        fields = self.fieldList
         buf.packInt(1)
-
-        loc = None
-        for i in range(0, len(fields)):
-            if fields[i].name == name:
-                loc = i
-                break
-            else:
-                continue
-
-        if loc is None:
-            return None
-        field = fields[loc]
         buf.packFieldId(field.fid)
         #TODO: WTF: ord(field.jni) !?
         pack_value(sess, buf, value, field.jni[0])
+        self._memo = None
         code, buf = conn.request(0x0903, buf.data())
         if code != 0:
             raise RequestError(code)
@@ -1586,15 +2343,22 @@ class Object(Value):
 ##        obj.dump()
 
 class Array(Object):
+    __slots__ = deferred('length')
+
+    def preview(self):
+        'returns the first g_array_preview items, and whether there are more'
+        length = self.length
+        return self.getSlice(0, min(length, g_array_preview)), length > g_array_preview
+
     def __repr__(self):
-        data = self.getSlice()
+        data, more = self.preview()
 
         # Java very commonly uses character and byte arrays to express
         # text instead of strings, because they are mutable and have 
         # different encoding implications.
 
         if self.jni == '[C':
-            return repr(''.join(data))
+            return repr(''.join(data)) + ('...' if more else '')
         elif self.jni == '[B':
            
             '''
@@ -1621,71 +2385,95 @@ class Array(Object):
                     output +=chr(c)
             
             
-            return repr(output)       
+            return repr(output) + ('...' if more else '')
             #return repr(''.join(chr(c) for c in data))
         else:
-            return repr(data)
+            return repr(data) + ('...' if more else '')
 
     def __getitem__(self, index):
         if index < 0:
-            self.getSlice(index-1, index)
+            return self.getSlice(index-1, index)[0]
         else:
-            return self.getSlice(index, index+1)
+            return self.getSlice(index, index+1)[0]
     
     def __len__(self):
         return self.length
     
-    def __iter__(self): return iter(self.getSlice())
+    def __iter__(self):
+        return self.iterSlices()
 
     def __str__(self):
-       
-        return str(self.getSlice())
-    
-    
-    def genJson(self):
+        data, more = self.preview()
+        return str(data) + ('...' if more else '')
+
+    def iterSlices(self, window=None):
         '''
-        函数功能：为将数据以json格式输出做准备
-        参数：无
-        返回值：dict或list
-        author：
+        yields the items of the array, fetched window items at a time; the
+        request for the next window is sent before the items of the current
+        one are yielded, so it is in flight while they are consumed.
         '''
-        arrayData = self.getSlice()
-        data ={}
-        
-        
-        data["array_type"] = self.jni
-        data["array_data"] = str(arrayData)
-        
-
-        if self.jni == '[B':
-            #展示有效数据
-            output=''
-            for c in arrayData:
-                if c>=33 and c<=126:
-                    output +=chr(c)
-                else:
-                    output +="$"
-            data["array_data_show"] = str(output)
-            
-            
-        return data
-       
-           
-    @property  #将length方法当作属性使用
-    def length(self):
+        window = window or g_array_window
+        length = self.length
+        conn = self.conn
+        first = 0
+        pending = None
+        if length:
+            pending = conn.send(0x0d02, self.sliceRequest(0, min(window, length)))
+        try:
+            while pending is not None:
+                code, buf = conn.wait(pending, g_jdwp_request_timeout)
+                pending = None
+                if code != 0:
+                    raise RequestError(code)
+                first += window
+                if first < length:
+                    pending = conn.send(
+                        0x0d02, self.sliceRequest(first, min(window, length - first))
+                    )
+                for item in self.unpackSlice(buf):
+                    yield item
+        finally:
+            # an iteration stopped early still collects the window in flight,
+            # so the connection does not count it as outstanding forever
+            if pending is not None:
+                conn.wait(pending, g_jdwp_request_timeout)
+
+    def load_length(self):
         '''
         1、命令  0x0d 0x01
         2、注释：返回数组的长度
         3、[ArrayReference Command Set (13)][Length Command (1)]
         '''
-        conn = self.conn
-        buf = conn.buffer()
-        self.packTo(buf)  #调用父类Object的方法，获取object id的值
         log.debug("study", "call jdwp 0x0d 01")
-        code, buf = conn.request(0x0d01, buf.data(), g_jdwp_request_timeout)        
+        code, buf = self.conn.request(0x0d01, self.objectRequest(), g_jdwp_request_timeout)        
         if code != 0:
             raise RequestError(code)
-        return buf.unpackInt()
+        self.unpackLength(buf)
+
+    def unpackLength(self, buf):
+        self.length = buf.unpackInt()
+
+    # arrays never change length, so it is fetched once per Array
+    length = defer(load_length, 'length')
+
+    def sliceRequest(self, first, count):
+        'packs an ArrayReference.GetValues request for count items from first'
+        buf = self.conn.buffer()
+        self.packTo(buf)  #传入参数object id
+        buf.packInt(first) #传入数组的起始位置
+        buf.packInt(count) #传入要获取的数组的个数
+        return buf.data()
+
+    def unpackSlice(self, buf):
+        'unpacks the response to sliceRequest into a list of values'
+        tag = buf.unpackU8()
+        ct = buf.unpackInt()
+        
+        sess = self.sess
+        if tag in OBJECT_TAGS:
+            return list(unpack_value(sess, buf) for i in range(ct))  #处理对象类型的元素
+        else:
+            return list(unpack_value(sess, buf, tag) for i in range(ct)) #处理主类型的元素
 
     def getSlice(self, first=0, last=-1):
         '''
@@ -1712,29 +2500,19 @@ class Array(Object):
         count = last - first
         if not count: return []
 
-        conn = self.conn
-        buf = conn.buffer()
-        self.packTo(buf)  #传入参数object id
-        buf.packInt(first) #传入数组的起始位置
-        buf.packInt(count) #传入要获取的数组的个数
         log.debug("study", "call jdwp 0x0d 02")
-        code, buf = conn.request(0x0d02, buf.data(), g_jdwp_request_timeout)
+        code, buf = self.conn.request(0x0d02, self.sliceRequest(first, count), g_jdwp_request_timeout)
         if code != 0:
             raise RequestError(code)
-        tag = buf.unpackU8()
-        ct = buf.unpackInt()
-        
-        sess = self.sess
-        if tag in OBJECT_TAGS:
-            return list(unpack_value(sess, buf) for i in range(ct))  #处理对象类型的元素
-        else:
-            return list(unpack_value(sess, buf, tag) for i in range(ct)) #处理主类型的元素
+        return self.unpackSlice(buf)
 
 PRIMITIVE_TAGS = set(ord(c) for c in 'BCFDIJSVZ')
 OBJECT_TAGS = set(ord(c) for c in 'stglcL')
 
 #在statics文件的andbug.screed.item("%s = %s" % (k, v))代码中用到vm.String类中的__str__函数，进而调用data(self)发起"call jdwp 0x0A 01"命令
 class String(Object):
+    __slots__ = deferred('data')
+
     def __repr__(self):
         return repr(str(self))
 
@@ -1745,24 +2523,28 @@ class String(Object):
         return repr(str(self))
     
     
-    @property
-    def data(self):
+    def load_data(self):
         '''
         1、命令  0x0a 0x01
         2、注释：返回一个字符串中包含的字符内容
         3、[StringReference Command Set (10)][Value Command (1)]
         '''
-        conn = self.conn
-        buf = conn.buffer()
-        self.packTo(buf) #将oid参数压入jdwp命令的输入参数
-        
-        log.debug("study", "buf=" + str(buf))
         log.debug("study", "call jdwp 0x0A 01")
-        code, buf = conn.request(0x0A01, buf.data(), g_jdwp_request_timeout)  #需要输入string对象的object id的值
+        code, buf = self.conn.request(0x0A01, self.objectRequest(), g_jdwp_request_timeout)  #需要输入string对象的object id的值
         if code != 0:        
             raise RequestError(code)
-        
-        return buf.unpackStr()
+        self.unpackData(buf)
+
+    def unpackData(self, buf):
+        self.data = buf.unpackStr()
+
+    # strings are immutable, so the content is fetched once per String
+    data = defer(load_data, 'data')
+
+# value types whose class is implied by their value tag; see Session.knownType
+KNOWN_TYPES = {
+    String: 'Ljava/lang/String;',
+}
 
 unpack_value_impl = [None,] * 256
 
@@ -1854,5 +2636,17 @@ def pack_value(sess, buf, value, tag = None):
 def connect(pid, dev=None):
     'connects using proto.forward() to the process associated with this context'
     conn = andbug.proto.connect(andbug.proto.forward(pid, dev))  #conn是Connection(Thread)类型的一个对象
-    return andbug.vm.Session(conn)
+    sess = andbug.vm.Session(conn)
+    # fingerprinting the code takes adb round trips, and reading --apk files
+    # takes a while; until the cache is open, metadata is fetched as usual
+    warm = threading.Thread(name='Cache', target=warm_up, args=(sess, pid, dev))
+    warm.daemon = True
+    warm.start()
+    return sess
+
+def warm_up(sess, pid, dev=None):
+    'opens and fills the metadata cache of a session, then starts prefetching'
+    sess.cache = andbug.cache.open_cache(pid, dev, andbug.dex.signatures())
+    andbug.dex.prepopulate(sess.cache)
+    andbug.prefetch.start(sess)
 
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under
+## the terms of version 3 of the GNU Lesser General Public License as
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The andbug.vmtrace module drives Dalvik's own method tracer over DDM, and
+reads the traces it produces (the dmtrace format of traceview) into call
+counts and inclusive and exclusive times per method.
+
+A trace starts with a text header, listing the threads and the methods it
+mentions, then holds a binary record for each method entry and exit.  The
+VM sends the whole trace in one MPSE chunk, so it is held in memory until
+it is saved, bounded by the VM's trace buffer; once saved, its records are
+read back from the file a block at a time.  Method ids in a trace are the same as the
+JDWP method ids of Dalvik, so methods the header does not name can be named
+from the session's metadata instead.
+'''
+
+import struct
+from Queue import Queue, Empty as EmptyQueue
+import andbug.config
+from andbug.proto import DdmError
+
+MAGIC = 0x574f4c53 # 'SLOW'
+ENTER, EXIT, UNROLL = 0, 1, 2 # the low two bits of a method value
+BLOCK = 1 << 16
+
+def start(conn, size=None, flags=0):
+    'starts streaming method tracing, to a VM buffer of size bytes'
+    conn.ddm('MPSS', struct.pack('>II', size or andbug.config.g_Vmtrace_Buffer, flags))
+
+def stop(conn, timeout=None):
+    '''
+    stops method tracing and returns the trace; the VM sends it whole, as an
+    MPSE chunk of its own rather than in the reply.
+    '''
+    queue = Queue()
+    conn.subscribe('MPSE', queue)
+    try:
+        for kind, payload in conn.ddm('MPSE'):
+            if kind == 'MPSE' and payload:
+                return payload
+        try:
+            return queue.get(True, timeout or andbug.config.g_Vmtrace_Timeout)
+        except EmptyQueue:
+            raise DdmError(None, 'no trace received')
+    finally:
+        conn.unsubscribe('MPSE', queue)
+
+def save(data, path):
+    'writes a trace, as returned by stop, to path'
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def read_header(f):
+    '''
+    reads the text header of a trace; returns its options, and its thread
+    and method names by id.
+    '''
+    options = {}
+    threads = {}
+    methods = {}
+    section = None
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError('truncated trace header')
+        line = line.rstrip('\n')
+        if line.startswith('*'):
+            section = line[1:]
+            if section == 'end':
+                return options, threads, methods
+        elif section == 'version':
+            if '=' in line:
+                k, v = line.split('=', 1)
+                options[k] = v
+            else:
+                options['version'] = line
+        elif section == 'threads':
+            tid, name = line.split('\t', 1)
+            threads[int(tid)] = name
+        elif section == 'methods':
+            cols = line.split('\t')
+            methods[int(cols[0], 16)] = '%s.%s%s' % tuple(cols[1:4])
+
+def read_records(f, clock='dual'):
+    '''
+    reads the binary part of a trace, after its header; yields (thread,
+    method id, action, time in microseconds), with wall clock times when
+    the trace has them.
+    '''
+    magic, version, offset, started = struct.unpack('<IHHQ', f.read(16))
+    if magic != MAGIC:
+        raise ValueError('not a method trace')
+    size = {1: 9, 2: 10}.get(version)
+    if version >= 3:
+        size = struct.unpack('<H', f.read(2))[0]
+        f.read(offset - 18)
+    else:
+        f.read(offset - 16)
+    if version == 1:
+        fmt = '<BII'
+    else:
+        fmt = '<HII'
+    # with both clocks, thread cpu time comes first, then wall clock time
+    wall = 4 if clock == 'dual' and size >= 14 else 0
+    rest = ''
+    while True:
+        block = f.read(BLOCK)
+        if not block:
+            return
+        data = rest + block
+        end = len(data) - len(data) % size
+        for ofs in range(0, end, size):
+            thread, value, time = struct.unpack_from(fmt, data, ofs)
+            if wall:
+                time = struct.unpack_from('<I', data, ofs + size - 4)[0]
+            yield thread, value & ~3, value & 3, time
+        rest = data[end:]
+
+class Profile(object):
+    '''
+    call counts, inclusive and exclusive times per method, folded from the
+    records of a trace with a call stack per thread.  inclusive time only
+    counts the outermost call of a recursive method.
+    '''
+
+    def __init__(self):
+        self.calls = {}     # method id -> calls
+        self.inclusive = {} # method id -> microseconds
+        self.exclusive = {} # method id -> microseconds
+        self.stacks = {}    # thread -> [[method id, entered, time in callees], ...]
+
+    def add(self, thread, mid, action, time):
+        stack = self.stacks.setdefault(thread, [])
+        if action == ENTER:
+            stack.append([mid, time, 0])
+            return
+        # an exit, or an unroll by an exception; entries above it lost
+        # their exits to the unroll, and close here too
+        if not any(frame[0] == mid for frame in stack):
+            return # entered before tracing started
+        while stack:
+            m, entered, callees = stack.pop()
+            spent = time - entered
+            self.calls[m] = self.calls.get(m, 0) + 1
+            self.exclusive[m] = self.exclusive.get(m, 0) + spent - callees
+            if not any(frame[0] == m for frame in stack):
+                self.inclusive[m] = self.inclusive.get(m, 0) + spent
+            if stack:
+                stack[-1][2] += spent
+            if m == mid:
+                return
+
+    def read(self, f):
+        'folds the trace in f into this profile; returns its header'
+        options, threads, methods = read_header(f)
+        for record in read_records(f, options.get('clock', 'dual')):
+            self.add(*record)
+        return options, threads, methods
+
+    def rows(self, names, resolve=None):
+        '''
+        returns (name, calls, inclusive, exclusive) for each method, most
+        exclusive time first; resolve names the ids names lacks.
+        '''
+        rows = []
+        for mid, calls in self.calls.items():
+            name = names.get(mid)
+            if name is None and resolve is not None:
+                name = resolve(mid)
+            rows.append((name or hex(mid), calls,
+                         self.inclusive.get(mid, 0), self.exclusive.get(mid, 0)))
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows
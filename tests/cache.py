@@ -0,0 +1,140 @@
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+import os, shutil, tempfile
+import andbug.util, andbug.cache
+from andbug.cache import MetaCache, LINES, SLOTS, method_key, fingerprint
+from unittest import TestCase, main as test_main
+
+class FakeType(object):
+    def __init__(self, tid, jni, names):
+        self.tid = tid
+        self.jni = jni
+        self.methodList = list(FakeMethod(self, name) for name in names)
+
+class FakeMethod(object):
+    def __init__(self, klass, name):
+        self.klass = klass
+        self.tid = klass.tid
+        self.name = name
+        self.jni = '()V'
+
+class TestMetaCache(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'meta')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_roundtrip(self):
+        cache = MetaCache(self.path)
+        t = FakeType(1, 'La/B;', ('run', 'stop'))
+        cache.attach(t)
+        run = t.methodList[0]
+        self.assertEqual(cache.get(run, LINES), None)
+        cache.put(run, LINES, (0, 10, ((0, 1), (4, 2))))
+        cache.put(run, SLOTS, (1, ((0, 'this', 'La/B;', '', 10, 0),)))
+        cache.close()
+
+        # ids change from one session to the next; entries do not
+        cache = MetaCache(self.path)
+        t = FakeType(7, 'La/B;', ('run', 'stop'))
+        cache.attach(t)
+        run = t.methodList[0]
+        self.assertEqual(cache.get(run, LINES), (0, 10, ((0, 1), (4, 2))))
+        self.assertEqual(cache.get(run, SLOTS)[0], 1)
+        self.assertEqual(cache.get(t.methodList[1], LINES), None)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        cache.close()
+
+    def test_stale(self):
+        cache = MetaCache(self.path)
+        t = FakeType(1, 'La/B;', ('run',))
+        cache.attach(t)
+        cache.put(t.methodList[0], LINES, (0, 1, ()))
+        t = FakeType(2, 'La/B;', ('run', 'added'))
+        cache.attach(t)
+        self.assertEqual(cache.get(t.methodList[0], LINES), None)
+        cache.close()
+
+    def test_attach_on_demand(self):
+        cache = MetaCache(self.path)
+        attached = []
+        class Lazy(FakeType):
+            @property
+            def methodList(self):
+                cache.attach(self.real)
+                attached.append(1)
+                return self.real.methodList
+        t = FakeType(3, 'La/C;', ('run',))
+        lazy = object.__new__(Lazy)
+        lazy.tid = 3
+        lazy.real = t
+        run = FakeMethod(t, 'run')
+        run.klass = lazy
+        cache.put(run, LINES, (0, 1, ()))
+        self.assertEqual(attached, [1])
+        self.assertEqual(cache.get(run, LINES), (0, 1, ()))
+        cache.close()
+
+    def test_update(self):
+        cache = MetaCache(self.path)
+        sigs = (method_key('run', '()V'),)
+        cache.update('La/D;', sigs, {(LINES, sigs[0]): (0, 2, ((0, 5),))})
+        t = FakeType(4, 'La/D;', ('run',))
+        cache.attach(t)
+        self.assertEqual(cache.get(t.methodList[0], LINES), (0, 2, ((0, 5),)))
+        cache.close()
+
+    def test_close_all(self):
+        cache = MetaCache(self.path)
+        cache.stamp('dex:1')
+        cache.sync()
+        self.assertTrue(cache in andbug.cache.OPEN)
+        andbug.cache.close_all()
+        self.assertEqual(andbug.cache.OPEN, [])
+        # closed caches hold nothing, and may be closed again
+        self.assertFalse(cache.stamped('dex:1'))
+        cache.sync()
+        cache.close()
+        cache = MetaCache(self.path)
+        self.assertTrue(cache.stamped('dex:1'))
+        cache.close()
+
+class TestFingerprint(TestCase):
+    def setUp(self):
+        self.adb = andbug.util.adb
+        self.apks = '/data/app/a.b-1/base.apk 1024 1760836800\n'
+        def adb(*args):
+            cmd = args[-1]
+            if cmd.startswith('getprop'):
+                return 'brand/product:9/build\na.b:remote\0\0'
+            self.assertTrue('pm path a.b' in cmd)
+            return self.apks
+        andbug.util.adb = adb
+
+    def tearDown(self):
+        andbug.util.adb = self.adb
+
+    def test_fingerprint(self):
+        stamp = fingerprint(42)
+        self.assertEqual(stamp, 'brand/product:9/build|a.b|/data/app/a.b-1/base.apk 1024 1760836800|')
+        # the same version, reinstalled a minute later
+        self.apks = '/data/app/a.b-2/base.apk 1024 1760836860\n'
+        self.assertNotEqual(fingerprint(42), stamp)
+        self.assertNotEqual(fingerprint(42, salt='abc'), fingerprint(42))
+
+if __name__ == '__main__':
+    test_main()
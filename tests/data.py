@@ -0,0 +1,105 @@
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+from andbug.data import pool, intervals
+from unittest import TestCase, main as test_main
+import gc
+
+class Item(object):
+    def __init__(self, key):
+        self.key = key
+
+class TestPool(TestCase):
+    def test_singleton(self):
+        p = pool()
+        a = p(Item, 1)
+        self.assertTrue(p(Item, 1) is a)
+        self.assertFalse(p(Item, 2) is a)
+        st = p.stats()
+        self.assertEqual((st['hits'], st['misses'], st['size']), (1, 2, 2))
+
+    def test_weak(self):
+        p = pool()
+        p.policy(Item, 'weak')
+        a = p(Item, 1)
+        self.assertTrue(p(Item, 1) is a)
+        del a
+        gc.collect()
+        self.assertEqual(p.stats()['evictions'], 1)
+        self.assertEqual(p.stats()['size'], 0)
+        self.assertEqual(p(Item, 1).key, 1)
+
+    def test_lru(self):
+        p = pool(shards=1)
+        p.policy(Item, 'lru', 2)
+        a = p(Item, 1)
+        p(Item, 2)
+        p(Item, 1)
+        p(Item, 3)
+        self.assertEqual(p.stats()['evictions'], 1)
+        self.assertTrue(p(Item, 1) is a)
+
+    def test_pin(self):
+        p = pool(shards=1)
+        p.policy(Item, 'lru', 1)
+        a = p(Item, 1)
+        p.pin(a)
+        p(Item, 2)
+        p(Item, 3)
+        self.assertTrue(p(Item, 1) is a)
+        p.unpin(a)
+        p(Item, 4)
+        a.key = None
+        del a
+        gc.collect()
+        self.assertEqual(p(Item, 1).key, 1)
+
+    def test_lru_referenced(self):
+        p = pool(shards=1)
+        p.policy(Item, 'lru', 1)
+        a = p(Item, 1)
+        p(Item, 2)
+        p(Item, 3)
+        # evicted from the LRU order, but still referenced, so not made again
+        self.assertTrue(p(Item, 1) is a)
+        gc.collect()
+        st = p.stats()
+        self.assertEqual((st['evictions'], st['size']), (2, 1))
+
+    def test_objects(self):
+        p = pool()
+        p.policy(Item, 'weak')
+        a, b = p(Item, 1), p(Item, 2)
+        p(Item, 3)
+        p(dict)
+        gc.collect()
+        self.assertEqual(sorted(i.key for i in p.objects(Item)), [1, 2])
+
+class TestIntervals(TestCase):
+    def test_lookup(self):
+        m = intervals([(0, 10, 'this'), (2, 5, 'i'), (6, 10, 'j')])
+        self.assertEqual(m[-1], ())
+        self.assertEqual(m[0], ('this',))
+        self.assertEqual(m[2], ('this', 'i'))
+        self.assertEqual(m[5], ('this', 'i'))
+        self.assertEqual(m[6], ('this', 'j'))
+        self.assertEqual(m[10], ('this', 'j'))
+        self.assertEqual(m[11], ())
+        self.assertTrue(m[3] is m[4])
+
+    def test_empty(self):
+        self.assertEqual(intervals()[0], ())
+
+if __name__ == '__main__':
+    test_main()
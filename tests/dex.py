@@ -0,0 +1,104 @@
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+import struct
+from andbug.dex import DexFile, uleb128, sleb128, uleb128p1
+from andbug.cache import LINES, SLOTS
+from unittest import TestCase, main as test_main
+
+STRINGS = ('I', 'La/B;', 'V', 'n', 'run', 'x')
+I, B, V, N, RUN, X = range(6)
+NO = 0xFFFFFFFF
+
+# v0 holds the local x from 2 to 4, v1 is this, v2 the parameter n
+DEBUG = (
+    '\x0a\x01\x04'       # line_start 10, one parameter named n
+    '\x0e'               # position 0, line 10
+    '\x01\x02'           # advance pc to 2
+    '\x03\x00\x06\x01'   # start local x (I) in v0
+    '\x2d'               # position 4, line 11
+    '\x05\x00'           # end local v0
+    '\x00'
+)
+
+def build_dex():
+    'builds a dex defining La/B; with the single method void run(int n)'
+    data = ''
+    base = 0x70 + 4 * len(STRINGS) + 4 * 3 + 12 + 8 + 32
+
+    def put(blob):
+        off = base + len(data)
+        return off, data + blob
+
+    string_offs = []
+    for s in STRINGS:
+        off, data = put(chr(len(s)) + s + '\0')
+        string_offs.append(off)
+    data += '\0' * (-len(data) % 4)
+    params_off, data = put(struct.pack('<IH', 1, I) + '\0\0')
+    debug_off, data = put(DEBUG)
+    data += '\0' * (-len(data) % 4)
+    code_off, data = put(struct.pack('<4H2I', 3, 2, 0, 0, debug_off, 6) + '\0' * 12)
+    # no fields, one virtual method: idx 0, public, code
+    class_data, data = put('\x00\x00\x00\x01\x00\x01' + chr(0x80 | (code_off & 0x7F)) + chr(code_off >> 7))
+
+    header = 'dex\n035\0' + '\0' * 0x30
+    off = 0x70
+    counts = ((len(STRINGS), 4), (3, 4), (1, 12), (0, 8), (1, 8), (1, 32))
+    for ct, size in counts:
+        header += struct.pack('<2I', ct, off if ct else 0)
+        off += ct * size
+    header += '\0' * (0x70 - len(header))
+    tables = ''.join(struct.pack('<I', o) for o in string_offs)
+    tables += struct.pack('<3I', I, B, V)
+    tables += struct.pack('<3I', V, V, params_off)
+    tables += struct.pack('<2HI', B, 0, RUN)
+    tables += struct.pack('<8I', B, 1, NO, 0, NO, 0, class_data, 0)
+    return header + tables + data
+
+class TestLeb(TestCase):
+    def test_leb(self):
+        self.assertEqual(uleb128('\xe5\x8e\x26', 0), (624485, 3))
+        self.assertEqual(sleb128('\x7f', 0), (-1, 1))
+        self.assertEqual(sleb128('\x80\x7f', 0), (-128, 2))
+        self.assertEqual(uleb128p1('\x00', 0), (-1, 1))
+
+class TestDexFile(TestCase):
+    def test_classes(self):
+        dex = DexFile(build_dex())
+        classes = list(dex.classes())
+        self.assertEqual(len(classes), 1)
+        cls, methods = classes[0]
+        self.assertEqual(cls, 'La/B;')
+        self.assertEqual(list((m.name, m.jni, m.flags) for m in methods), [('run', '(I)V', 1)])
+
+    def test_debug(self):
+        dex = DexFile(build_dex())
+        method = list(dex.classes())[0][1][0]
+        lines, slots = dex.debug(method)
+        self.assertEqual(lines, ((0, 10), (4, 11)))
+        self.assertEqual(slots, (
+            (2, 'x', 'I', '', 2, 1000),
+            (0, 'this', 'La/B;', '', 6, 0),
+            (0, 'n', 'I', '', 6, 2),
+        ))
+
+    def test_tables(self):
+        cls, sigs, tables = list(DexFile(build_dex()).tables())[0]
+        self.assertEqual(sigs, ['run(I)V'])
+        self.assertEqual(tables[(LINES, 'run(I)V')], (0, 5, ((0, 10), (4, 11))))
+        self.assertEqual(tables[(SLOTS, 'run(I)V')][0], 2)
+
+if __name__ == '__main__':
+    test_main()
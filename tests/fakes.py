@@ -0,0 +1,105 @@
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under
+## the terms of version 3 of the GNU Lesser General Public License as
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'a connection to no process at all, shared by the tests of sessions'
+
+import andbug.jdwp
+from andbug.vm import Session
+
+def buffer():
+    buf = andbug.jdwp.JdwpBuffer()
+    buf.config(1,2,2,4,8) # f, m, o, t, s
+    return buf
+
+class FakeConn(object):
+    '''
+    answers requests with reply(code, data), which returns the data of the
+    response, or an (error, data) pair, and records each batch of (code,
+    data) requests.  DDM chunks are recorded in sent; an MPSE chunk is
+    answered with trace, to the queues subscribed to it.  quiet is false for
+    the first busy polls.
+    '''
+    def __init__(self, reply=None, trace=None, busy=0):
+        self.reply = reply
+        self.trace = trace
+        self.busy = busy
+        self.batches = []
+        self.sent = []
+        self.queues = []
+        self.peeks = {}
+        self.polls = 0
+
+    def buffer(self):
+        return buffer()
+
+    def codes(self):
+        'the codes of the requests of each batch'
+        return list(list(code for code, data in batch) for batch in self.batches)
+
+    def configure(self, priority=None, **params):
+        pass
+
+    def setPriority(self, priority):
+        pass
+
+    def hook(self, code, chan):
+        pass
+
+    def peek(self, code, func):
+        self.peeks[code] = func
+
+    def quiet(self, idle):
+        self.polls += 1
+        return self.polls > self.busy
+
+    def answer(self, code, data):
+        res = self.reply(code, data)
+        err, res = res if isinstance(res, tuple) else (0, res)
+        if err == 0 and code in self.peeks:
+            self.peeks[code](res)
+        buf = self.buffer()
+        buf.prepareUnpack(res)
+        return err, buf
+
+    def request(self, code, data='', timeout=None):
+        return self.wait(self.send(code, data))
+
+    def send(self, code, data=''):
+        self.batches.append([(code, data)])
+        return code, data
+
+    def wait(self, queue, timeout=None):
+        return self.answer(*queue)
+
+    def requestMany(self, requests, timeout=None):
+        requests = list(requests)
+        self.batches.append(requests)
+        return list(self.answer(code, data) for code, data in requests)
+
+    def ddm(self, kind, data='', timeout=None):
+        self.sent.append((kind, data))
+        if kind == 'MPSE':
+            for queue in self.queues:
+                queue.put(self.trace)
+        return []
+
+    def subscribe(self, kind, chan):
+        self.queues.append(chan)
+
+    def unsubscribe(self, kind, chan):
+        self.queues.remove(chan)
+
+def session(conn=None):
+    'returns a Session on conn, or on a connection never asked anything'
+    return Session(conn or FakeConn())
@@ -0,0 +1,84 @@
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+import andbug.graph
+from andbug.vm import Object
+from unittest import TestCase, main as test_main
+from tests.fakes import FakeConn, buffer, session
+from cStringIO import StringIO
+import json
+
+def reply(code, data):
+    'a process of Lb/Node; objects, where object n refers to n % 3 + 1'
+    buf = buffer()
+    if code == 0x0901:
+        return buf.pack('1t', 1, 0x10)
+    if code == 0x020D:
+        return buf.pack('$$', 'Lb/Node;', '')
+    if code == 0x020E:
+        return buf.pack('4f$$$if$$$i', 2, 1, 'n', 'I', '', 0, 2, 'next', 'Lb/Node;', '', 0)
+    assert code == 0x0902
+    oid = ord(data[3]) # packed as a type id, see Object.fieldsRequest
+    return buf.pack('41412', 2, ord('I'), oid, ord('L'), oid % 3 + 1)
+
+class TestWriters(TestCase):
+    def write(self, out):
+        out.begin_object()
+        out.key('a')
+        out.begin_array()
+        out.value(1)
+        out.value('x')
+        out.begin_object()
+        out.end_object()
+        out.end_array()
+        out.key('b')
+        out.value(None)
+        out.end_object()
+        return out
+
+    def test_equivalent(self):
+        buf = StringIO()
+        self.write(andbug.graph.JsonWriter(buf))
+        tree = self.write(andbug.graph.TreeWriter()).root
+        self.assertEqual(json.loads(buf.getvalue()), tree)
+        self.assertEqual(tree, {'a': [1, 'x', {}], 'b': None})
+
+class TestGraph(TestCase):
+    def test_cycle(self):
+        sess = session(FakeConn(reply))
+        root = sess.pool(Object, sess, 1)
+        tree = andbug.graph.tree(sess, root, depth=5)
+        # 1 -> 2 -> 3 -> 1: types, then fields, for each level; the first
+        # level also loads the signature and field list of the class
+        self.assertEqual(tree['object_type'], 'Lb/Node;')
+        second = tree['fields_infor']['next']
+        third = second['fields_infor']['next']
+        self.assertEqual(third['fields_infor']['n'], 3)
+        self.assertEqual(third['fields_infor']['next'], {'$ref': 1})
+        self.assertEqual(len(sess.conn.batches), 7)
+
+    def test_limits(self):
+        sess = session(FakeConn(reply))
+        root = sess.pool(Object, sess, 1)
+        tree = andbug.graph.tree(sess, root, depth=0)
+        self.assertEqual(tree['fields_infor']['next']['object_id'], 2)
+        self.assertTrue(tree['fields_infor']['next']['truncated'])
+
+        buf = StringIO()
+        size = andbug.graph.dump(sess, root, buf, size=1)
+        self.assertEqual(size, len(buf.getvalue()))
+        self.assertTrue(json.loads(buf.getvalue())['fields_infor']['next']['truncated'])
+
+if __name__ == '__main__':
+    test_main()
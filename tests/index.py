@@ -0,0 +1,71 @@
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+from andbug.errors import OptionError
+from andbug.index import ClassIndex, jni_to_name, name_to_jni
+from unittest import TestCase, main as test_main
+
+JNIS = (
+    'Lcom/foo/Bar;', 'Lcom/foo/Bar$1;', 'Lcom/foo/IBaz$Stub;',
+    'Lcom/foobar/Qux;', 'Landroid/app/Activity;', '[I'
+)
+
+def make_index():
+    return ClassIndex((jni, i) for i, jni in enumerate(JNIS))
+
+class TestClassIndex(TestCase):
+    def test_names(self):
+        self.assertEqual(jni_to_name('Lcom/foo/Bar;'), 'com.foo.Bar')
+        self.assertEqual(jni_to_name('[I'), '[I')
+        self.assertEqual(name_to_jni('com.foo.Bar'), 'Lcom/foo/Bar;')
+        self.assertEqual(make_index().name('Lcom/foo/Bar$1;'), 'com.foo.Bar$1')
+
+    def test_exact(self):
+        idx = make_index()
+        self.assertEqual(idx.find('Lcom/foo/Bar;'), [0])
+        self.assertEqual(idx.find('Lcom/foo/Ba;'), [])
+
+    def test_duplicates(self):
+        idx = ClassIndex((('La;', 1), ('Lb;', 2), ('La;', 3)))
+        self.assertEqual(sorted(idx.find('La;')), [1, 3])
+
+    def test_prefix(self):
+        idx = make_index()
+        self.assertEqual(sorted(idx.prefix('Lcom/foo/')), [0, 1, 2])
+        self.assertEqual(sorted(idx.prefix('Lcom/foo')), [0, 1, 2, 3])
+
+    def test_glob(self):
+        idx = make_index()
+        self.assertEqual(sorted(idx.find('Lcom/foo/*;')), [0, 1, 2])
+        self.assertEqual(idx.find('L*$Stub;'), [2])
+        self.assertEqual(idx.find('Lcom/foo/Bar$?;'), [1])
+
+    def test_regex(self):
+        idx = make_index()
+        self.assertEqual(idx.find('/Activity$/'), [4])
+        self.assertEqual(sorted(idx.find('/^com\\.foo\\./')), [0, 1, 2])
+        self.assertRaises(OptionError, idx.find, '/Bar(/')
+
+    def test_search(self):
+        idx = make_index()
+        self.assertEqual(len(list(idx.search())), len(JNIS))
+        self.assertEqual(
+            sorted(n for n, i in idx.search('foobar')), ['com.foobar.Qux']
+        )
+        self.assertEqual(
+            list(n for n, i in idx.search('*$Stub')), ['com.foo.IBaz$Stub']
+        )
+
+if __name__ == '__main__':
+    test_main()
@@ -0,0 +1,99 @@
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Memory benchmark for pooled session elements; run directly to print the
+bytes per element, before (dict-backed, with a props dict for deferred
+values) and after (__slots__ with slot-backed deferred values):
+
+    PYTHONPATH=lib python2 tests/memory.py
+'''
+
+import sys
+import andbug.data
+from andbug.vm import Location, Method, Slot, Field, Frame
+from unittest import TestCase, main as test_main
+
+class FakeSession(object):
+    def __init__(self):
+        self.pool = andbug.data.pool()
+
+class Legacy(object):
+    'the pre-__slots__ layout: an instance dict, plus props for deferrals'
+    def __init__(self, plain, deferred):
+        self.__dict__.update(plain)
+        if deferred:
+            self.props = dict(deferred)
+
+def footprint(obj):
+    'bytes held by the element itself, not counting shared values'
+    size = sys.getsizeof(obj)
+    attrs = getattr(obj, '__dict__', None)
+    if attrs is not None:
+        size += sys.getsizeof(attrs)
+        props = attrs.get('props')
+        if props is not None:
+            size += sys.getsizeof(props)
+    return size
+
+def samples(sess):
+    'yields (kind, slotted element, equivalent legacy element)'
+    loc = Location(sess, 0x1000, 0x2000, 12)
+    loc.line = 40
+    yield 'Location', loc, Legacy(dict(
+        sess=sess, tid=0x1000, mid=0x2000, loc=12, line=40
+    ), None)
+
+    m = Method(sess, 0x1000, 0x2000)
+    m.name, m.jni, m.gen, m.flags = 'run', '()V', '', 1
+    yield 'Method', m, Legacy(dict(sess=sess, tid=0x1000, mid=0x2000), dict(
+        name='run', jni='()V', gen='', flags=1
+    ))
+
+    s = Slot(sess, 0x1000, 0x2000, 3)
+    s.firstLoc, s.locLength, s.name, s.jni, s.gen = 0, 20, 'i', 'I', ''
+    yield 'Slot', s, Legacy(dict(
+        sess=sess, tid=0x1000, mid=0x2000, index=3
+    ), dict(firstLoc=0, locLength=20, name='i', jni='I', gen=''))
+
+    f = Field(sess, 0x3000)
+    f.name, f.jni, f.gen, f.flags = 'count', 'I', '', 2
+    yield 'Field', f, Legacy(dict(
+        sess=sess, fid=0x3000, name='count', jni='I', gen='', flags=2
+    ), None)
+
+    fr = Frame(sess, 0x4000)
+    fr.loc, fr.tid = loc, 0x5000
+    yield 'Frame', fr, Legacy(dict(
+        sess=sess, fid=0x4000, loc=loc, tid=0x5000
+    ), None)
+
+def report(out=sys.stdout):
+    sess = FakeSession()
+    out.write('%-10s %8s %8s\n' % ('element', 'before', 'after'))
+    for kind, new, old in samples(sess):
+        out.write('%-10s %8i %8i\n' % (kind, footprint(old), footprint(new)))
+
+class TestMemory(TestCase):
+    def test_slots_shrink_elements(self):
+        sess = FakeSession()
+        for kind, new, old in samples(sess):
+            self.assertFalse(hasattr(new, '__dict__'), kind)
+            self.assertTrue(footprint(new) < footprint(old), kind)
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['test']:
+        del sys.argv[1:]
+        test_main()
+    report()
@@ -24,6 +24,9 @@ class TestOptions(TestCase):
         case('La/b/c/d;', 'La/b/c/d;')
         case('La;', 'La;')
         case('a', 'La;')
+        case('com.foo.*', 'Lcom/foo/*;')
+        case('*$Stub', 'L*$Stub;')
+        case('/Activity$/', '/Activity$/')
     
     def test_mquery(self):
         def case(c, m, (cp, mn, mj)):
@@ -0,0 +1,64 @@
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+import andbug.index
+from andbug.vm import ClassTable
+from andbug.prefetch import Prefetcher, jni_prefix
+from unittest import TestCase, main as test_main
+from tests.fakes import FakeConn, session
+
+class TestPrefetcher(TestCase):
+    def test_prefixes(self):
+        self.assertEqual(jni_prefix('com.foo.'), 'Lcom/foo/')
+        self.assertEqual(jni_prefix('Lcom/foo/'), 'Lcom/foo/')
+
+    def test_prefetch(self):
+        def reply(code, data):
+            buf = conn.buffer()
+            if code == 0x020F: # run() has code, stop() is abstract, go() is native
+                return 0, buf.pack('4m$$$im$$$im$$$i',
+                    3, 1, 'run', '()V', '', 1, 2, 'stop', '()V', '', 0x400,
+                    3, 'go', '()V', '', 0x100)
+            mid = ord(data[-1])
+            if code == 0x0601:
+                return 0, buf.pack('88i8i', 0, 4, 1, 0, 12)
+            self.assertEqual(code, 0x0605)
+            if mid == 3:
+                return 101, '' # ABSENT_INFORMATION
+            return 0, buf.pack('iil$$$ii', 1, 1, 0, 'this', 'La/B;', '', 5, 0)
+        conn = FakeConn(reply, busy=2) # busy until polled twice
+        sess = session(conn)
+        table = ClassTable(sess)
+        table.append(1, 0x10, 'La/B;', '', 0)
+        table.append(1, 0x20, 'Lb/C;', '', 0)
+        sess.classTable = table
+        sess.classIndex = andbug.index.ClassIndex(table.rows())
+
+        worker = Prefetcher(sess, ('a.',), batch=3, idle=0)
+        worker.prefetch()
+        self.assertEqual(conn.polls, 5)
+        self.assertEqual(conn.codes(), [[0x020F], [0x0601, 0x0605, 0x0601], [0x0605]])
+        self.assertEqual((worker.classes, worker.methods), (1, 3))
+        self.assertEqual((worker.requests, worker.failures), (5, 1))
+
+        run = table[0].methodList[0]
+        self.assertEqual(run.lineTable[12].loc, 0)
+        self.assertEqual(run.slots[0].name, 'this')
+
+        worker = Prefetcher(sess, ('La/',), idle=0)
+        worker.prefetch()
+        self.assertEqual(conn.codes()[3:], [[0x0605]])
+
+if __name__ == '__main__':
+    test_main()
@@ -13,9 +13,12 @@
 ## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
 
 from andbug.proto import Connection, HANDSHAKE_MSG, IDSZ_REQ
+from andbug.proto import INTERACTIVE, CAPTURE, PREFETCH, Flow
+from andbug.proto import pack_chunk, unpack_chunks, unpack_fail, DdmError, ProtocolError
+from Queue import Queue
 from unittest import TestCase, main as test_main
 from cStringIO import StringIO
-import sys
+import sys, threading
 
 IDSZ_RES = (
 	'\x00\x00\x00\x1F' # Length
@@ -75,5 +78,222 @@ class TestConnection(TestCase):
 		p = make_conn(h)
 		self.assertEqual(True, p.initialized)
 
+class PipelineHarness(IoHarness):
+	'an IoHarness that holds back replies until every request was written'
+	def __init__(self, test, convo, held):
+		IoHarness.__init__(self, test, convo)
+		self.held = held
+		self.written = threading.Event()
+
+	def read(self, length):
+		if self.readbuf.tell() >= self.held:
+			self.written.wait(5)
+		return IoHarness.read(self, length)
+
+	def write(self, data):
+		IoHarness.write(self, data)
+		if self.writebuf.tell() == len(self.writebuf.getvalue()):
+			self.written.set()
+
+PIPE_REQ = (
+	'\x00\x00\x00\x0B' # Length
+	'\x00\x00\x00\x05' # Identifier
+	'\x00'             # Request
+	'\x43\x43'         # Command
+)
+
+PIPE_RES = (
+	'\x00\x00\x00\x0F' # Length
+	'\x00\x00\x00\x05' # Identifier
+	'\x80'             # Response
+	'\x00\x00'         # Success
+	'\x00\x00\x00\x2A' # Payload
+)
+
+class TestPipeline(TestCase):
+	def test_request_many(self):
+		h = PipelineHarness(self, [
+			(HANDSHAKE_MSG, HANDSHAKE_MSG),
+			(IDSZ_REQ, IDSZ_RES),
+			(SAMPLE_REQ + PIPE_REQ, SAMPLE_RES + PIPE_RES),
+		], len(HANDSHAKE_MSG + IDSZ_RES))
+		p = make_conn(h)
+		res = p.requestMany(((0x4242, ''), (0x4343, '')), 5)
+		self.assertEqual(2, len(res))
+		self.assertEqual(0, res[0][0])
+		self.assertEqual(0, res[1][0])
+		self.assertEqual(42, res[1][1].unpackInt())
+		self.assertTrue(p.quiet(0))
+
+	def test_peek(self):
+		h = PipelineHarness(self, [
+			(HANDSHAKE_MSG, HANDSHAKE_MSG),
+			(IDSZ_REQ, IDSZ_RES),
+			(SAMPLE_REQ + PIPE_REQ, SAMPLE_RES + PIPE_RES),
+		], len(HANDSHAKE_MSG + IDSZ_RES))
+		peeked = []
+		p = Connection(h.read, h.write)
+		p.peek(0x4343, peeked.append)
+		p.start()
+		res = p.requestMany(((0x4242, ''), (0x4343, '')), 5)
+		self.assertEqual(['\x00\x00\x00\x2A'], peeked)
+		self.assertEqual({}, p.peeking)
+
+class TestScheduler(TestCase):
+	def test_quiet(self):
+		p = Connection(None, None)
+		self.assertTrue(p.quiet(0))
+		ident = p.admit(INTERACTIVE)
+		self.assertFalse(p.quiet(0))
+		p.release(ident)
+		self.assertTrue(p.quiet(0))
+		self.assertFalse(p.quiet(60))
+		p.release(p.admit(PREFETCH))
+		self.assertTrue(p.quiet(0))
+
+	def test_window(self):
+		p = Connection(None, None)
+		p.configure(PREFETCH, size=2)
+		idents = [p.admit(PREFETCH), p.admit(PREFETCH)]
+		self.assertFalse(p.admissible(PREFETCH))
+		self.assertTrue(p.admissible(CAPTURE))
+		admitted = []
+		t = threading.Thread(target=lambda: admitted.append(p.admit(PREFETCH)))
+		t.start()
+		t.join(0.1)
+		self.assertEqual(admitted, [])
+		p.release(idents[0])
+		t.join(5)
+		self.assertEqual(len(admitted), 1)
+		self.assertEqual(p.inflight[PREFETCH], 2)
+
+	def test_timeout(self):
+		p = Connection(None, None)
+		queue = Queue()
+		queue.ident = p.admit(CAPTURE)
+		self.assertEqual(p.inflight[CAPTURE], 1)
+		self.assertEqual((None, None), p.wait(queue, 0.01))
+		# the slot is free again, and a late response is dropped
+		self.assertEqual(p.inflight[CAPTURE], 0)
+		self.assertEqual(p.pending, {})
+		p.processResponse(queue.ident, 0, '')
+		self.assertTrue(queue.empty())
+		self.assertEqual(p.abandoned, set())
+
+	def test_priority(self):
+		p = Connection(None, None)
+		p.waiting[INTERACTIVE] = 1
+		self.assertFalse(p.admissible(CAPTURE))
+		self.assertFalse(p.admissible(PREFETCH))
+		self.assertTrue(p.admissible(INTERACTIVE))
+		p.waiting[INTERACTIVE] = 0
+		p.waiting[CAPTURE] = 1
+		self.assertTrue(p.admissible(INTERACTIVE))
+		self.assertFalse(p.admissible(PREFETCH))
+
+HELO_REQ = (
+	'\x00\x00\x00\x17' # Length
+	'\x00\x00\x00\x03' # Identifier
+	'\x00'             # Request
+	'\xC7\x01'         # DDM Chunk
+	'HELO\x00\x00\x00\x04\x00\x00\x00\x01'
+)
+
+THST_EVT = (
+	'\x00\x00\x00\x15' # Length
+	'\x00\x00\x00\x02' # Identifier
+	'\x00'             # Request, from the VM
+	'\xC7\x01'         # DDM Chunk
+	'THST\x00\x00\x00\x02\x01\x02'
+)
+
+HELO_RES = (
+	'\x00\x00\x00\x18' # Length
+	'\x00\x00\x00\x03' # Identifier
+	'\x80'             # Response
+	'\x00\x00'         # Success
+	'HELO\x00\x00\x00\x05vm 1!'
+)
+
+FAIL_RES = (
+	'\x00\x00\x00\x1F' # Length
+	'\x00\x00\x00\x03' # Identifier
+	'\x80'             # Response
+	'\x00\x00'         # Success
+	'FAIL\x00\x00\x00\x0C\x00\x00\x00\x02\x00\x00\x00\x02\x00n\x00o'
+)
+
+class TestDdm(TestCase):
+	def test_chunks(self):
+		data = pack_chunk('HELO', '\x00\x00\x00\x01') + pack_chunk('MPSE')
+		self.assertEqual(data[:8], 'HELO\x00\x00\x00\x04')
+		self.assertEqual(unpack_chunks(data), [('HELO', '\x00\x00\x00\x01'), ('MPSE', '')])
+		self.assertEqual(unpack_chunks(''), [])
+		self.assertRaises(ProtocolError, unpack_chunks, data[:-9])
+		self.assertEqual(unpack_fail(FAIL_RES[19:]), (2, u'no'))
+
+	def test_request(self):
+		h = PipelineHarness(self, [
+			(HANDSHAKE_MSG, HANDSHAKE_MSG),
+			(IDSZ_REQ, IDSZ_RES),
+			(HELO_REQ, THST_EVT + HELO_RES),
+		], len(HANDSHAKE_MSG + IDSZ_RES))
+		p = make_conn(h)
+		q = Queue()
+		p.subscribe('THST', q)
+		self.assertEqual(p.ddm('HELO', '\x00\x00\x00\x01', 5), [('HELO', 'vm 1!')])
+		self.assertEqual(q.get(True, 5), '\x01\x02')
+
+	def test_fail(self):
+		h = PipelineHarness(self, [
+			(HANDSHAKE_MSG, HANDSHAKE_MSG),
+			(IDSZ_REQ, IDSZ_RES),
+			(HELO_REQ, FAIL_RES),
+		], len(HANDSHAKE_MSG + IDSZ_RES))
+		p = make_conn(h)
+		try:
+			p.ddm('HELO', '\x00\x00\x00\x01', 5)
+		except DdmError as err:
+			self.assertEqual((err.code, err.msg), (2, u'no'))
+		else:
+			self.fail('FAIL chunk not raised')
+
+class TestFlow(TestCase):
+	def test_aimd(self):
+		f = Flow(4, low=1, high=6, target=0.5)
+		for i in range(4):
+			f.respond(0.1, i)
+		self.assertEqual(f.limit(), 4)
+		for i in range(4):
+			f.respond(0.1, i)
+		self.assertEqual(f.limit(), 5)
+		f.respond(1.0, 10)
+		self.assertEqual(f.limit(), 2)
+		f.respond(1.0, 10.5) # the same round trip
+		self.assertEqual(f.limit(), 2)
+		f.respond(1.0, 12)
+		f.respond(1.0, 14)
+		self.assertEqual(f.limit(), 1)
+		for i in range(100):
+			f.respond(0.1, 20)
+		self.assertEqual(f.limit(), 6)
+		self.assertEqual(f.stats()['answered'], 112)
+		self.assertEqual(f.stats()['maxLatency'], 1.0)
+
+	def test_unbounded(self):
+		f = Flow()
+		f.respond(10.0, 0)
+		self.assertEqual(f.limit(), None)
+
+	def test_stats(self):
+		p = Connection(None, None)
+		p.release(p.admit(CAPTURE))
+		p.admit(CAPTURE)
+		stats = p.stats()['capture']
+		self.assertEqual((stats['sent'], stats['answered'], stats['inflight']), (2, 1, 1))
+		p.configure(target=0.1)
+		self.assertEqual(p.flows[PREFETCH].target, 0.1)
+		self.assertEqual(p.flows[INTERACTIVE].target, 0.25)
+
 if __name__ == '__main__':
 	test_main()
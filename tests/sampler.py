@@ -0,0 +1,66 @@
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+from andbug.vm import Thread
+from andbug.sampler import Sampler, frame_name
+from unittest import TestCase, main as test_main
+from tests.fakes import FakeConn, session
+
+class FakeMethod(object):
+    def __init__(self, jni, name):
+        self.klass = FakeMethod(None, jni) if jni else None
+        self.jni = self.name = name
+
+class TestSampler(TestCase):
+    def test_frame_name(self):
+        self.assertEqual(frame_name(FakeMethod('Lcom/a/B;', 'run')), 'com.a.B.run')
+
+    def test_sample(self):
+        def reply(code, data):
+            buf = conn.buffer()
+            if code in (0x0108, 0x0109): # VM suspend, resume
+                return 0, ''
+            tid = ord(data[1])
+            if code == 0x0B01:
+                return 0, buf.pack('$', 'main;%d' % tid)
+            self.assertEqual(code, 0x0B06)
+            start, length = buf.unpack('ii', data[2:])
+            if tid == 0x22:
+                return 10, '' # INVALID_THREAD
+            if tid == 0x23: # only m1 is on the stack
+                if length == 2:
+                    return 504, '' # INVALID_LENGTH
+                return 0, buf.pack('i81tm8', 1, 3, 1, 0x10, 1, 9)
+            # the top two frames, innermost first: m2 called by m1
+            self.assertEqual((start, length), (0, 2))
+            return 0, buf.pack('i81tm881tm8', 2, 1, 1, 0x10, 2, 4, 2, 1, 0x10, 1, 9)
+        conn = FakeConn(reply)
+        sess = session(conn)
+        threads = list(sess.pool(Thread, sess, tid) for tid in (0x21, 0x22, 0x23))
+        sampler = Sampler(sess, 10, threads, depth=2)
+        sampler.names = {(0x10, 1): 'a.B.m1', (0x10, 2): 'a.B.m2'}
+        sampler.sample()
+        sampler.sample()
+        # the top frames of every thread are asked for in one batch, and
+        # the stacks shallower than that in another, between a suspend and
+        # a resume
+        self.assertEqual(conn.codes()[:4], [[0x0108], [0x0B06] * 3, [0x0B06], [0x0109]])
+        self.assertEqual(sampler.samples, 2)
+        self.assertEqual(sampler.pauses.count, 2)
+        self.assertEqual(list(sampler.lines()), [
+            'main:33;a.B.m1;a.B.m2 2\n', 'main:35;a.B.m1 2\n'
+        ])
+
+if __name__ == '__main__':
+    test_main()
@@ -0,0 +1,68 @@
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+import os, gzip, json, shutil, tempfile
+from andbug.sink import Sink
+from unittest import TestCase, main as test_main
+
+def read(path, opener=open):
+    with opener(path, 'rb') as f:
+        return list(json.loads(line) for line in f.read().splitlines())
+
+class TestSink(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_ndjson(self):
+        path = os.path.join(self.dir, 'hits.json')
+        sink = Sink(path, batch=2)
+        sink.put({'n': 1})
+        sink.put(lambda: {'n': 2}) # serialized by the sink thread
+        sink.put(lambda: 1 // 0)
+        sink.put({'n': 3})
+        sink.close()
+        self.assertEqual(read(path), [{'n': 1}, {'n': 2}, {'n': 3}])
+        self.assertEqual((sink.written, sink.failed, sink.dropped), (3, 1, 0))
+
+    def test_gzip(self):
+        path = os.path.join(self.dir, 'hits.json.gz')
+        sink = Sink(path)
+        sink.put({'n': 1})
+        sink.close()
+        self.assertEqual(read(path, gzip.open), [{'n': 1}])
+
+    def test_rotate(self):
+        path = os.path.join(self.dir, 'hits.json')
+        sink = Sink(path, rotate=20, keep=2, batch=1)
+        for n in range(5):
+            sink.put({'n': n}) # 9 bytes a line
+        sink.close()
+        self.assertEqual(read(path), [{'n': 4}])
+        self.assertEqual(read(path + '.1'), [{'n': 2}, {'n': 3}])
+        self.assertEqual(read(path + '.2'), [{'n': 0}, {'n': 1}])
+        self.assertFalse(os.path.exists(path + '.3'))
+
+    def test_truncate(self):
+        path = os.path.join(self.dir, 'hits.json')
+        for n in range(2):
+            sink = Sink(path, append=False)
+            sink.put({'n': n})
+            sink.close()
+        self.assertEqual(read(path), [{'n': 1}])
+
+if __name__ == '__main__':
+    test_main()
@@ -0,0 +1,89 @@
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+from andbug.stats import Histogram, Latency, GROWTH
+from unittest import TestCase, main as test_main
+
+class FakeMethod(str):
+    'a method of class 0x10, compared and shown by its name'
+    tid = 0x10
+    def __new__(cls, name, mid):
+        method = str.__new__(cls, name)
+        method.mid = mid
+        return method
+
+ENTER, EXIT = 1, 2 # the request ids of the entry and exit requests of 0x10
+A, B, C = 1, 2, 3  # method ids; C is not watched
+
+class TestHistogram(TestCase):
+    def test_quantiles(self):
+        h = Histogram()
+        self.assertEqual(h.quantile(0.5), None)
+        for i in range(1, 1001):
+            h.add(i / 1000.0)
+        self.assertEqual(h.count, 1000)
+        self.assertEqual(h.max, 1.0)
+        self.assertAlmostEqual(h.mean, 0.5005)
+        for q in (0.5, 0.95, 0.99):
+            self.assertTrue(q <= h.quantile(q) <= q * GROWTH + 0.001, q)
+        self.assertEqual(h.quantile(1.0), 1.0)
+        # buckets grow with the range of the values, not their number
+        self.assertTrue(len(h.buckets) < 90)
+
+    def test_zero(self):
+        h = Histogram()
+        h.add(0)
+        h.add(0.5)
+        self.assertEqual(h.quantile(0.5), 0.0)
+        self.assertEqual(h.quantile(0.99), 0.5)
+
+class TestLatency(TestCase):
+    def latency(self):
+        lat = Latency()
+        lat.watch((FakeMethod('a', A), FakeMethod('b', B)))
+        lat.add(ENTER, None, 40)
+        lat.add(EXIT, None, 41)
+        return lat
+
+    def test_pairs(self):
+        lat = self.latency()
+        # a calls itself, then b, on thread 7, while thread 8 calls b
+        for rid, tid, mid, now in ((ENTER, 7, A, 0.0), (ENTER, 8, B, 0.5),
+                                   (ENTER, 7, A, 1.0), (ENTER, 7, C, 1.2),
+                                   (ENTER, 7, B, 1.5), (EXIT, 7, B, 1.75),
+                                   (EXIT, 7, C, 1.8), (EXIT, 7, A, 2.0),
+                                   (EXIT, 8, B, 2.5), (EXIT, 7, A, 4.0)):
+            lat.hit(rid, tid, 0x10, mid, now)
+        hists = lat.histograms
+        self.assertEqual(hists['a'].count, 2)
+        self.assertEqual(hists['a'].max, 4.0)
+        self.assertEqual(hists['b'].count, 2)
+        self.assertEqual(hists['b'].max, 2.0)
+        self.assertEqual(lat.stacks, {7: [], 8: []})
+        self.assertEqual(lat.unmatched, 0)
+        self.assertEqual(list(row[0] for row in lat.rows()), ['a', 'b'])
+
+    def test_unmatched(self):
+        lat = self.latency()
+        lat.hit(EXIT, 7, 0x10, A, 0.0) # an exit of a call entered before hooking
+        lat.hit(ENTER, 7, 0x10, A, 1.0)
+        lat.hit(ENTER, 7, 0x10, B, 1.5) # b throws, and never exits
+        lat.hit(EXIT, 7, 0x10, A, 2.0)
+        self.assertEqual(lat.unmatched, 2)
+        self.assertEqual(lat.histograms['a'].max, 1.0)
+        self.assertFalse('b' in lat.histograms)
+        self.assertEqual(lat.stacks[7], [])
+
+if __name__ == '__main__':
+    test_main()
@@ -0,0 +1,373 @@
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+import andbug.data, andbug.index, andbug.counting, andbug.stats
+from andbug.vm import ClassTable, Class, Thread, FrameSequence, RequestError
+from andbug.vm import Method, Location, Slot, String, Object, Array
+from unittest import TestCase, main as test_main
+from tests.fakes import FakeConn, session
+
+class TestClassTable(TestCase):
+    def test_materialize(self):
+        sess = session()
+        table = ClassTable(sess)
+        table.append(1, 0x1234, 'La/B;', '', 1)
+        table.append(1, 0x5678, 'La/C;', 'La/C<TT;>;', 9)
+        self.assertEqual(len(table), 2)
+        self.assertEqual(list(table.rows()), [('La/B;', 0), ('La/C;', 1)])
+
+        c = table[1]
+        self.assertTrue(isinstance(c, Class))
+        self.assertEqual(c.tid, 0x5678)
+        self.assertEqual(c.jni, 'La/C;')
+        self.assertEqual(c.gen, 'La/C<TT;>;')
+        self.assertEqual(c.flags, 9)
+        self.assertTrue(table[1] is c)
+        self.assertEqual(list(x.jni for x in table), ['La/B;', 'La/C;'])
+
+class TestMethods(TestCase):
+    def test_by_name_and_jni(self):
+        sess = session()
+        c = sess.pool(Class, sess, 0x10)
+        c.jni = 'La/B;'
+        run, runInt, stop = list(sess.pool(Method, sess, 0x10, mid) for mid in (1, 2, 3))
+        for m, name, jni in ((run, 'run', '()V'), (runInt, 'run', '(I)V'), (stop, 'stop', '()V')):
+            m.name, m.jni = name, jni
+        c.methodList = andbug.data.view((run, runInt, stop))
+        c.methodByName = andbug.data.multidict()
+        c.methodByJni = andbug.data.multidict()
+        for m in c.methodList:
+            c.methodByName[m.name] = m
+            c.methodByJni[m.jni] = m
+        self.assertEqual(list(c.methods('run', '(I)V')), [runInt])
+        self.assertEqual(list(c.methods('run')), [run, runInt])
+        self.assertEqual(list(c.methods(jni='()V')), [run, stop])
+
+class TestSuspension(TestCase):
+    def test_memo(self):
+        sess = session()
+        t = Thread(sess, 1)
+        calls = []
+        def load():
+            calls.append(1)
+            return len(calls)
+        self.assertEqual(t.memo('frames', load), 1)
+        self.assertEqual(t.memo('frames', load), 1)
+        self.assertEqual(t.cached('frames'), 1)
+
+        t.invalidate()
+        self.assertEqual(t.cached('frames'), None)
+        self.assertEqual(t.memo('frames', load), 2)
+
+        sess.vmEpoch += 1
+        self.assertEqual(t.memo('frames', load), 3)
+
+        t.forget('frames')
+        self.assertEqual(t.memo('frames', load), 4)
+
+    def test_threads_are_independent(self):
+        sess = session()
+        a, b = Thread(sess, 1), Thread(sess, 2)
+        a.memo('frames', lambda: 'a')
+        b.memo('frames', lambda: 'b')
+        epoch = sess.epoch
+        a.invalidate()
+        self.assertTrue(sess.epoch > epoch)
+        self.assertEqual(a.cached('frames'), None)
+        self.assertEqual(b.cached('frames'), 'b')
+
+class FakeThread(object):
+    'a thread whose stack is a list of numbers, counting the requests made'
+    def __init__(self, depth):
+        self.stack = list(range(depth))
+        self.requests = []
+
+    @property
+    def frameCount(self):
+        self.requests.append('count')
+        return len(self.stack)
+
+    def getFrames(self, start, length):
+        self.requests.append((start, length))
+        if start + length > len(self.stack):
+            raise RequestError(504)
+        return self.stack[start:start + length]
+
+class TestFrameSequence(TestCase):
+    def test_top_frames(self):
+        t = FakeThread(100)
+        seq = FrameSequence(t, 8)
+        self.assertEqual(seq[0], 0)
+        self.assertEqual(list(seq[0:10]), list(range(10)))
+        self.assertEqual(t.requests, [(0, 8), (8, 8)])
+
+    def test_iterate(self):
+        t = FakeThread(20)
+        seq = FrameSequence(t, 8)
+        self.assertEqual(list(seq), list(range(20)))
+        self.assertEqual(t.requests, ['count', (0, 8), (8, 8), (16, 4)])
+        self.assertEqual(len(seq), 20)
+        self.assertEqual(seq[-1], 19)
+        self.assertEqual(len(t.requests), 4)
+
+    def test_shallow(self):
+        t = FakeThread(3)
+        seq = FrameSequence(t, 8)
+        self.assertEqual(list(seq[0:10]), [0, 1, 2])
+        self.assertRaises(IndexError, lambda: seq[3])
+        self.assertEqual(repr(seq), '(0, 1, 2)')
+
+class TestLiveSlots(TestCase):
+    def make_method(self, sess):
+        method = sess.pool(Method, sess, 1, 2)
+        def slot(index, name, first, length):
+            s = sess.pool(Slot, sess, 1, 2, index)
+            s.name, s.jni, s.gen = name, 'I', ''
+            s.firstLoc, s.locLength = first, length
+            return s
+        method.setSlots([
+            slot(0, 'this', 0, 20), slot(1, 'i', 4, 6), slot(2, 'i', 12, 8)
+        ])
+        return method
+
+    def test_slots(self):
+        sess = session()
+        method = self.make_method(sess)
+        loc = Location(sess, 1, 2, 5)
+        self.assertEqual(list(s.name for s in loc.slots), ['this', 'i'])
+        self.assertEqual(loc.slot('i')[1].index, 1)
+        self.assertEqual(loc.slot('j'), None)
+
+        loc = Location(sess, 1, 2, 15)
+        self.assertEqual(loc.slot('i'), (1, method.slots[2]))
+        self.assertEqual(Location(sess, 1, 2, 21).slot('this'), None)
+
+class TestStrings(TestCase):
+    def test_resolve(self):
+        def reply(code, data):
+            self.assertEqual(code, 0x0A01)
+            return conn.buffer().pack('$', 'str%d' % ord(data[-1]))
+        conn = FakeConn(reply)
+        sess = session(conn)
+        a = sess.pool(String, sess, 1)
+        b = sess.pool(String, sess, 2)
+        self.assertEqual(sess.resolveStrings({'a': a, 'b': b, 'n': 3}), 2)
+        self.assertEqual(len(conn.batches), 1)
+        self.assertEqual(str(a), 'str1')
+        self.assertEqual(str(b), 'str2')
+        self.assertEqual(sess.resolveStrings([a, b]), 0)
+        self.assertEqual(len(conn.batches), 1)
+
+class TestTypes(TestCase):
+    def test_resolve(self):
+        def reply(code, data):
+            buf = conn.buffer()
+            if code == 0x0901: # objects 1 and 2 are Lb/A;, 3 is Lb/B;
+                oid = ord(data[-1])
+                return buf.pack('1t', 1, 0x10 if oid < 3 else 0x20)
+            if code == 0x020D:
+                return buf.pack('$$', 'Lb/B;', '')
+            self.assertEqual(code, 0x020E)
+            return buf.pack('4f$$$i', 1, 7, 'x', 'I', '', 0)
+        conn = FakeConn(reply)
+        sess = session(conn)
+        table = ClassTable(sess)
+        table.append(1, 0x10, 'Lb/A;', '', 0)
+        table.append(1, 0x30, 'Ljava/lang/String;', '', 0)
+        sess.classTable = table
+        sess.classIndex = andbug.index.ClassIndex(table.rows())
+
+        objs = list(sess.pool(Object, sess, oid) for oid in (1, 2, 3))
+        s = sess.pool(String, sess, 4)
+        sess.resolveTypes(objs + [s, 5])
+        self.assertEqual(list(len(b) for b in conn.batches), [3, 5])
+        self.assertEqual(objs[2].jni, 'Lb/B;')
+        self.assertTrue(objs[0].refType is objs[1].refType)
+        self.assertTrue(objs[0].refType is table[0])
+        self.assertEqual(objs[2].refType.tid, 0x20)
+        self.assertEqual(s.jni, 'Ljava/lang/String;')
+        self.assertEqual(objs[1].refType.fieldByName['x'][1].fid, 7)
+
+        sess.resolveTypes(objs)
+        self.assertEqual(len(conn.batches), 2)
+
+class TestArray(TestCase):
+    def test_iterate(self):
+        def reply(code, data):
+            buf = conn.buffer()
+            if code == 0x0D01:
+                return buf.pack('4', 10)
+            first, count = buf.unpack('44', data[2:])
+            return buf.pack('14' + '4' * count, ord('I'), count, *range(first, first + count))
+        conn = FakeConn(reply)
+        sess = session(conn)
+        arr = sess.pool(Array, sess, 1)
+        it = arr.iterSlices(4)
+        self.assertEqual(it.next(), 0)
+        # the length, the first window, and the prefetch of the second
+        self.assertEqual(len(conn.batches), 3)
+        self.assertEqual(list(it), list(range(1, 10)))
+        self.assertEqual(len(conn.batches), 4)
+        self.assertEqual(len(arr), 10)
+        self.assertEqual(arr[9], 9)
+        self.assertEqual(arr[-1], 9)
+        self.assertEqual(len(conn.batches), 6)
+
+class TestHooks(TestCase):
+    def test_hook_many(self):
+        eids = iter(range(7, 10))
+        def reply(code, data):
+            self.assertEqual(code, 0x0F01)
+            return conn.buffer().pack('4', eids.next())
+        conn = FakeConn(reply)
+        sess = session(conn)
+        sess.orphans = {8: [('thread', 'loc')]}
+        table = ClassTable(sess)
+        table.append(1, 0x10, 'La/B;', '', 0)
+        table[0]
+        locs = list(sess.pool(Location, sess, 0x10, mid, 0) for mid in (1, 2))
+        hits = []
+        hooks = sess.hookMany(((locs[0], 40), (locs[0], 41), (locs[1], 40)), hits.append)
+        self.assertEqual(len(conn.batches), 1)
+        self.assertEqual(list(h.ident for h in hooks), [7, 8, 9])
+        self.assertTrue(hooks[2].origin is locs[1])
+        self.assertTrue(sess.emap[9] is hooks[2])
+        # an event that fired before its request was answered is delivered
+        self.assertEqual(hits, [('thread', 'loc')])
+        self.assertEqual(sess.orphans, {})
+        self.assertEqual(sess.setting, set())
+
+class TestCounting(TestCase):
+    def session(self):
+        eids = iter(range(7, 10))
+        def reply(code, data):
+            if code == 0x0F01:
+                return conn.buffer().pack('4', eids.next())
+            return ''
+        conn = FakeConn(reply)
+        sess = session(conn)
+        table = ClassTable(sess)
+        table.append(1, 0x10, 'La/B;', '', 0)
+        table[0]
+        return sess
+
+    def event(self, sess, *events):
+        buf = sess.conn.buffer()
+        data = buf.pack('1i', 0, len(events))
+        for rid, tid in events:
+            data += buf.pack('1io1tm8', 40, rid, tid, 1, 0x10, 1, 0)
+        buf.prepareUnpack(data)
+        return buf
+
+    def test_count_many(self):
+        sess = self.session()
+        locs = list(sess.pool(Location, sess, 0x10, mid, 0) for mid in (1, 2))
+        sess.orphans = {8: [(sess.pool(Thread, sess, 0x33), locs[1])]}
+        sess.setting.add(99) # another request, being set
+        counter = andbug.counting.HitCounter()
+        rids = sess.countMany(((locs[0], 40), (locs[1], 40)), counter)
+        self.assertEqual(rids, [7, 8])
+        # nothing is suspended by a counting request
+        for code, data in sess.conn.batches[0]:
+            self.assertEqual(ord(data[1]), 0)
+        self.assertEqual(counter.origins, {7: (locs[0], 40), 8: (locs[1], 40)})
+
+        sess.processEvent(0, self.event(
+            sess, (7, 0x21), (7, 0x21), (8, 0x21), (99, 0x21), (100, 0x21)
+        ))
+        hits = {}
+        for (rid, tid, idx), ct in counter.snapshot(True).items():
+            hits[rid, tid] = hits.get((rid, tid), 0) + ct
+        self.assertEqual(hits, {(7, 0x21): 2, (8, 0x21): 1, (8, 0x33): 1})
+        self.assertEqual(counter.total, 4)
+        self.assertEqual(counter.snapshot(), {})
+        # events of other requests being set still reach their hooks, and
+        # those of requests not known at all are dropped
+        self.assertEqual(list(sess.orphans), [99])
+        self.assertEqual(sess.orphans[99][0][0].tid, 0x21)
+        self.assertEqual(sess.setting, set([99]))
+
+        sess.uncount(counter)
+        self.assertEqual(list(code for code, data in sess.conn.batches[-1]), [0x0F02] * 2)
+        self.assertEqual(sess.counters, {})
+
+    def test_stop(self):
+        sess = self.session()
+        loc = sess.pool(Location, sess, 0x10, 1, 0)
+        counter = andbug.counting.HitCounter()
+        sess.countMany(((loc, 40),), counter)
+        reports = []
+        reporter = andbug.counting.start(sess, counter, reports.append, 3600)
+        sess.processEvent(0, self.event(sess, (7, 0x21), (7, 0x21)))
+
+        # as when the shell, or monitor, reads the end of its input
+        andbug.counting.stop_all()
+        self.assertEqual(andbug.counting.RUNNING, [])
+        self.assertEqual(list(code for code, data in sess.conn.batches[-1]), [0x0F02])
+        self.assertEqual(sess.counters, {})
+        self.assertFalse(reporter.is_alive())
+        # the hits since the last report are reported as it stops
+        self.assertEqual(sum(sum(r.values()) for r in reports), 2)
+
+    def test_failed_registration(self):
+        sess = self.session()
+        locs = list(sess.pool(Location, sess, 0x10, mid, 0) for mid in (1, 2))
+        t = sess.pool(Thread, sess, 0x21)
+        class Broken(andbug.counting.HitCounter):
+            def add(self, rid, loc, kind):
+                # request 8 fires, suspending its thread, while 7 fails
+                sess.dispatch((8, t, loc), 1)
+                raise ValueError(rid)
+        self.assertRaises(ValueError, sess.countMany, ((locs[0], 40), (locs[1], 40)), Broken())
+        # neither request is taken: the event is dropped, its thread resumed
+        self.assertEqual(sess.setting, set())
+        self.assertEqual(sess.orphans, {})
+        self.assertEqual(sess.holds, {})
+        self.assertEqual(sess.conn.codes()[-1], [0x0B03])
+
+    def test_latency(self):
+        sess = self.session()
+        cls = sess.pool(Class, sess, 0x10)
+        methods = list(sess.pool(Method, sess, 0x10, mid) for mid in (1, 2))
+        lat = andbug.stats.Latency()
+        lat.watch(methods[:1])
+        rids = sess.countMany(((cls, 40), (cls, 41)), lat)
+        self.assertEqual(rids, [7, 8])
+        # entries and exits are requested for the class, ClassOnly (4)
+        for code, data in sess.conn.batches[0]:
+            self.assertEqual(data[1:7], '\x00\x00\x00\x00\x01\x04')
+
+        def event(*events):
+            buf = sess.conn.buffer()
+            data = buf.pack('1i', 0, len(events))
+            for kind, rid, mid, loc in events:
+                data += buf.pack('1io1tm8', kind, rid, 0x21, 1, 0x10, mid, loc)
+            buf.prepareUnpack(data)
+            return buf
+        # the exit is reported at the returning instruction, not at 0
+        sess.processEvent(0, event((40, 7, 1, 0), (40, 7, 2, 0)))
+        sess.processEvent(0, event((41, 8, 2, 6), (41, 8, 1, 12)))
+        self.assertEqual(lat.histograms[methods[0]].count, 1)
+        self.assertFalse(methods[1] in lat.histograms)
+        self.assertEqual(lat.unmatched, 0)
+
+    def test_rows(self):
+        loc = 'La/B;.m()V'
+        counter = andbug.counting.HitCounter(60)
+        counter.add(7, loc, 41)
+        rows = list(counter.rows({(7, 0x21, 2): 5, (7, 0x20, 3): 1}))
+        self.assertEqual(rows, [(loc, 41, 0x20, 180, 1), (loc, 41, 0x21, 120, 5)])
+
+if __name__ == '__main__':
+    test_main()
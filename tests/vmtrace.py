@@ -0,0 +1,91 @@
+## Copyright 2011, IOActive, Inc. All rights reserved.
+##
+## AndBug is free software: you can redistribute it and/or modify it under 
+## the terms of version 3 of the GNU Lesser General Public License as 
+## published by the Free Software Foundation.
+##
+## AndBug is distributed in the hope that it will be useful, but WITHOUT ANY
+## WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS 
+## FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for 
+## more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with AndBug.  If not, see <http://www.gnu.org/licenses/>.
+
+import struct
+from cStringIO import StringIO
+import andbug.vmtrace
+from andbug.vmtrace import Profile, read_header, read_records, MAGIC, ENTER, EXIT, UNROLL
+from unittest import TestCase, main as test_main
+from tests.fakes import FakeConn
+
+HEADER = (
+    '*version\n3\ndata-file-overflow=false\nclock=dual\nvm=dalvik\n'
+    '*threads\n1\tmain\n2\tworker\n'
+    '*methods\n0x1000\tLa/B;\tm1\t()V\tB.java\t1\n0x2000\tLa/B;\tm2\t(I)V\tB.java\t2\n'
+    '*end\n'
+)
+
+def trace(records):
+    data = struct.pack('<IHHQH', MAGIC, 3, 32, 1234, 14) + '\0' * 14
+    for thread, mid, action, time in records:
+        data += struct.pack('<HIII', thread, mid | action, time * 2, time)
+    return HEADER + data
+
+RECORDS = (
+    (1, 0x1000, ENTER, 0),
+    (1, 0x2000, ENTER, 10),
+    (1, 0x2000, EXIT, 30),
+    (1, 0x2000, ENTER, 40),
+    (1, 0x1000, ENTER, 50), # m1 recurses
+    (1, 0x1000, EXIT, 60),
+    (1, 0x2000, EXIT, 70),
+    (2, 0x2000, EXIT, 75),  # entered before tracing started
+    (1, 0x1000, EXIT, 100),
+)
+
+class TestVmtrace(TestCase):
+    def test_header(self):
+        f = StringIO(trace(()))
+        options, threads, methods = read_header(f)
+        self.assertEqual(options['version'], '3')
+        self.assertEqual(options['clock'], 'dual')
+        self.assertEqual(threads, {1: 'main', 2: 'worker'})
+        self.assertEqual(methods, {0x1000: 'La/B;.m1()V', 0x2000: 'La/B;.m2(I)V'})
+        self.assertEqual(list(read_records(f)), [])
+
+    def test_records(self):
+        block = andbug.vmtrace.BLOCK
+        andbug.vmtrace.BLOCK = 20 # records straddle the blocks read
+        try:
+            f = StringIO(trace(RECORDS))
+            read_header(f)
+            self.assertEqual(list(read_records(f)), list(RECORDS))
+        finally:
+            andbug.vmtrace.BLOCK = block
+
+    def test_profile(self):
+        profile = Profile()
+        options, threads, methods = profile.read(StringIO(trace(RECORDS)))
+        self.assertEqual(profile.calls, {0x1000: 2, 0x2000: 2})
+        self.assertEqual(profile.inclusive, {0x1000: 100, 0x2000: 50})
+        self.assertEqual(profile.exclusive, {0x1000: 60, 0x2000: 40})
+        rows = profile.rows({0x1000: 'm1'}, lambda mid: 'resolved')
+        self.assertEqual(rows, [('m1', 2, 100, 60), ('resolved', 2, 50, 40)])
+
+    def test_unroll(self):
+        profile = Profile()
+        for record in ((2, 0x1000, ENTER, 0), (2, 0x2000, ENTER, 5), (2, 0x1000, UNROLL, 15)):
+            profile.add(*record)
+        self.assertEqual(profile.exclusive, {0x1000: 5, 0x2000: 10})
+        self.assertEqual(profile.stacks[2], [])
+
+    def test_stop(self):
+        conn = FakeConn(trace='trace')
+        andbug.vmtrace.start(conn, 1024)
+        self.assertEqual(andbug.vmtrace.stop(conn, 1), 'trace')
+        self.assertEqual(conn.sent, [('MPSS', struct.pack('>II', 1024, 0)), ('MPSE', '')])
+        self.assertEqual(conn.queues, [])
+
+if __name__ == '__main__':
+    test_main()